@@ -0,0 +1,123 @@
+"""
+CPU benchmark of the compiled model forward (see trainer.compile_model) against eager one: evaluation pass over
+the chunked dataset without gradient (loss function and quality criterion evaluations) and training pass with
+backward (SGD epoch). Dataset consists of chunks of the synthetic signal, the last batch is shorter, as in
+utils.ResampleDataset. Compilation time, number of compiled graphs (recompilations for the last batch are avoided
+by padding) and output difference are reported. Results are appended to the JSON lines file, one record per case,
+together with the environment description.
+
+Usage:
+    python compile_training.py --models ParallelCheby2D CVCNN --backends inductor --output compile_training.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import List
+
+import torch
+import torch._dynamo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trainer import compile_model, uncompile_model
+from utils import ResampleDataset
+from oracle_derivatives import build_model, measure, environment
+
+PASSES = ['evaluation', 'training']
+
+def build_dataset(model: torch.nn.Module, dtype: torch.dtype, chunk_size: int, chunk_num: int, batch_size: int) -> list:
+    """
+    Returns batches of chunks of the synthetic signal. The last batch is shorter, if batch_size doesn`t divide chunk_num.
+    """
+    # Input consists of the signal and PA output power channels, as in utils.dynamic_dataset_prepare
+    x = torch.cat([0.5 * torch.randn(chunk_num, 1, chunk_size, dtype=dtype), 0.5 * torch.ones(chunk_num, 1, chunk_size, dtype=dtype)],
+                  dim=1)
+    with torch.no_grad():
+        d = 0.1 * torch.randn_like(model(x[:1]))
+    d = d.expand(chunk_num, *d.shape[1:])
+    dataset = ResampleDataset((x, d), batch_size=batch_size)
+    return [dataset[j] for j in range(len(dataset))]
+
+def run_case(model_name: str, size: int, dtype: torch.dtype, chunk_size: int, chunk_num: int, batch_size: int, backend: str,
+             passes: List[str], repeat: int, warmup: int, seed: int) -> List[dict]:
+    """
+    Benchmarks eager and compiled passes over the dataset. Returns list of records: one record per pass.
+    """
+    torch.manual_seed(seed)
+    model = build_model(model_name, size, dtype)
+    batches = build_dataset(model, dtype, chunk_size, chunk_num, batch_size)
+
+    def loss(batch):
+        return (model(batch[0]) - batch[1]).abs().square().sum()
+
+    def evaluation():
+        with torch.no_grad():
+            return sum(loss(batch).item() for batch in batches)
+
+    def training():
+        model.zero_grad()
+        for batch in batches:
+            loss(batch).backward()
+
+    calls = {'evaluation': evaluation, 'training': training}
+    records = []
+    for name in passes:
+        record = {'model': model_name, 'size': size, 'dtype': str(dtype).replace('torch.', ''), 'chunk_size': chunk_size,
+                  'chunk_num': chunk_num, 'batch_size': batch_size, 'backend': backend, 'pass': name}
+        try:
+            eager = measure(calls[name], repeat, warmup)
+            reference = evaluation()
+            torch._dynamo.reset()
+            compile_model(model, {'compile_backend': backend})
+            graphs = torch._dynamo.utils.counters['stats']['unique_graphs']
+            start = time.perf_counter()
+            calls[name]()
+            record['compile_time'] = time.perf_counter() - start
+            compiled = measure(calls[name], repeat, warmup)
+            record['graphs'] = torch._dynamo.utils.counters['stats']['unique_graphs'] - graphs
+            record['loss_relative_error'] = abs(evaluation() - reference) / abs(reference)
+            uncompile_model(model)
+            record.update({'eager_time_median': eager['time_median'], 'compiled_time_median': compiled['time_median'],
+                           'speedup': eager['time_median'] / compiled['time_median']})
+        except Exception as e:
+            uncompile_model(model)
+            record['error'] = repr(e)
+        records.append(record)
+        print(json.dumps(record))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU benchmark of the compiled model forward in training and evaluation.")
+    parser.add_argument('--models', nargs='+', default=['ParallelCheby2D', 'CVCNN', 'RVCNN', 'EncoderBasedNL'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4],
+                        help="Model sizes: polynomial order, hidden channels or embedding size, see build_model.")
+    parser.add_argument('--dtypes', nargs='+', default=['complex128'])
+    parser.add_argument('--backends', nargs='+', default=['inductor'])
+    parser.add_argument('--passes', nargs='+', default=PASSES, choices=PASSES)
+    parser.add_argument('--chunk-size', type=int, default=512)
+    parser.add_argument('--chunk-num', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=1, help="Number of torch CPU threads.")
+    parser.add_argument('--seed', type=int, default=964)
+    parser.add_argument('--output', default='compile_training.jsonl', help="JSON lines file to append results to.")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    env = environment()
+    with open(args.output, 'a') as f:
+        for model_name in args.models:
+            for size in args.sizes:
+                for dtype in args.dtypes:
+                    for backend in args.backends:
+                        records = run_case(model_name, size, getattr(torch, dtype), args.chunk_size, args.chunk_num,
+                                           args.batch_size, backend, args.passes, args.repeat, args.warmup, args.seed)
+                        for record in records:
+                            f.write(json.dumps({**env, **record}) + '\n')
+                        f.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+CPU benchmark of the exported models (see model.export_model): inference throughput of eager model and models
+exported by torch.export and TorchScript tracing, and start time of the inference host (artifact loading and the first call).
+Outputs of the exported models are compared with eager ones. Results are appended to the JSON lines file,
+one record per case, together with the environment description.
+
+Usage:
+    python export_inference.py --models ParallelCheby2D CVCNN --lengths 1024 16384 --output export_inference.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import List
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from model import export_model, load_exported
+from oracle_derivatives import build_model, measure, environment
+
+MODES = ['eager', 'export', 'trace']
+
+def run_case(model_name: str, size: int, dtype: torch.dtype, length: int, modes: List[str], repeat: int, warmup: int,
+             seed: int) -> List[dict]:
+    """
+    Benchmarks forward pass of the model and its exported versions on synthetic signal of the given length.
+    Returns list of records: one record per mode.
+    """
+    torch.manual_seed(seed)
+    model = build_model(model_name, size, dtype).eval()
+    # Input consists of the signal and PA output power channels, as in utils.dynamic_dataset_prepare
+    x = torch.cat([0.5 * torch.randn(1, 1, length, dtype=dtype), 0.5 * torch.ones(1, 1, length, dtype=dtype)], dim=1)
+    with torch.no_grad():
+        reference = model(x)
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in modes:
+            record = {'model': model_name, 'size': size, 'dtype': str(dtype).replace('torch.', ''), 'length': length, 'mode': mode}
+            try:
+                if mode == 'eager':
+                    forward = model
+                else:
+                    path = os.path.join(directory, model_name + ('.pt2' if mode == 'export' else '.ts'))
+                    start = time.perf_counter()
+                    export_model(model, x, path, mode)
+                    record['export_time'] = time.perf_counter() - start
+                    record['artifact_size'] = os.path.getsize(path)
+                    start = time.perf_counter()
+                    forward = load_exported(path)
+                    with torch.no_grad():
+                        output = forward(x)
+                    record['start_time'] = time.perf_counter() - start
+                    record['max_abs_error'] = (output - reference).abs().max().item()
+                with torch.no_grad():
+                    record.update(measure(lambda: forward(x), repeat, warmup))
+                record['throughput'] = length / record['time_median']
+            except Exception as e:
+                record['error'] = repr(e)
+            records.append(record)
+            print(json.dumps(record))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU benchmark of eager and exported models inference.")
+    parser.add_argument('--models', nargs='+', default=['ParallelCheby2D', 'CVCNN', 'RVCNN', 'EncoderBasedNL'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4, 8],
+                        help="Model sizes: polynomial order, hidden channels or embedding size, see build_model.")
+    parser.add_argument('--dtypes', nargs='+', default=['complex128'])
+    parser.add_argument('--lengths', nargs='+', type=int, default=[1024, 16384])
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=1, help="Number of torch CPU threads.")
+    parser.add_argument('--seed', type=int, default=964)
+    parser.add_argument('--output', default='export_inference.jsonl', help="JSON lines file to append results to.")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    env = environment()
+    with open(args.output, 'a') as f:
+        for model_name in args.models:
+            for size in args.sizes:
+                for dtype in args.dtypes:
+                    for length in args.lengths:
+                        records = run_case(model_name, size, getattr(torch, dtype), length, args.modes, args.repeat,
+                                           args.warmup, args.seed)
+                        for record in records:
+                            f.write(json.dumps({**env, **record}) + '\n')
+                        f.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Validation report of the mixed precision training (see 'mixed_precision' key of trainer.algorithms.train_mixed_newton_levenb_marq):
+the same model is trained by Mixed Newton on synthetic PA-like signal in three modes from the same initial parameters:
+    'complex128' -- model, jacobian, hessian and solve in double precision (reference);
+    'complex64' -- everything in single precision;
+    'mixed' -- model forward and jacobian chunks in single precision, hessian, gradient and solve in double precision.
+Final NMSE on train and test signals, its difference from the reference, training time and peak memory of the jacobian
+and hessian accumulation of one batch of chunks are reported. Each mode runs in a fresh spawned process, so that
+resident set size measurements don`t depend on the order of modes. Results are appended to the JSON lines file, one record per case,
+together with the environment description.
+
+Usage:
+    python mixed_precision.py --models ParallelCheby2D CVCNN --epochs 20 --output mixed_precision.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from typing import List
+
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oracle import Oracle
+from trainer import train
+from utils import ResampleDataset
+from oracle_derivatives import build_model, measure, environment
+
+MODES = {'complex128': (torch.complex128, False), 'complex64': (torch.complex64, False), 'mixed': (torch.complex64, True)}
+
+def pa_signal(length: int, seed: int) -> tuple:
+    """
+    Returns input (signal and PA output power channels, as in utils.dynamic_dataset_prepare) and target of the synthetic PA:
+    memory polynomial with odd nonlinearities up to the 5th order and memory depth 3.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    x = 0.5 * torch.randn(1, 1, length, dtype=torch.complex128, generator=generator)
+    d = torch.zeros_like(x)
+    for delay, (a1, a3, a5) in enumerate([(1., -0.1 + 0.05j, 0.01), (0.1j, 0.02, 0.), (-0.05, 0.01j, 0.)]):
+        x_delay = torch.roll(x, delay, dims=-1)
+        d += a1 * x_delay + a3 * x_delay * x_delay.abs() ** 2 + a5 * x_delay * x_delay.abs() ** 4
+    power = torch.full_like(x, 0.5)
+    return torch.cat([x, power], dim=1), d
+
+def dataloader(x: torch.Tensor, d: torch.Tensor, chunk_size: int, shrink: int, batch_size: int):
+    """
+    Returns dataloader of chunks of the signal. Input chunks are extended by shrink samples for models with 'valid'
+    convolutions, as in utils.dynamic_dataset_prepare.
+    """
+    x = F.pad(x, (shrink // 2, shrink - shrink // 2))
+    x = x.unfold(2, chunk_size + shrink, chunk_size)[0].permute(1, 0, 2)
+    d = d.unfold(2, chunk_size, chunk_size)[0].permute(1, 0, 2)
+    return torch.utils.data.DataLoader(ResampleDataset((x, d), batch_size=batch_size), batch_size=None)
+
+def batch_to_tensors(batch):
+    return batch[0], batch[1]
+
+def loss(model, batch):
+    x, d = batch_to_tensors(batch)
+    return (model(x) - d).abs().square().sum()
+
+@torch.no_grad()
+def nmse(model, dataset) -> float:
+    error, power = 0., 0.
+    for batch in dataset:
+        error += loss(model, batch).item()
+        power += batch[1].abs().square().sum().item()
+    return 10 * torch.log10(torch.tensor(error / power)).item()
+
+def run_mode(model_name: str, size: int, length: int, chunk_size: int, batch_size: int, epochs: int, mode: str, seed: int,
+             threads: int) -> dict:
+    """
+    Trains the model in the given mode. Called in a fresh process, so that resident set size measurements don`t depend on
+    the previous modes. Returns the record of the mode.
+    """
+    torch.set_num_threads(threads)
+    dtype, mixed_precision = MODES[mode]
+    record = {'model': model_name, 'size': size, 'length': length, 'chunk_size': chunk_size, 'batch_size': batch_size,
+              'epochs': epochs, 'mode': mode}
+    try:
+        # The same initial parameters in all modes
+        torch.manual_seed(seed)
+        weights = build_model(model_name, size, torch.complex128).state_dict()
+        model = build_model(model_name, size, dtype)
+        model.load_state_dict(weights)
+        x, d = pa_signal(2 * length, seed)
+        x, d = x.to(dtype), d.to(dtype)
+        with torch.no_grad():
+            shrink = length - model(x[..., :length]).shape[-1]
+        train_dataset = dataloader(x[..., :length], d[..., :length], chunk_size, shrink, batch_size)
+        test_dataset = dataloader(x[..., length:], d[..., length:], length, shrink, 1)
+        validate_dataset = dataloader(x[..., :length], d[..., :length], length, shrink, 1)
+        config_train = {'epochs': epochs, 'mixed_precision': mixed_precision, 'async_writer': False}
+
+        # Peak memory of hessian and gradient accumulation on one batch of chunks. Libraries are initialized by the call
+        # on the short prefix of one chunk, which doesn`t leave memory for reuse by the measured call
+        oracle = Oracle(model, loss)
+        accumulate_dtype = torch.complex128 if mixed_precision else None
+        batch = next(iter(train_dataset))
+        oracle.direction_through_jacobian((batch[0][:1, :, :shrink + 16], batch[1][:1, :, :16]), batch_to_tensors,
+                                          accumulate_dtype=accumulate_dtype)
+        direction = lambda: oracle.direction_through_jacobian(batch, batch_to_tensors, accumulate_dtype=accumulate_dtype)
+        record['gram_peak_memory'] = measure(direction, repeat=1, warmup=1)['peak_memory']
+        hess, grad = direction()
+        record['hessian_dtype'] = str(hess.dtype).replace('torch.', '')
+        record['hessian_bytes'] = hess.numel() * hess.element_size()
+        del hess, grad
+
+        with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            train(model, train_dataset, loss, nmse, config_train, batch_to_tensors, validate_dataset, test_dataset,
+                  train_type='mnm_lev_marq', save_path=directory, chunk_num=len(train_dataset), save_every=epochs)
+            record['train_time'] = time.perf_counter() - start
+        record['nmse_train'] = nmse(model, validate_dataset)
+        record['nmse_test'] = nmse(model, test_dataset)
+    except Exception as e:
+        record['error'] = repr(e)
+    return record
+
+def run_case(model_name: str, size: int, length: int, chunk_size: int, batch_size: int, epochs: int, modes: List[str],
+             seed: int, threads: int) -> List[dict]:
+    """
+    Trains the model in all modes from the same initial parameters, each mode in a separate spawned process.
+    Returns list of records: one record per mode.
+    """
+    context = multiprocessing.get_context('spawn')
+    records, reference = [], None
+    for mode in modes:
+        with context.Pool(1) as pool:
+            record = pool.apply(run_mode, (model_name, size, length, chunk_size, batch_size, epochs, mode, seed, threads))
+        if mode == 'complex128' and 'error' not in record:
+            reference = record
+        if reference is not None and 'error' not in record:
+            record['nmse_train_diff'] = record['nmse_train'] - reference['nmse_train']
+            record['nmse_test_diff'] = record['nmse_test'] - reference['nmse_test']
+        records.append(record)
+        print(json.dumps(record))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Validation report of the mixed precision Mixed Newton training.")
+    parser.add_argument('--models', nargs='+', default=['ParallelCheby2D', 'CVCNN'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4],
+                        help="Model sizes: polynomial order, hidden channels or embedding size, see build_model.")
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--length', type=int, default=8192, help="Length of train and test signals.")
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--batch-size', type=int, default=2)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=1, help="Number of torch CPU threads.")
+    parser.add_argument('--seed', type=int, default=964)
+    parser.add_argument('--output', default='mixed_precision.jsonl', help="JSON lines file to append results to.")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    env = environment()
+    with open(args.output, 'a') as f:
+        for model_name in args.models:
+            for size in args.sizes:
+                records = run_case(model_name, size, args.length, args.chunk_size, args.batch_size, args.epochs, args.modes,
+                                   args.seed, args.threads)
+                for record in records:
+                    f.write(json.dumps({**env, **record}) + '\n')
+                f.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+CPU benchmark of oracle.Oracle derivative paths: direction_through_jacobian, hessian, gradient and gradient_through_jacobian.
+Each method is timed on synthetic complex signals for all combinations of model, model size, dtype and signal length.
+Each method of each case runs in a fresh spawned process, so that peak memory doesn`t depend on memory kept by the previous
+measurements. Results are appended to the JSON lines file, one record per method, together with the environment description,
+so that records of different releases could be compared.
+
+Usage:
+    python oracle_derivatives.py --models ParallelCheby2D CVCNN --lengths 1024 4096 --dtypes complex128 \
+        --output oracle_derivatives.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import multiprocessing
+from typing import Callable, List, Union
+
+import torch
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oracle import Oracle, count_parameters
+from model import ParallelCheby2D, CVCNN, RVCNN, EncoderBasedNL
+
+OptionalInt = Union[int, None]
+
+METHODS = ['direction_through_jacobian', 'hessian', 'gradient', 'gradient_through_jacobian']
+
+# Real dtypes of the models with real parameters, which correspond to complex signal dtypes
+REAL_DTYPES = {torch.complex64: torch.float32, torch.complex128: torch.float64}
+
+def build_model(name: str, size: int, dtype: torch.dtype) -> torch.nn.Module:
+    """
+    Returns model of the given family. Number of the model parameters is controlled by size:
+    polynomial order for ParallelCheby2D, hidden channels for CVCNN and RVCNN, intermediate embedding size for EncoderBasedNL.
+    """
+    if name == 'ParallelCheby2D':
+        delays = [[j, j, j] for j in range(-2, 3)]
+        return ParallelCheby2D([size, size], delays, dtype, 'cpu')
+    if name == 'CVCNN':
+        return CVCNN(delays=[[0]], out_channels=[size, size, 1], kernel_size=[5, 5, 5], activate=['sigmoid', 'sigmoid', 'pass_act'],
+                     features=['same', 'abs'], batch_norm_mode='nothing', bias=True, device='cpu', dtype=dtype)
+    if name == 'RVCNN':
+        return RVCNN(delays=[[0]], out_channels=[size, size, 2], kernel_size=[5, 5, 5], activate=['leaky_relu', 'leaky_relu', 'pass_act'],
+                     features=['real', 'imag', 'abs'], batch_norm_mode='nothing', bias=True, device='cpu', dtype=REAL_DTYPES[dtype])
+    if name == 'EncoderBasedNL':
+        return EncoderBasedNL(interm_embed_size=[size], num_heads=[1], p_drop=[0], activate=['sigmoid'], layer_norm_mode='common',
+                              features=['real', 'imag', 'abs'], bias=True, device='cpu', dtype=REAL_DTYPES[dtype])
+    raise ValueError(f"Unknown model \'{name}\'.")
+
+def _rss_kb(field: str) -> OptionalInt:
+    try:
+        with open('/proc/self/status') as f:
+            return int(re.search(field + r':\s+(\d+)', f.read()).group(1))
+    except (OSError, AttributeError):
+        return None
+
+def _reset_peak_rss() -> bool:
+    # Writing 5 to clear_refs resets peak resident set size (VmHWM) of the process on Linux
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def measure(fn: Callable, repeat: int, warmup: int) -> dict:
+    """
+    Calls fn once measuring peak memory increase over resident set size before the call (Linux only), then calls it
+    warmup - 1 more times and finally repeat times measuring each call by time.perf_counter.
+    Memory is measured on the first call, since memory freed by the previous calls stays in the process resident set.
+    Returns minimal and median call time and peak memory increase in bytes.
+    """
+    # Baseline is the peak right after the reset, which equals resident set size at the reset time, so that the increase
+    # isn`t negative, if resident set shrinks between VmRSS reading and the reset
+    rss_before = _rss_kb('VmHWM') if _reset_peak_rss() else None
+    fn()
+    peak = _rss_kb('VmHWM') if rss_before is not None else None
+    for _ in range(warmup - 1):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'time_min': min(times), 'time_median': float(np.median(times)),
+            'peak_memory': max(peak - rss_before, 0) * 1024 if peak is not None else None}
+
+def run_method(model_name: str, size: int, dtype: torch.dtype, length: int, method: str, repeat: int, warmup: int,
+               max_hessian_params: int, seed: int, threads: int) -> dict:
+    """
+    Benchmarks the method of the Oracle for the model and synthetic signal of the given length. Called in a fresh process,
+    so that resident set size measurements don`t depend on memory kept by the previous methods and cases.
+    Returns the record of the method.
+    """
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    model = build_model(model_name, size, dtype)
+    # Input consists of the signal and PA output power channels, as in utils.dynamic_dataset_prepare
+    x = torch.cat([0.5 * torch.randn(1, 1, length, dtype=dtype), 0.5 * torch.ones(1, 1, length, dtype=dtype)], dim=1)
+    with torch.no_grad():
+        output_size = model(x).size()[-1]
+    d = 0.1 * torch.randn(1, 1, output_size, dtype=dtype)
+    batch = (x, d)
+
+    def batch_to_tensors(a):
+        return a[0], a[1]
+
+    def loss(model, signal_batch):
+        x, d = batch_to_tensors(signal_batch)
+        return (d - model(x)).abs().square().sum()
+
+    oracle = Oracle(model, loss)
+    param_num = count_parameters(model)
+    calls = {'direction_through_jacobian': lambda: oracle.direction_through_jacobian(batch, batch_to_tensors),
+             'hessian': lambda: oracle.hessian(batch),
+             'gradient': lambda: oracle.gradient(batch),
+             'gradient_through_jacobian': lambda: oracle.gradient_through_jacobian(batch)}
+    record = {'model': model_name, 'size': size, 'param_num': param_num, 'dtype': str(dtype).replace('torch.', ''),
+              'length': length, 'method': method}
+    if method == 'hessian' and param_num > max_hessian_params:
+        record['skipped'] = f"param_num > max_hessian_params = {max_hessian_params}"
+    else:
+        try:
+            record.update(measure(calls[method], repeat, warmup))
+            record['throughput'] = length / record['time_median']
+        except Exception as e:
+            record['error'] = repr(e)
+    return record
+
+def run_case(model_name: str, size: int, dtype: torch.dtype, length: int, methods: List[str], repeat: int, warmup: int,
+             max_hessian_params: int, seed: int, threads: int) -> List[dict]:
+    """
+    Benchmarks methods of the Oracle for the model and synthetic signal of the given length, each method in a separate
+    spawned process. Returns list of records: one record per method.
+    """
+    context = multiprocessing.get_context('spawn')
+    records = []
+    for method in methods:
+        with context.Pool(1) as pool:
+            record = pool.apply(run_method, (model_name, size, dtype, length, method, repeat, warmup, max_hessian_params,
+                                             seed, threads))
+        records.append(record)
+        print(json.dumps(record))
+    return records
+
+def environment() -> dict:
+    """
+    Returns description of the benchmark environment.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'git_commit': commit, 'torch_version': torch.__version__, 'python_version': platform.python_version(),
+            'machine': platform.machine(), 'processor': platform.processor(), 'num_threads': torch.get_num_threads(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU benchmark of oracle.Oracle derivative paths.")
+    parser.add_argument('--models', nargs='+', default=['ParallelCheby2D', 'CVCNN', 'RVCNN', 'EncoderBasedNL'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4, 8],
+                        help="Model sizes: polynomial order, hidden channels or embedding size, see build_model.")
+    parser.add_argument('--dtypes', nargs='+', default=['complex64', 'complex128'])
+    parser.add_argument('--lengths', nargs='+', type=int, default=[1024, 4096])
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=1, help="Number of torch CPU threads.")
+    parser.add_argument('--max-hessian-params', type=int, default=512,
+                        help="Oracle.hessian is skipped for models with more parameters.")
+    parser.add_argument('--seed', type=int, default=964)
+    parser.add_argument('--output', default='oracle_derivatives.jsonl', help="JSON lines file to append results to.")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    env = environment()
+    with open(args.output, 'a') as f:
+        for model_name in args.models:
+            for size in args.sizes:
+                for dtype in args.dtypes:
+                    for length in args.lengths:
+                        records = run_case(model_name, size, getattr(torch, dtype), length, args.methods, args.repeat,
+                                           args.warmup, args.max_hessian_params, args.seed, args.threads)
+                        for record in records:
+                            f.write(json.dumps({**env, **record}) + '\n')
+                        f.flush()
+
+if __name__ == '__main__':
+    main()
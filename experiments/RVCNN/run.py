@@ -8,7 +8,7 @@ import random
 import numpy as np
 from oracle import count_parameters
 from trainer import train
-from utils import dynamic_dataset_prepare
+from utils import dynamic_dataset_prepare, NMSECriterion
 from scipy.io import loadmat
 from model import RVCNN
 
@@ -116,26 +116,14 @@ def batch_to_tensors(a):
     d = a[1]
     return x, d
 
-def complex_mse_loss(d, y, model):
-    error = (d - y)[..., pad_zeros if pad_zeros > 0 else None: -pad_zeros if pad_zeros > 0 else None]
-    return error.abs().square().sum() #+ alpha * sum(torch.norm(p)**2 for p in model.parameters())
-
-def loss(model, signal_batch):
-    x, y = batch_to_tensors(signal_batch)
-    return complex_mse_loss(model(x), y, model)
 # This function is used only for telecom task.
-# Calculates NMSE on base of accumulated on every batch loss function
-@torch.no_grad()
+# Calculates loss function and NMSE from the single model forward pass on every batch.
+# NMSE for each PA output power could be obtained by specifying case_num=len(pa_powers).
 # To avoid conflicts for classification task you can write:
 # def quality_criterion(loss_val):
 #     return loss_val
-def quality_criterion(model, dataset):
-    targ_pow, loss_val = 0, 0
-    for batch in dataset:
-        _, d= batch_to_tensors(batch)
-        targ_pow += d[..., pad_zeros if pad_zeros > 0 else None: -pad_zeros if pad_zeros > 0 else None].abs().square().sum()
-        loss_val += loss(model, batch)
-    return 10.0 * torch.log10((loss_val) / (targ_pow)).item()
+quality_criterion = NMSECriterion(batch_to_tensors, pad_zeros)
+loss = quality_criterion.loss
 
 def load_weights(path_name, device=device):
     return torch.load(path_name, map_location=torch.device(device))
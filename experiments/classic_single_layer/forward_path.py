@@ -10,7 +10,7 @@ from oracle import count_parameters
 from trainer import train
 from utils import dynamic_dataset_prepare
 from scipy.io import loadmat
-from model import ParallelCheby2D
+from model import FusedParallelCheby2D
 
 # Determine experiment name and create its directory
 exp_name = "2_param_4_slot_6_cases"
@@ -144,7 +144,7 @@ def get_nested_attr(module, names):
             return
     return module
 
-model = ParallelCheby2D(order, delays, dtype, device)
+model = FusedParallelCheby2D(order, delays, dtype, device)
 
 model.to(device)
 
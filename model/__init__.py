@@ -2,4 +2,6 @@ from .layers import FEAT_EXTR
 from .cvcnn import CVCNN
 from .rvcnn import RVCNN
 from .encoder_based_nl import EncoderBasedNL
-from .classic import Cheby_parallel_2D, ParallelCheby2D
+from .classic import Cheby_parallel_2D, ParallelCheby2D, FusedParallelCheby2D
+from .streaming import StreamingInference
+from .export import export_model, load_exported, ExportedModel
@@ -8,7 +8,7 @@ import torch
 import torch.nn as nn
 import sys
 
-from .layers import DelaySig, Cheby2D, Delay
+from .layers import DelaySig, Cheby2D, Delay, BasisCache, chebyshev_basis
 
 # class Cheby_parallel_2D(nn.Module):
 #     def __init__ (self, delays):
@@ -48,7 +48,17 @@ class Cheby_parallel_2D(nn.Module):
             
         return out
 
+def _stream_delays(delay_inp, delay_out, enabled):
+    # Both delay layers get the same context, so that their outputs lag behind the input by the same number of samples
+    shifts = torch.cat([delay_inp.shifts.view(-1), delay_out.shifts.view(-1)])
+    left, lag = max(0, -int(shifts.min())), max(0, int(shifts.max()))
+    delay_inp.stream(enabled, left, lag)
+    delay_out.stream(enabled, left, lag)
+
 class ParallelCheby2D(nn.Module):
+    # Output is linear in parameters, thus holomorphic: d / dz* of the output equals 0 (see oracle.Oracle.direction_through_jacobian)
+    holomorphic = True
+
     def __init__ (self, order, delays, dtype=torch.complex128, device='cuda:0'):
         super(ParallelCheby2D, self).__init__()
         
@@ -68,4 +78,129 @@ class ParallelCheby2D(nn.Module):
         x_in = self.delay_out(x[:, :1, :])
         x_curr = self.delay_inp(x)
         output = sum([x_in[:, j_branch, ...] * cell(x_curr[:, j_branch, ...]) for j_branch, cell in enumerate(self.cells)])
-        return output
\ No newline at end of file
+        return output
+
+    def stream(self, enabled=True):
+        """
+            Switches delay layers into stateful mode for block-by-block processing (see model.layers.Delay.stream):
+            each call output lags behind its input by latency samples and has no wrap-around edge artifacts.
+            New stream is started.
+        """
+        _stream_delays(self.delay_inp, self.delay_out, enabled)
+
+    def reset(self):
+        """
+            Starts new stream in stateful mode.
+        """
+        self.delay_inp.reset()
+        self.delay_out.reset()
+
+    @property
+    def latency(self):
+        return self.delay_inp.lag if self.delay_inp.stateful else 0
+
+    def regression_matrix(self, x):
+        """
+            Returns regression matrix of shape [batch_size, sample_size, parameter_number], since model output
+            is linear in parameters: forward(x)[:, 0, :] = regression_matrix(x) @ flat_params.
+            Columns order corresponds to the order of model.parameters().
+        """
+        x_in = self.delay_out(x[:, :1, :])
+        x_curr = self.delay_inp(x)
+        return torch.cat([x_in[:, j_branch, 0, :, None] * cell.regression_matrix(x_curr[:, j_branch, ...])[None, ...]
+                          for j_branch, cell in enumerate(self.cells)], dim=-1)
+
+class FusedParallelCheby2D(nn.Module):
+    """
+        The same model as ParallelCheby2D, but all branches are evaluated at once.
+        Weights of all branches are stored in one parameter of shape [branch_num, order[0] * order[1]],
+        Chebyshev bases of all branches are computed by batched call and contracted with weights by single einsum.
+        State dicts of ParallelCheby2D (with keys cells.{j_branch}.weight) are also loaded by load_state_dict.
+        basis_cache_size > 0 enables caching of bases for the last basis_cache_size inputs (see model.layers.BasisCache),
+        e.g. basis_cache_size = chunk_num makes all evaluations on the same dataset (loss, jacobian, quality criterion,
+        Levenberg–Marquardt retries) reuse bases. Each cache entry takes branch_num * (order[0] + order[1] + 1) * sample_size elements.
+    """
+    holomorphic = True
+
+    def __init__(self, order, delays, dtype=torch.complex128, device='cuda:0', basis_cache_size=0):
+        super(FusedParallelCheby2D, self).__init__()
+
+        self.dtype = dtype
+        self.device = device
+        assert type(order) == int or (type(order) == list and len(order) == 2), \
+            "order parameter must be of an int type, or list including 2 ints."
+        if type(order) == int:
+            self.order = [order, order]
+        else:
+            self.order = order
+        self.branch_num = len(delays)
+        delays_input = [delays_branch[1:] for delays_branch in delays]
+        delays_output = [delays_branch[:1] for delays_branch in delays]
+        self.delay_inp = Delay(delays_input, dtype, device)
+        self.delay_out = Delay(delays_output, dtype, device)
+        self.basis_cache = BasisCache(basis_cache_size)
+        param_num = self.order[0] * self.order[1]
+        self.weight = torch.nn.Parameter(torch.zeros(self.branch_num, param_num, dtype=dtype, device=device), requires_grad=True)
+        # Random numbers are generated branch by branch as in Cheby2D, thus initialization is the same as for ParallelCheby2D
+        self.weight.data = torch.stack([1.e-2 * (torch.rand(param_num, dtype=dtype, device=device) + 1j * torch.rand(param_num, dtype=dtype, device=device) - 1/2 - 1j/2)
+                                        for _ in range(self.branch_num)], dim=0)
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+        # Convert per-branch weights of ParallelCheby2D into a single weight
+        cell_keys = [prefix + f'cells.{j_branch}.weight' for j_branch in range(self.branch_num)]
+        if prefix + 'weight' not in state_dict and all(key in state_dict for key in cell_keys):
+            state_dict[prefix + 'weight'] = torch.stack([state_dict.pop(key) for key in cell_keys], dim=0)
+        super()._load_from_state_dict(state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+
+    def basis(self, x):
+        """
+            Returns Chebyshev bases T0 and T1 of all branches with shapes [branch_num, order[0], sample_size]
+            and [branch_num, order[1], sample_size], and delayed input signal with shape [batch_size, branch_num, sample_size].
+        """
+        if self.delay_inp.stateful:
+            # In stateful mode bases depend on the stream history, not only on the input
+            return self._basis(x)
+        return self.basis_cache(x, self._basis)
+
+    def _basis(self, x):
+        x_in = self.delay_out(x[:, :1, :])[:, :, 0, :]
+        x_curr = torch.abs(self.delay_inp(x)[0, ...])
+
+        T0 = chebyshev_basis(x_curr[:, 0, :], self.order[0]).to(self.dtype)
+        T1 = chebyshev_basis(x_curr[:, 1, :], self.order[1]).to(self.dtype)
+        return T0, T1, x_in
+
+    def forward(self, x):
+        T0, T1, x_in = self.basis(x)
+        weight = self.weight.view(self.branch_num, self.order[0], self.order[1])
+        output = torch.einsum('bik,bkn,bin,zbn->zn', weight, T1, T0, x_in)
+        return output[:, None, :]
+
+    def stream(self, enabled=True):
+        """
+            Switches delay layers into stateful mode for block-by-block processing (see model.layers.Delay.stream):
+            each call output lags behind its input by latency samples and has no wrap-around edge artifacts.
+            New stream is started.
+        """
+        _stream_delays(self.delay_inp, self.delay_out, enabled)
+
+    def reset(self):
+        """
+            Starts new stream in stateful mode.
+        """
+        self.delay_inp.reset()
+        self.delay_out.reset()
+
+    @property
+    def latency(self):
+        return self.delay_inp.lag if self.delay_inp.stateful else 0
+
+    def regression_matrix(self, x):
+        """
+            Returns regression matrix of shape [batch_size, sample_size, parameter_number], since model output
+            is linear in parameters: forward(x)[:, 0, :] = regression_matrix(x) @ weight.view(-1).
+        """
+        T0, T1, x_in = self.basis(x)
+        vand = T0[:, :, None, :] * T1[:, None, :, :]
+        vand = vand.reshape(1, self.branch_num, -1, vand.shape[-1]) * x_in[:, :, None, :]
+        return vand.permute(0, 3, 1, 2).reshape(x_in.shape[0], x_in.shape[-1], -1)
\ No newline at end of file
@@ -30,6 +30,11 @@ class CVCNN(torch.nn.Module):
                               activate=activate, batch_norm_mode=batch_norm_mode, 
                               bias=bias, device=device, dtype=dtype)
         
+    @property
+    def holomorphic(self):
+        # Feature extractor acts on the input only, thus holomorphy in parameters is determined by CNN
+        return self.nonlin.holomorphic
+
     def forward(self, x):
         x_curr = self.feature_extract(x)
         output = self.nonlin(x_curr)
@@ -0,0 +1,102 @@
+import copy
+import json
+import warnings
+import torch
+import torch.nn as nn
+from typing import Union
+
+OptionalInt = Union[int, None]
+
+METHODS = ['export', 'trace']
+
+def _inference_copy(model: nn.Module) -> nn.Module:
+    # Exported model is inference-only: weights are frozen, dropout and normalization are in eval mode
+    model = copy.deepcopy(model).eval()
+    for p in model.parameters():
+        p.requires_grad_(False)
+    if hasattr(model, 'stream'):
+        # Stateful delay layers keep stream history, which can`t be a part of the stateless graph
+        model.stream(False)
+    return model
+
+def export_model(model: nn.Module, example_input: torch.Tensor, path: str, method: str = 'export',
+                 min_sample_size: OptionalInt = None) -> dict:
+    """
+    Exports trained model into the standalone serialized inference-only graph with frozen weights, which is loaded
+    by load_exported without the model classes and executes without python overhead of the model code
+    (delay layers, loops over branches and layers).
+
+    Methods:
+        'export' -- torch.export graph (ExportedProgram) saved by torch.export.save into .pt2 file. Sample size
+            (dimension 2 of the input) is dynamic, thus the graph is valid for any sample size, starting from min_sample_size
+            (if it is given) or the minimal size, which is inferred from the model; batch size and channels are equal
+            to example_input ones.
+        'trace' -- frozen TorchScript module (torch.jit.trace and torch.jit.freeze), which is also loaded by
+            torch.jit.load or libtorch C++ API. Tracing specializes the graph to the example_input shape, e.g. delay
+            indices of ParallelCheby2D, thus input shape of the loaded module is checked.
+
+    Model is copied, switched into eval mode and stateless mode of the delay layers (see ParallelCheby2D.stream).
+    Artifact contains meta data (method, model class, input shape and dtype), which is returned by load_exported.
+
+    Args:
+        model (nn.Module): Trained model, which takes tensor of shape [batch_size, channels, sample_size].
+        example_input (Tensor): Example input of the model.
+        path (str): Path of the artifact file, which must end with .pt2 for 'export' method.
+        method (str): 'export' or 'trace', see above. Defaults to 'export'.
+        min_sample_size (int, optional): Minimal sample size of 'export' method. Defaults to "None".
+
+    Returns:
+        Dictionary of the artifact meta data.
+    """
+    assert method in METHODS, f"Export method must be one of: {METHODS}, but \'{method}\' is given."
+    assert (method == 'export') == path.endswith('.pt2'), "Path must end with .pt2 if and only if method is 'export'."
+    model = _inference_copy(model)
+    meta = {'method': method, 'model': type(model).__name__, 'shape': list(example_input.shape),
+            'dtype': str(example_input.dtype).replace('torch.', ''), 'torch_version': torch.__version__}
+    with torch.no_grad():
+        if method == 'export':
+            sample_size = torch.export.Dim.AUTO if min_sample_size is None else \
+                torch.export.Dim('sample_size', min=min_sample_size)
+            program = torch.export.export(model, (example_input,), dynamic_shapes=({2: sample_size},))
+            torch.export.save(program, path, extra_files={'meta.json': json.dumps(meta)})
+        else:
+            with warnings.catch_warnings():
+                # Shape specialization warnings are expected, input shape is checked by ExportedModel
+                warnings.simplefilter('ignore', torch.jit.TracerWarning)
+                module = torch.jit.freeze(torch.jit.trace(model, example_input))
+            torch.jit.save(module, path, _extra_files={'meta.json': json.dumps(meta)})
+    return meta
+
+class ExportedModel(nn.Module):
+    """
+    Inference-only model loaded by load_exported. Keeps the artifact meta data in meta attribute.
+    """
+    def __init__(self, module: nn.Module, meta: dict):
+        super().__init__()
+        self.module = module
+        self.meta = meta
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.meta['method'] == 'trace':
+            assert list(x.shape) == self.meta['shape'], \
+                f"Traced model takes input of shape {self.meta['shape']}, but input of shape {list(x.shape)} is given."
+        return self.module(x)
+
+def load_exported(path: str, device: str = 'cpu') -> ExportedModel:
+    """
+    Loads the model exported by export_model. Model classes are not required.
+
+    Args:
+        path (str): Path of the artifact file: .pt2 file of 'export' method, otherwise TorchScript file.
+        device (str): Device to load the model to. Defaults to 'cpu'.
+
+    Returns:
+        ExportedModel instance.
+    """
+    extra_files = {'meta.json': ''}
+    if path.endswith('.pt2'):
+        module = torch.export.load(path, extra_files=extra_files).module()
+        module.to(device)
+    else:
+        module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    return ExportedModel(module, json.loads(extra_files['meta.json']))
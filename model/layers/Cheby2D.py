@@ -6,8 +6,54 @@ Created on Thu Sep 19 16:29:13 2024
 """
 import torch
 import torch.nn as nn
+from collections import OrderedDict
 import sys
 
+def chebyshev_basis(x, order):
+    """
+        Returns Chebyshev polynomials T_0(x), ..., T_{order-1}(x) stacked along dimension -2:
+        output shape is [..., order, sample_size] for x of shape [..., sample_size].
+        Polynomials are computed by the three-term recurrence T_{n+1}(x) = 2x * T_n(x) - T_{n-1}(x),
+        which requires no transcendental functions, in contrast to T_n(x) = cos(n * arccos(x)).
+    """
+    basis = [torch.ones_like(x), x]
+    for _ in range(2, order):
+        basis.append(2 * x * basis[-1] - basis[-2])
+    return torch.stack(basis[:order], dim=-2)
+
+class BasisCache:
+    """
+        LRU cache of model basis tensors, which depend only on the model input. Input tensors are identified by
+        memory address, shape, strides, dtype, device and version counter, thus views of the same dataset batch
+        are recognized and in-place modification of input invalidates the cache entry.
+        Cached input tensors are kept referenced, so their memory can`t be reused by other tensors while entry exists.
+        Inputs which require gradient are never cached.
+        Cache is bypassed while the model is compiled or exported (see model.export), since traced tensors have no memory address.
+    """
+    def __init__(self, size=0):
+        self.size = size
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def _key(x):
+        return (x.data_ptr(), tuple(x.shape), tuple(x.stride()), x.dtype, str(x.device), x._version)
+
+    def __call__(self, x, compute_fn):
+        if self.size <= 0 or x.requires_grad or torch.compiler.is_compiling():
+            return compute_fn(x)
+        key = self._key(x)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][1]
+        value = compute_fn(x)
+        self.entries[key] = (x, value)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
 class Cheby2D(nn.Module):
     """
         Introduces rectangular 2D Chebyshev polynomial.
@@ -27,15 +73,20 @@ class Cheby2D(nn.Module):
         self.weight = torch.nn.Parameter(torch.zeros(param_num, dtype = dtype, device = device), requires_grad = True)
         self.weight.data = 1.e-2 * (torch.rand(param_num, dtype = dtype, device = device) + 1j * torch.rand(param_num, dtype = dtype, device = device) - 1/2 - 1j/2)
         
-    def forward(self, input):
+    def regression_matrix(self, input):
+        """
+            Returns 2D Chebyshev basis (Vandermonde-like matrix) of shape [sample_size, order[0] * order[1]].
+            Output of the layer is linear in weights: forward(input) = regression_matrix(input) @ weight.
+        """
         input = torch.abs(input)
-        ind1 = torch.arange(self.order[0], device = self.device)
-        ind2 = torch.arange(self.order[1], device = self.device)
         
-        T0 = torch.cos(ind1[:, None] * torch.arccos(input[0, :1, :]))
-        T1 = torch.cos(ind2[:, None] * torch.arccos(input[0, 1:2, :]))
+        T0 = chebyshev_basis(input[0, 0, :], self.order[0])
+        T1 = chebyshev_basis(input[0, 1, :], self.order[1])
         
-        self.vand = (T0[:, None, :] * T1[None, :, :]).reshape(-1, T0.shape[-1]).T.to(self.dtype)
+        return (T0[:, None, :] * T1[None, :, :]).reshape(-1, T0.shape[-1]).T.to(self.dtype)
+
+    def forward(self, input):
+        self.vand = self.regression_matrix(input)
 
         approx = (self.vand @ self.weight)[None, None, :]
         return approx
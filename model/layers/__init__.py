@@ -1,7 +1,7 @@
 from .cnn import ComplexCNN, RealCNN
 from .encoder import Encoder
-from .activation import CTanh, CReLU, CPReLU, configure_activates
+from .activation import CTanh, CReLU, CPReLU, configure_activates, HOLOMORPHIC_ACTIVATES
 from .batchnorm import ScaleShift, Identity, ComplexBatchNorm1d
 from .feature_extract import FEAT_EXTR
-from .Cheby2D import Cheby2D, DelaySig
+from .Cheby2D import Cheby2D, DelaySig, BasisCache, chebyshev_basis
 from .delay import Delay
\ No newline at end of file
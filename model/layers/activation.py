@@ -56,6 +56,10 @@ class CPReLU(nn.Module):
         x[torch.abs(x+self.bias) < 0] = 0+0j
         return torch.abs(x+self.bias)*torch.exp(1j*torch.angle(x))
 
+# Activations, which are holomorphic functions of complex input (up to isolated poles).
+# CTanh equals tanh(x), though it is computed from real and imaginary parts.
+HOLOMORPHIC_ACTIVATES = ['tanh', 'ctanh', 'sigmoid', 'pass_act']
+
 def configure_activates(activate_str: str, channel_num: int=8, dtype=torch.complex128, device='cuda'):
     if activate_str == 'tanh':
         activate_func = Tanh()
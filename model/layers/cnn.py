@@ -3,7 +3,7 @@ import torch.nn as nn
 from .complexPyTorch.complexLayers import ComplexBatchNorm1d, ComplexBatchNorm2d
 from .batchnorm import Identity #ComplexBatchNorm1d
 from typing import Union, List
-from .activation import configure_activates
+from .activation import configure_activates, HOLOMORPHIC_ACTIVATES
 from collections import OrderedDict
 import numpy as np
 
@@ -53,6 +53,7 @@ class ComplexCNN(nn.Module):
         assert len(p_drop) == len(out_channels), \
             "Number of dropout parameters must be the same as number of convolutional layers"
         self.activate = activate
+        self.batch_norm_mode = batch_norm_mode
         # FC-layers initialization
         self.num_layers = len(out_channels)
         self.in_channels = in_channels
@@ -88,6 +89,14 @@ class ComplexCNN(nn.Module):
             ])))
             self.in_channels = self.out_channels[layer_i]
 
+    @property
+    def holomorphic(self) -> bool:
+        """
+            Whether output is holomorphic function of the parameters: convolutions and dropout are linear,
+            batch normalization uses input variance, thus it is not holomorphic.
+        """
+        return self.batch_norm_mode == 'nothing' and all(act in HOLOMORPHIC_ACTIVATES for act in self.activate)
+
     def forward(self, x):
         # Conv1d-layers
         x_curr = x
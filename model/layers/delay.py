@@ -6,7 +6,27 @@ import numpy as np
 import sys
 
 class Delay(nn.Module):
-    def __init__(self, delays, dtype=torch.complex128, device=None):
+    """
+        Creates circularly shifted copies of input channels for each branch:
+        output[:, j_branch, j_delay, n] = x[:, j_delay, (n + delays[j_branch][j_delay]) mod sample_size],
+        which is the same as torch.roll(x[:, j_delay, :], shifts=-delays[j_branch][j_delay], dims=-1).
+        All copies are built by single batched operation:
+            - if delays form regular grid (delays[j_branch][j_delay] = d + j_branch * step_branch + j_delay * step_delay,
+            step_branch >= 0, step_delay >= 0),
+            which is the case for delays = [[j, j, j] for j in range(-15, 16)], and allow_view == True, then output is a strided view
+            of the input, circularly extended by max|delay| samples on each side. Thus no copies per branch are made;
+            - otherwise, output is gathered from the input by precomputed indices. Indices are also used while the layer
+            is compiled by torch.compile (see trainer.compile_model), since strided view of the input breaks the graph.
+
+        Circular shift is only correct for whole-signal processing. For block-by-block (streaming) processing the layer
+        is switched into stateful mode by stream method: it keeps the last left + lag input samples per channel
+        between calls (left = max(-delay), lag = max(delay)), and output for each block is computed from the block extended by them:
+        output[:, j_branch, j_delay, n] = x[:, j_delay, n - lag + delays[j_branch][j_delay]] in the stream time,
+        i.e. output lags behind input by lag samples, since future samples are required by positive delays.
+        Thus there are no wrap-around edge artifacts and no overlap is recomputed, memory is bounded by left + lag samples.
+        The stream is preceded by zeros, reset method starts new stream.
+    """
+    def __init__(self, delays, dtype=torch.complex128, device=None, allow_view=True):
         super().__init__()
         self.dtype = dtype
         self.device = device
@@ -14,11 +34,96 @@ class Delay(nn.Module):
         # self.delays = list(chain(*delays))
         self.branch_num = len(delays)
         self.delays_num = len(delays[0])
+        self.shifts = torch.tensor(delays, dtype=torch.long)
+        self.max_shift = int(self.shifts.abs().max().item())
+        # Python int, so that forward has no data-dependent values (see model.export)
+        self.first_shift = int(self.shifts[0, 0].item())
+        self.grid = self._grid_steps(self.shifts) if allow_view else None
+        self._index_cache = {}
+        self.stateful = False
+        self.left = max(0, -int(self.shifts.min().item()))
+        self.lag = max(0, int(self.shifts.max().item()))
+        self.history = None
+
+    @staticmethod
+    def _grid_steps(shifts):
+        """
+            Returns non-negative steps (step_branch, step_delay) if
+            shifts[j_branch, j_delay] = shifts[0, 0] + j_branch * step_branch + j_delay * step_delay, otherwise returns None.
+        """
+        step_branch = int(shifts[1, 0] - shifts[0, 0]) if shifts.shape[0] > 1 else 0
+        step_delay = int(shifts[0, 1] - shifts[0, 0]) if shifts.shape[1] > 1 else 0
+        ind_branch = torch.arange(shifts.shape[0])[:, None]
+        ind_delay = torch.arange(shifts.shape[1])[None, :]
+        # Negative strides are not supported by torch.as_strided
+        if step_branch < 0 or step_delay < 0:
+            return None
+        if torch.equal(shifts, shifts[0, 0] + ind_branch * step_branch + ind_delay * step_delay):
+            return step_branch, step_delay
+        return None
+
+    def _index(self, sample_size, device, offset=None):
+        """
+            Returns gather indices: circular (modulo sample_size) if offset is None, otherwise shifted by offset
+            in the extended input.
+        """
+        key = (sample_size, str(device), offset)
+        if key not in self._index_cache:
+            index = torch.arange(sample_size, device=device) + self.shifts.to(device)[..., None]
+            index = index % sample_size if offset is None else index + offset
+            if torch.compiler.is_dynamo_compiling():
+                # Indices are constants of the compiled graph
+                return index
+            self._index_cache[key] = index
+        return self._index_cache[key]
+
+    def stream(self, enabled=True, left=None, lag=None):
+        """
+            Switches stateful (streaming) mode on or off and starts new stream. left and lag could be increased
+            over the layer own values, e.g. to align several delay layers of the model with the same output lag.
+        """
+        self.stateful = enabled
+        self.left = max(0, -int(self.shifts.min().item())) if left is None else left
+        self.lag = max(0, int(self.shifts.max().item())) if lag is None else lag
+        assert self.left + int(self.shifts.min().item()) >= 0 and self.lag >= int(self.shifts.max().item()), \
+            "left and lag must cover all delays."
+        self.reset()
+
+    def reset(self):
+        """
+            Starts new stream: history of the previous samples is replaced by zeros.
+        """
+        self.history = None
+
+    def _extend(self, x):
+        context = self.left + self.lag
+        if self.history is None or self.history.shape[:2] != x.shape[:2]:
+            self.history = torch.zeros(*x.shape[:2], context, dtype=x.dtype, device=x.device)
+        x = torch.cat([self.history, x], dim=-1)
+        # History is copied, so that it doesn`t keep the whole block referenced
+        self.history = x[..., x.shape[-1] - context:].detach().clone()
+        return x
 
     def forward(self, x):
         assert x.shape[1] == self.delays_num, "Number of channels of input signal must equal the number of delays in each branch of model."
-        output = torch.zeros(x.shape[0], self.branch_num, self.delays_num, x.shape[2], dtype=self.dtype, device=self.device)
-        for j_branch in range(self.branch_num):
-            for j_delay, delay in enumerate(self.delays[j_branch]):
-                output[:, j_branch, j_delay, :] = torch.roll(x[:, j_delay, :], shifts=-1*delay, dims=-1)
-        return output
\ No newline at end of file
+        x = x.to(self.dtype)
+        sample_size = x.shape[2]
+        if self.stateful:
+            # Output sample n of the block takes extended input sample n + left + shift, i.e. lags by lag samples
+            x, offset = self._extend(x), self.left
+        elif self.grid is not None and self.max_shift <= sample_size:
+            if self.max_shift > 0:
+                x = torch.cat([x[..., sample_size - self.max_shift:], x, x[..., :self.max_shift]], dim=-1)
+            offset = self.max_shift
+        else:
+            offset = None
+        if self.grid is not None and offset is not None and not torch.compiler.is_dynamo_compiling():
+            step_branch, step_delay = self.grid
+            x = x.contiguous()
+            stride = x.stride()
+            return torch.as_strided(x, size=(x.shape[0], self.branch_num, self.delays_num, sample_size),
+                                    stride=(stride[0], step_branch * stride[2], stride[1] + step_delay * stride[2], stride[2]),
+                                    storage_offset=x.storage_offset() + (offset + self.first_shift) * stride[2])
+        size = (x.shape[0], self.branch_num, self.delays_num, sample_size)
+        index = self._index(sample_size, x.device, offset)
+        return torch.gather(x[:, None, ...].expand(size[:3] + x.shape[-1:]), 3, index[None, ...].expand(size))
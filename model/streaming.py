@@ -0,0 +1,192 @@
+import copy
+import torch
+import torch.nn as nn
+from typing import Union
+
+from .cvcnn import CVCNN
+from .rvcnn import RVCNN
+from .encoder_based_nl import EncoderBasedNL
+from .classic import ParallelCheby2D, FusedParallelCheby2D
+
+OptionalInt = Union[int, None]
+OptionalTensor = Union[torch.Tensor, None]
+
+class StreamingInference:
+    """
+        Streaming inference of the trained model on continuous signal, which arrives by blocks of arbitrary size.
+        Output sample n of the model depends on input samples n - left, ..., n + right (receptive field).
+        The engine implements overlap-save: input samples, which are required by not yet computed outputs (at most left + right),
+        are kept between calls and prepended to the next block. Each call returns outputs for all input samples, which
+        receptive field is complete, thus output lags behind input by right samples.
+        Stream is implied to be preceded by left zeros, and flush call appends right zeros to the end of the stream, which is
+        the same as zero padding of the whole signal by left and right samples.
+
+        Modes:
+            'valid' -- model output is shorter than input by left + right samples (convolutions without padding),
+                e.g. CVCNN, RVCNN. Output equals whole-signal output of the signal padded by pad_zeros = left zeros
+                on the left and right zeros on the right, as prepared by utils.dynamic_dataset_prepare.
+            'same' -- model output has the same length as input and outputs, which receptive field exceeds the input, are
+                computed for circularly extended input, e.g. ParallelCheby2D with model.layers.Delay. Only outputs with complete
+                receptive field are taken, thus output equals whole-signal output except for the first left and last right
+                samples, for which whole-signal processing wraps the signal around circularly, and stream uses zeros instead.
+            'stateful' -- model keeps receptive field history itself, e.g. ParallelCheby2D with delay layers in stateful mode
+                (see ParallelCheby2D.stream), thus each block is processed once without overlap. Model output lags behind
+                its input by right samples, the first right outputs of the stream precede it and are dropped.
+                Output is the same as in 'same' mode.
+            'block' -- model output depends on the whole input (self-attention of EncoderBasedNL), thus input is collected
+                into blocks of block_size samples (training chunk size), which are processed independently. Output equals
+                block-wise processing of the whole signal, latency is block_size samples.
+
+        Model is evaluated as is, thus it should be switched into eval mode (dropout, batch normalization) by the caller.
+    """
+    def __init__(self, model: nn.Module, left: int = 0, right: int = 0, mode: str = 'valid', block_size: OptionalInt = None):
+        """
+        Constructor of the StreamingInference class.
+
+        Args:
+            model (nn.Module): Model, which takes tensor of shape [batch_size, channels, sample_size].
+            left (int): The number of past samples in the receptive field. Defaults to 0.
+            right (int): The number of future samples in the receptive field. Defaults to 0.
+            mode (str): 'valid', 'same', 'block' or 'stateful', see class description. Defaults to 'valid'.
+            block_size (int, optional): Block size of 'block' mode. Defaults to "None".
+        """
+        assert mode in ['valid', 'same', 'block', 'stateful'], \
+            f"Streaming mode must be one of: 'valid', 'same', 'block', 'stateful', but '{mode}' is given."
+        assert mode != 'block' or (block_size is not None and block_size > 0), "'block' mode requires positive block_size."
+        assert left >= 0 and right >= 0, "Receptive field bounds must be non-negative."
+        self.model = model
+        self.left = left
+        self.right = right
+        self.mode = mode
+        self.block_size = block_size
+        self.buffer = None
+        self.skip = right
+        self.empty = None
+
+    @classmethod
+    def for_model(cls, model: nn.Module, pad_zeros: OptionalInt = None, block_size: OptionalInt = None) -> 'StreamingInference':
+        """
+        Returns streaming engine with receptive field of the model:
+            CVCNN, RVCNN -- sum(kernel_size - 1) samples in total, pad_zeros of them are past samples.
+                pad_zeros defaults to sum(kernel_size // 2), as in experiments;
+            ParallelCheby2D, FusedParallelCheby2D -- delay taps: output sample n depends on input samples n + delay.
+                Delay layers of the model copy are switched into stateful mode, see ParallelCheby2D.stream,
+                the given model isn`t changed;
+            EncoderBasedNL -- block_size is required.
+
+        Args:
+            model (nn.Module): One of the models listed above.
+            pad_zeros (int, optional): The number of past samples in receptive field of convolutional model. Defaults to "None".
+            block_size (int, optional): Block size of EncoderBasedNL. Defaults to "None".
+
+        Returns:
+            StreamingInference instance.
+        """
+        if isinstance(model, (CVCNN, RVCNN)):
+            kernel_size = model.nonlin.kernel_size
+            if pad_zeros is None:
+                pad_zeros = sum(kernel // 2 for kernel in kernel_size)
+            field = sum(kernel - 1 for kernel in kernel_size)
+            assert pad_zeros <= field, f"pad_zeros must not exceed the receptive field size {field}."
+            return cls(model, pad_zeros, field - pad_zeros, 'valid')
+        if isinstance(model, (ParallelCheby2D, FusedParallelCheby2D)):
+            # Engine owns the stateful copy, thus the given model keeps whole-signal processing
+            model = copy.deepcopy(model)
+            model.stream(True)
+            return cls(model, model.delay_inp.left, model.latency, 'stateful')
+        if isinstance(model, EncoderBasedNL):
+            return cls(model, mode='block', block_size=block_size)
+        raise ValueError(f"Receptive field of the model {type(model).__name__} is unknown, use StreamingInference constructor.")
+
+    @property
+    def latency(self) -> int:
+        """
+        The number of input samples, by which output lags behind input.
+        """
+        return self.block_size if self.mode == 'block' else self.right
+
+    def reset(self, history: OptionalTensor = None):
+        """
+        Starts new stream. Stream is preceded by history (the last past samples of shape [batch_size, channels, left])
+        if it is given, otherwise by zeros.
+        """
+        assert history is None or (self.mode in ['valid', 'same'] and history.shape[-1] == self.left), \
+            f"History must consist of left = {self.left} samples, it isn`t supported in '{self.mode}' mode."
+        self.buffer = history
+        self.skip = self.right
+        if self.mode == 'stateful':
+            self.model.reset()
+
+    def _start(self, x: torch.Tensor):
+        if self.buffer is None:
+            zeros = 0 if self.mode == 'block' else self.left
+            self.buffer = torch.zeros(*x.shape[:-1], zeros, dtype=x.dtype, device=x.device)
+
+    @torch.no_grad()
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Processes the next block of the stream.
+
+        Args:
+            x (Tensor): Input block of shape [batch_size, channels, block size], block size is arbitrary.
+
+        Returns:
+            Tensor: Output samples, which receptive field is complete, of shape [batch_size, output channels, number of samples].
+        """
+        if self.mode == 'stateful':
+            self.buffer = x[..., :0]
+            if x.shape[-1] == 0:
+                # Empty block (e.g. flush of the model with right = 0) doesn`t change the model state and isn`t passed to it
+                return self._empty_stateful(x)
+            output = self.model(x)
+            self.empty = output[..., :0]
+            skip, self.skip = min(self.skip, output.shape[-1]), self.skip - min(self.skip, output.shape[-1])
+            return output[..., skip:]
+        self._start(x)
+        window = torch.cat([self.buffer, x], dim=-1)
+        if self.mode == 'block':
+            ready = window.shape[-1] - window.shape[-1] % self.block_size
+            self.buffer = window[..., ready:]
+            return self._blocks(window[..., :ready])
+        ready = window.shape[-1] - self.left - self.right
+        if ready <= 0:
+            self.buffer = window
+            return self._empty(window)
+        # Samples required by the following outputs are kept for the next call
+        self.buffer = window[..., ready:]
+        output = self.model(window)
+        if self.mode == 'same':
+            output = output[..., self.left: output.shape[-1] - self.right]
+        return output
+
+    def _blocks(self, x: torch.Tensor) -> torch.Tensor:
+        if x.shape[-1] == 0:
+            return self._empty(x)
+        return torch.cat([self.model(block) for block in x.split(self.block_size, dim=-1)], dim=-1)
+
+    def _empty_stateful(self, x: torch.Tensor) -> torch.Tensor:
+        if self.empty is None:
+            # No block is processed yet, thus the model state is reset after the probe
+            self.empty = self.model(torch.zeros(*x.shape[:-1], 1, dtype=x.dtype, device=x.device))[..., :0]
+            self.model.reset()
+        return self.empty
+
+    def _empty(self, x: torch.Tensor) -> torch.Tensor:
+        # Output channels number is obtained from the model output of the shortest input with complete receptive field
+        probe = torch.zeros(*x.shape[:-1], self.left + self.right + 1, dtype=x.dtype, device=x.device)
+        return self.model(probe)[..., :0]
+
+    @torch.no_grad()
+    def flush(self) -> torch.Tensor:
+        """
+        Finishes the stream: returns outputs of the last right samples (followed by zeros) or the last incomplete block.
+        Next call starts new stream.
+        """
+        if self.buffer is None:
+            return None
+        if self.mode == 'block':
+            output = self._blocks(self.buffer)
+        else:
+            output = self(torch.zeros(*self.buffer.shape[:-1], self.right, dtype=self.buffer.dtype, device=self.buffer.device))
+        self.reset()
+        return output
@@ -1 +1,3 @@
-from .base import Oracle, count_parameters
\ No newline at end of file
+from .base import Oracle, count_parameters, ACCUMULATE_DTYPES
+from .functional import FunctionalOracle
+from .autotune import JacobianAutotuner, jacobian_autotuner
@@ -0,0 +1,129 @@
+import time
+import math
+import torch
+from torch import nn, Tensor
+
+from typing import Callable, List, Tuple, Union
+
+StrategyType = Tuple[bool, str]
+OptionalStrategy = Union[StrategyType, None]
+MeasureFnType = Callable[[bool, str, int], None]
+
+# Candidate (vectorize, strategy) pairs, see oracle.base._jacobian
+JACOBIAN_CANDIDATES = [(True, 'forward-mode'), (True, 'reverse-mode'), (False, 'reverse-mode'), (True, 'jacfwd'), (True, 'jacrev')]
+
+
+class JacobianAutotuner:
+    """
+    The class chooses the fastest strategy of model output jacobian computation by micro-benchmarks on the first batch
+    and caches the winner per key: model signature (class, parameters names, shapes and dtypes), input shape, dtype and device.
+    Candidates are forward-mode and reverse-mode torch.autograd.functional.jacobian with and without vectorization and
+    torch.func.jacfwd / torch.func.jacrev, which are vectorized by torch.func.vmap.
+
+    Computation time depends on the number of output samples differently for the strategies: forward-mode makes one
+    (vectorized) pass per parameter, thus its time is linear in sample size, while reverse-mode makes one backward pass per
+    output sample, thus its time is up to quadratic. To keep the benchmark cheap on long batches, each candidate is timed on
+    the input prefixes of probe_size and 2 * probe_size samples and its time is extrapolated to the whole batch
+    by the power law with measured exponent, which is clipped to [1, 2]. Candidates, which fail on the probe (e.g. not supported
+    by the model operations), are excluded. If the winner fails on the whole batch (e.g. runs out of memory), it is rejected
+    and the next candidate in the order of estimated time is used.
+    """
+    def __init__(self, probe_size: int = 256, repeat: int = 1, verbose: bool = True):
+        """
+        Constructor of the JacobianAutotuner class.
+
+        Args:
+            probe_size (int): The number of input samples of the shorter probe. Defaults to 256.
+            repeat (int): The number of timed calls per probe, minimal time is taken. Defaults to 1.
+            verbose (bool): Whether to print benchmark results. Defaults to "True".
+        """
+        self.probe_size = probe_size
+        self.repeat = repeat
+        self.verbose = verbose
+        self.entries = {}
+
+    @staticmethod
+    def key(model: nn.Module, names: List[str], params: Tuple[Tensor, ...], model_input: Tensor, *args) -> tuple:
+        """
+        Returns cache key of the model signature, input shape, dtype and device.
+        Additional hashable arguments, which affect jacobian computation (e.g. return_full_wirtinger_derivative), are appended.
+        """
+        signature = tuple((name, tuple(p.shape), p.dtype) for name, p in zip(names, params))
+        return (type(model).__name__, signature, tuple(model_input.shape), model_input.dtype, str(model_input.device)) + args
+
+    def _time(self, measure_fn: MeasureFnType, candidate: StrategyType, length: int, device: torch.device) -> float:
+        times = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            measure_fn(*candidate, length)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def _estimate(self, measure_fn: MeasureFnType, candidate: StrategyType, sample_size: int, device: torch.device) -> float:
+        short = min(self.probe_size, sample_size)
+        long = min(2 * self.probe_size, sample_size)
+        # Warm-up call excludes one-time costs, e.g. vmap tracing
+        measure_fn(*candidate, short)
+        short_time = self._time(measure_fn, candidate, short, device)
+        if long == short:
+            return short_time * sample_size / short
+        long_time = self._time(measure_fn, candidate, long, device)
+        exponent = math.log(max(long_time, 1e-9) / max(short_time, 1e-9)) / math.log(long / short)
+        exponent = min(max(exponent, 1.), 2.)
+        return long_time * (sample_size / long) ** exponent
+
+    def select(self, key: tuple, measure_fn: MeasureFnType, sample_size: int, device: torch.device = torch.device('cpu')) -> StrategyType:
+        """
+        Returns the fastest (vectorize, strategy) pair for the key. Candidates are benchmarked on the first call for the key.
+
+        Args:
+            key (tuple): Cache key, see JacobianAutotuner.key.
+            measure_fn (Callable): Function, which takes vectorize flag, strategy and the number of input samples
+                and computes jacobian on the input prefix of this size.
+            sample_size (int): The number of input samples of the whole batch.
+            device (torch.device, optional): Device of the computations. Defaults to CPU.
+
+        Returns:
+            Tuple of vectorize flag (bool) and strategy (str).
+        """
+        if key not in self.entries:
+            estimates = []
+            for candidate in JACOBIAN_CANDIDATES:
+                try:
+                    estimates.append((self._estimate(measure_fn, candidate, sample_size, device), candidate))
+                except (RuntimeError, ValueError, NotImplementedError) as e:
+                    if self.verbose:
+                        print(f"Jacobian autotune: {candidate[1]}, vectorize={candidate[0]} failed: {type(e).__name__}")
+            assert len(estimates) > 0, "No jacobian strategy is applicable to the model."
+            estimates.sort(key=lambda estimate: estimate[0])
+            if self.verbose:
+                print("Jacobian autotune, estimated time: " +
+                      ", ".join(f"{s} (vectorize={v}) {t:.3e} s" for t, (v, s) in estimates))
+            self.entries[key] = [candidate for _, candidate in estimates]
+        return self.entries[key][0]
+
+    def reject(self, key: tuple) -> OptionalStrategy:
+        """
+        Removes current winner for the key, e.g. when it failed on the whole batch. Returns the next candidate
+        or "None", if no candidates are left: then the key is removed, thus the next select call benchmarks candidates again.
+        """
+        failed = self.entries[key].pop(0)
+        if len(self.entries[key]) == 0:
+            del self.entries[key]
+            if self.verbose:
+                print(f"Jacobian autotune: {failed[1]} (vectorize={failed[0]}) rejected, no more candidates left.")
+            return None
+        if self.verbose:
+            print(f"Jacobian autotune: {failed[1]} (vectorize={failed[0]}) rejected, switching to "
+                  f"{self.entries[key][0][1]} (vectorize={self.entries[key][0][0]}).")
+        return self.entries[key][0]
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Autotuner, which could be passed to several Oracle instances explicitly to share the strategies chosen once.
+# By default each Oracle has its own autotuner, so that rejected strategies don`t carry over between runs and models
+jacobian_autotuner = JacobianAutotuner()
@@ -2,7 +2,8 @@ import torch
 from torch import nn, Tensor
 from functools import reduce
 # from torch.func import jacrev
-from utils import Timer
+from utils import Timer, Profiler
+from .autotune import JacobianAutotuner
 from math import ceil
 import copy
 import sys
@@ -17,6 +18,13 @@ StrOrList = Union[str, List[str], Tuple[str], None]
 OptionalTensor = Union[Tensor, None]
 BatchTensorType = Callable[[Tensor], Tuple[Tensor, ...]]
 OptionalInt = Union[int, None]
+OptionalProfiler = Union[Profiler, None]
+OptionalAutotuner = Union[JacobianAutotuner, None]
+OptionalDtype = Union[torch.dtype, None]
+
+# Double precision dtypes of mixed precision accumulation for low precision jacobians, see Oracle.direction_through_jacobian
+ACCUMULATE_DTYPES = {torch.float32: torch.float64, torch.float64: torch.float64,
+                     torch.complex64: torch.complex128, torch.complex128: torch.complex128}
 
 
 def _del_nested_attr(obj: nn.Module, names: List[str]) -> None:
@@ -105,6 +113,38 @@ def load_weights(mod: nn.Module, names: List[str], params: Tuple[Tensor, ...], i
         _set_nested_attr(mod, name.split("."), p, is_nn_param)
 
 
+def _jacobian(fn: Callable, inputs: TensorTuple, vectorize: bool, strategy: str) -> TensorTuple:
+    """
+    Computes jacobian of fn w.r.t. each of inputs. Strategies "forward-mode" and "reverse-mode" are computed by
+    torch.autograd.functional.jacobian, strategies "jacfwd" and "jacrev" - by torch.func.jacfwd and torch.func.jacrev,
+    which are always vectorized by torch.func.vmap, thus vectorize is ignored for them.
+    Only forward-mode torch.autograd.functional.jacobian supports complex output, for other strategies complex output
+    is differentiated as a real tensor torch.view_as_real(output) and jacobian is combined as d Re / dp + 1j * d Im / dp.
+    """
+    if strategy == 'forward-mode':
+        return torch.autograd.functional.jacobian(fn, inputs, create_graph=False, vectorize=vectorize, strategy=strategy)
+
+    output_dim = []
+
+    def real_fn(*args):
+        output = fn(*args)
+        if not torch.is_complex(output):
+            return output
+        output_dim.append(output.dim())
+        return torch.view_as_real(output)
+
+    if strategy == 'reverse-mode':
+        J = torch.autograd.functional.jacobian(real_fn, inputs, create_graph=False, vectorize=vectorize, strategy=strategy)
+    elif strategy in ('jacfwd', 'jacrev'):
+        jac_fn = torch.func.jacfwd if strategy == 'jacfwd' else torch.func.jacrev
+        J = jac_fn(real_fn, argnums=tuple(range(len(inputs))))(*inputs)
+    else:
+        raise ValueError(f"Unknown jacobian strategy \'{strategy}\'.")
+    if len(output_dim) == 0:
+        return J
+    return tuple(torch.complex(j.select(output_dim[0], 0), j.select(output_dim[0], 1)) for j in J)
+
+
 def _check_tensors_complex_any(tensors):
     """
     Checks input for containment of any complex-valued tensor.
@@ -131,9 +171,12 @@ class Oracle(object):
         _model (nn.Module): The model with differentiable parameters.
         _loss_fn (Callable): The function used to compute model quality. Takes nn.Module and tuple of two Tensor
             instances. Returns differentiable Tensor scalar.
+        _profiler (utils.Profiler, optional): Profiler, which measures time of jacobian and Gram matrix (hessian) computations.
+        _autotuner (JacobianAutotuner): Autotuner of jacobian computation strategy.
     """
     
-    def __init__(self, model: nn.Module, loss_fn: LossFnType, inplace_copy_model: bool = False) -> None:
+    def __init__(self, model: nn.Module, loss_fn: LossFnType, inplace_copy_model: bool = False, profiler: OptionalProfiler = None,
+                 autotuner: OptionalAutotuner = None) -> None:
         """
         Class constructor.
         
@@ -143,12 +186,18 @@ class Oracle(object):
                 instances. Returns differentiable Tensor scalar.
             inplace_copy_model (bool, optional): This flag defines whether to perform deep copy of the model
                 or to use the same referenced instance. Defaults to "False".
+            profiler (utils.Profiler, optional): Profiler, which measures phases 'jacobian' and 'gram' of the
+                direction_through_jacobian method. Defaults to "None".
+            autotuner (JacobianAutotuner, optional): Autotuner of jacobian strategy used by direction_through_jacobian
+                with autotune=True. Defaults to "None", which means new autotuner of this instance.
         """
         if inplace_copy_model:
             self._model = copy.deepcopy(model)
         else:
             self._model = model
         self._loss_fn = loss_fn
+        self._profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self._autotuner = autotuner if autotuner is not None else JacobianAutotuner()
     
     def get_params_names(self) -> List[str]:
         """
@@ -266,7 +315,10 @@ class Oracle(object):
     @torch.enable_grad()
     def direction_through_jacobian(self, signal_batch: BatchType, batch_to_tensors: BatchTensorType,
                     weight_names: StrOrList = None, compute_fn_val: bool = False, 
-                    return_full_wirtinger_derivative: bool = False, idxs: OptionalTensor = None) -> DerRetType:
+                    return_full_wirtinger_derivative: bool = False, idxs: OptionalTensor = None,
+                    window_size: OptionalInt = None, window_context: OptionalInt = None,
+                    analytic_jacobian: bool = False, autotune: bool = False, holomorphic: bool = False,
+                    accumulate_dtype: OptionalDtype = None) -> DerRetType:
         """
         This method computes hessian and gradient values of the loss function and optionally returns loss function value.
         The method accumulates jacobian from the jacobian chunks generated by model_output_jacobian_chunk function. 
@@ -291,7 +343,31 @@ class Oracle(object):
                 in the original gradient wrt model parameters. For return_full_wirtinger_derivative=True a returned
                 1d float Tensor has size [2 * len(idxs)]. If weight_names is specified, indexes from idxs
                 represent positions from 1d flattened vector of model parameters selected wrt name_list. Defaults to "None".
-                
+            window_size (int, optional): If specified, hessian and gradient are accumulated over the windows of window_size
+                output samples, thus jacobian of the whole batch is never materialized and peak memory is bounded by window_size
+                instead of batch sample size. Result is the same as for the whole batch. Defaults to "None".
+            window_context (int, optional): The number of input samples added to each side of the window. It must cover
+                model receptive field (e.g. maximal absolute delay of ParallelCheby2D), which is checked for the models
+                with model.layers.Delay layers. Used only with window_size. Defaults to "None", which equals 0.
+            analytic_jacobian (bool, optional): If set "True", jacobian is taken from model.regression_matrix method
+                without automatic differentiation. It is applicable only for models, which output is linear in parameters,
+                e.g. model.ParallelCheby2D. Defaults to "False".
+            autotune (bool, optional): If set "True", jacobian strategy is chosen by micro-benchmarks on the first batch
+                of the given model signature, shape and device, and the winner is cached for the next calls (see JacobianAutotuner).
+                Otherwise forward-mode is used if sample size is not lower than the number of parameters, and reverse-mode
+                without vectorization is used otherwise. With window_size strategy is chosen for the window and defaults
+                to vectorized forward-mode. Not used with analytic_jacobian. Defaults to "False".
+            holomorphic (bool, optional): If set "True", model output is implied to be holomorphic function of complex
+                parameters (e.g. model.ParallelCheby2D or model.CVCNN with holomorphic activations, see model.holomorphic).
+                Then d / dz* equals 0 and d / dz equals derivative w.r.t. real part of the parameters, thus jacobian is computed
+                w.r.t. complex parameters directly with half the tangent (forward-mode) evaluations. Defaults to "False".
+            accumulate_dtype (torch.dtype, optional): Precision of hessian and gradient. If specified, jacobian chunk (the whole
+                batch or the window) and error are cast to it (complex ones stay complex) before the products J^H @ J and
+                J^H @ e, thus for mixed precision model forward and jacobian are computed in model dtype (e.g. complex64),
+                while hessian and gradient are computed and accumulated in double precision (e.g. complex128,
+                see ACCUMULATE_DTYPES).
+                Defaults to "None": model dtype.
+
         Returns:
             float scalar Tensor, optional: The loss function value. This value is nondifferentiable.
             Tensor: hessian.
@@ -330,12 +406,199 @@ class Oracle(object):
 
             params = tuple(reduce(getattr, name.split(sep='.'), self._model) for name in weight_names)
 
+        if window_size is not None:
+            window_context = 0 if window_context is None else window_context
+            receptive_field = max((module.max_shift for module in self._model.modules() if type(module).__name__ == 'Delay'),
+                                  default=0)
+            assert window_context >= receptive_field, \
+                f"window_context = {window_context} must cover maximal delay {receptive_field} of the model Delay layers."
+
         if compute_fn_val:
             loss_val = self.loss_function_val(signal_batch)
         
-        params, names = extract_weights(self._model, weight_names)
+        if analytic_jacobian:
+            columns = self._regression_columns(weight_names)
+        else:
+            columns = None
 
-        if _check_tensors_complex_any(params):# z = x + i * y
+        params, names = self._extract_weights(weight_names)
+
+        if window_size is not None:
+            # Windows are processed by vectorized forward-mode unless autotuned, since its memory is proportional to window_size
+            vectorize, strategy = True, 'forward-mode'
+            # Input window is extended by the context and by the difference between input and target lengths
+            tune_size = min(window_size + 2 * window_context + signal_batch_input.size()[-1] - signal_batch_output.size()[-1],
+                            signal_batch_input.size()[-1])
+        else:
+            tune_size = signal_batch_input.size()[-1]
+
+        if autotune and columns is None:
+            key = self._autotuner.key(self._model, names, params, signal_batch_input[..., :tune_size],
+                                      return_full_wirtinger_derivative, None if idxs is None else len(idxs), holomorphic)
+
+            def measure_fn(vectorize, strategy, length):
+                self._output_jacobian(signal_batch_input[..., :length], names, params, vectorize, strategy,
+                                      return_full_wirtinger_derivative, idxs, holomorphic=holomorphic)
+
+            with self._profiler.phase('autotune'):
+                vectorize, strategy = self._autotuner.select(key, measure_fn, tune_size, signal_batch_input.device)
+
+        while True:
+            try:
+                if window_size is not None:
+                    hess, grad = self._accumulate_windowed_direction(signal_batch_input, signal_batch_output, names, params,
+                                                                     window_size, window_context,
+                                                                     return_full_wirtinger_derivative, idxs, columns, holomorphic,
+                                                                     accumulate_dtype, vectorize, strategy)
+                    break
+                with self._profiler.phase('jacobian'):
+                    J = self._output_jacobian(signal_batch_input, names, params, vectorize, strategy, return_full_wirtinger_derivative,
+                                              idxs, columns=columns, holomorphic=holomorphic)
+                break
+            except RuntimeError:
+                candidate = self._autotuner.reject(key) if autotune and columns is None else None
+                if candidate is None:
+                    # Original error is raised, when no candidates are left, and model parameters are restored
+                    self._restore_weights(names, params)
+                    raise
+                vectorize, strategy = candidate
+
+        self._restore_weights(names, params)
+
+        if window_size is not None:
+            if compute_fn_val:
+                return loss_val, hess, grad.view(-1)
+            return hess, grad.view(-1)
+
+        with self._profiler.phase('gram'):
+            if accumulate_dtype is not None:
+                J = J.to(torch.promote_types(J.dtype, accumulate_dtype))
+            J_H = torch.conj(torch.permute(J, (0, 2, 1)))            
+            
+            model_output = self._model(signal_batch_input)
+
+            error_vec = torch.permute(model_output - signal_batch_output, (0, 2, 1))
+            if accumulate_dtype is not None:
+                error_vec = error_vec.to(torch.promote_types(error_vec.dtype, accumulate_dtype))
+
+            grad = torch.bmm(J_H, error_vec)
+            hess = torch.bmm(J_H, J)
+
+            grad = torch.sum(grad, keepdim=False, dim=0)
+            hess = torch.sum(hess, keepdim=False, dim=0)
+
+        grad.detach_()
+        hess.detach_()
+        J = J.detach()
+        J_H = J_H.detach()
+        error_vec = error_vec.detach()
+        del J
+        del J_H
+        del error_vec
+
+        torch.cuda.empty_cache()
+        
+        if compute_fn_val:
+            return loss_val, hess, grad.view(-1)
+        return hess, grad.view(-1) 
+
+    def _extract_weights(self, weight_names: StrOrList = None) -> Tuple[TensorTuple, List[str]]:
+        """
+        Returns differentiable copies of the parameters and their names. Parameters are removed from the model
+        (see extract_weights) and must be restored by _restore_weights.
+        """
+        return extract_weights(self._model, weight_names)
+
+    def _restore_weights(self, names: List[str], params: TensorTuple) -> None:
+        """
+        Loads parameters, previously removed by _extract_weights, back into the model as nn.Parameter instances.
+        """
+        load_weights(self._model, names, params, is_nn_param=True)
+
+    def _with_weights(self, names: List[str], weights: TensorTuple) -> Callable:
+        """
+        Returns the model, which uses weights as its named parameters, e.g. to differentiate model output w.r.t. weights.
+        """
+        load_weights(self._model, names, weights)
+        return self._model
+
+    def _regression_columns(self, weight_names: StrOrList = None) -> Tensor:
+        """
+        Returns indices of model.regression_matrix columns, which correspond to the parameters from weight_names.
+        Columns of regression matrix are implied to follow the order of model.parameters().
+
+        Args:
+            weight_names (str or list of str, optional): Names of parameters. Defaults to "None", which means all parameters.
+
+        Returns:
+            Tensor: 1d int Tensor of columns indices.
+        """
+        offsets = {}
+        offset = 0
+        for name, p in self._model.named_parameters():
+            offsets[name] = torch.arange(offset, offset + p.numel())
+            offset += p.numel()
+        if weight_names is None:
+            weight_names = list(offsets.keys())
+        if isinstance(weight_names, str):
+            weight_names = [weight_names]
+        device = next(self._model.parameters()).device
+        return torch.cat([offsets[name] for name in weight_names]).to(device)
+
+    def _output_jacobian(self, model_input: Tensor, names: List[str], params: TensorTuple, vectorize: bool, strategy: str,
+                         return_full_wirtinger_derivative: bool = False, idxs: OptionalTensor = None,
+                         output_slice: slice = slice(None), columns: OptionalTensor = None, holomorphic: bool = False) -> Tensor:
+        """
+        This method computes batched jacobian of the model output w.r.t. the parameters previously removed from the model
+        by extract_weights function. Jacobian has size [batch_size, sample_size, model_parameter_number].
+        For complex parameters jacobian is calculated w.r.t. real and imaginary parts and combined into d / dz.
+
+        Args:
+            model_input (Tensor): Model input signal.
+            names (list of str): Names of the extracted parameters.
+            params (tuple of Tensor instances): Extracted parameters.
+            vectorize (bool): vectorize flag of torch.autograd.functional.jacobian.
+            strategy (str): "forward-mode" or "reverse-mode" strategy of torch.autograd.functional.jacobian,
+                "jacfwd" or "jacrev" for torch.func.jacfwd and torch.func.jacrev, see _jacobian.
+            return_full_wirtinger_derivative (bool, optional): If specified "True" a jacobian wrt (z, z*) variables is
+                returned. Defaults to "False".
+            idxs (Tensor, optional): 1d int Tensor of parameter indexes to keep in jacobian. Defaults to "None".
+            output_slice (slice, optional): Slice of the model output samples to differentiate. Defaults to the whole output.
+            columns (Tensor, optional): 1d int Tensor of model.regression_matrix columns, which correspond to params.
+                If specified, jacobian is taken from model.regression_matrix instead of automatic differentiation. Defaults to "None".
+            holomorphic (bool, optional): If set "True", model output is implied to be holomorphic in complex parameters,
+                thus d / dz is computed w.r.t. complex parameters directly and d / dz* equals 0. Defaults to "False".
+
+        Returns:
+            Tensor: jacobian.
+        """
+        batch_size = model_input.size()[0]
+
+        if columns is not None:
+            # Model output is linear and holomorphic in parameters: d / dz equals regression matrix, d / dz* equals 0.
+            with torch.no_grad():
+                J = self._model.regression_matrix(model_input)[:, output_slice, :][..., columns]
+            if idxs is not None:
+                J = J[..., idxs]
+            if return_full_wirtinger_derivative:
+                J = torch.cat((J, torch.zeros_like(J)), dim=2)
+            return J
+
+        if holomorphic and _check_tensors_complex_any(params):
+            # For holomorphic output F(z): dF / dz = dF / dx, thus jacobian is taken w.r.t. real parts of the parameters only
+            imag_params = tuple(t.imag.detach() for t in params)
+
+            def f_x(*real_weights):
+                weights = tuple(re + 1.j * im for re, im in zip(real_weights, imag_params))
+                return self._with_weights(names, weights)(model_input)[..., output_slice]
+
+            J = _jacobian(f_x, tuple(t.real for t in params), vectorize, strategy)
+            J = torch.cat(tuple(j.view(batch_size, j.size()[2], -1) for j in J), dim=2)
+            if idxs is not None:
+                J = J[..., idxs]
+            if return_full_wirtinger_derivative:
+                J = torch.cat((J, torch.zeros_like(J)), dim=2)
+        elif _check_tensors_complex_any(params):# z = x + i * y
             real_params = tuple(t.real for t in params)
             num_real_params = len(real_params)
             imag_params = tuple(t.imag for t in params)
@@ -344,10 +607,9 @@ class Oracle(object):
             def f_x_y(*joint_weights):
                 weights = tuple(
                     re + 1.j * im for re, im in zip(joint_weights[:num_real_params], joint_weights[num_real_params:]))
-                load_weights(self._model, names, weights)
-                return self._model(signal_batch_input)
+                return self._with_weights(names, weights)(model_input)[..., output_slice]
 
-            J = torch.autograd.functional.jacobian(f_x_y, tuple(joint_params), create_graph=False, vectorize=vectorize, strategy=strategy)
+            J = _jacobian(f_x_y, tuple(joint_params), vectorize, strategy)
 
             J = tuple(j.view(batch_size, j.size()[2], -1) for j in J)
 
@@ -368,43 +630,90 @@ class Oracle(object):
                     J = ((J_x - 1.j * J_y) / 2.)[..., idxs]
         else:
             def f(*weights):
-                load_weights(self._model, names, weights)
-                return self._model(signal_batch_input)
+                return self._with_weights(names, weights)(model_input)[..., output_slice]
             
-            J = torch.autograd.functional.jacobian(f, tuple(params), create_graph=False, vectorize=vectorize, strategy=strategy)
+            J = _jacobian(f, tuple(params), vectorize, strategy)
             if idxs is None:
                 J = torch.cat(tuple(j.view(batch_size, j.size()[2], -1) for j in J), dim=2)
             else:
                 J = torch.cat(tuple(j.view(batch_size, j.size()[2], -1) for j in J), dim=2)[..., idxs]
+        return J
 
-        load_weights(self._model, names, params, is_nn_param=True)
+    def _accumulate_windowed_direction(self, model_input: Tensor, target: Tensor, names: List[str], params: TensorTuple,
+                                       window_size: int, window_context: int = 0, return_full_wirtinger_derivative: bool = False,
+                                       idxs: OptionalTensor = None, columns: OptionalTensor = None,
+                                       holomorphic: bool = False, accumulate_dtype: OptionalDtype = None,
+                                       vectorize: bool = True, strategy: str = 'forward-mode') -> Tuple[Tensor, Tensor]:
+        """
+        This method accumulates hessian (J^H @ J) and gradient (J^H @ e) window by window over the output samples,
+        so that jacobian is never stored for the whole batch: its size is [batch_size, window_size, model_parameter_number].
+        Each window of window_size output samples is calculated from the input window extended by window_context samples
+        on both sides. Input samples are taken cyclically, thus output coincides with the whole-batch output
+        for models, which make circular shifts (see model.layers.Delay) up to window_context samples.
+        Models which shorten signal (e.g. convolutions with padding='valid') are supported: input window is additionally
+        extended by the difference between input and target lengths.
 
-        J_H = torch.conj(torch.permute(J, (0, 2, 1)))            
-        
-        model_output = self._model(signal_batch_input)
+        Args:
+            model_input (Tensor): Model input signal.
+            target (Tensor): Target signal.
+            names (list of str): Names of the extracted parameters.
+            params (tuple of Tensor instances): Extracted parameters.
+            window_size (int): The number of output samples processed at once.
+            window_context (int, optional): The number of input samples, which are added to each side of the window.
+                Must not be lower than model receptive field half-width. Defaults to 0.
+            return_full_wirtinger_derivative (bool, optional): If specified "True" a jacobian wrt (z, z*) variables is
+                used. Defaults to "False".
+            idxs (Tensor, optional): 1d int Tensor of parameter indexes to keep in jacobian. Defaults to "None".
+            columns (Tensor, optional): 1d int Tensor of model.regression_matrix columns, see _output_jacobian. Defaults to "None".
+            holomorphic (bool, optional): Whether model output is holomorphic in parameters, see _output_jacobian.
+                Defaults to "False".
+            accumulate_dtype (torch.dtype, optional): Dtype of hessian and gradient accumulation, see
+                direction_through_jacobian. Defaults to "None": model dtype.
+            vectorize (bool, optional): vectorize flag of the jacobian strategy, see _output_jacobian. Defaults to "True".
+            strategy (str, optional): Jacobian strategy, see _output_jacobian. Defaults to "forward-mode", which memory
+                is proportional to window_size.
 
-        error_vec = torch.permute(model_output - signal_batch_output, (0, 2, 1))
+        Returns:
+            Tensor: hessian.
+            Tensor: gradient.
+        """
+        if window_context is None:
+            window_context = 0
+        input_size = model_input.size()[-1]
+        output_size = target.size()[-1]
+        shrink = input_size - output_size
+        hess, grad = None, None
+        for start in range(0, output_size, window_size):
+            stop = min(start + window_size, output_size)
+            window_ind = torch.arange(start - window_context, stop + shrink + window_context, device=model_input.device) % input_size
+            window_input = model_input[..., window_ind]
+            output_slice = slice(window_context, window_context + stop - start)
 
-        grad = torch.bmm(J_H, error_vec)
-        hess = torch.bmm(J_H, J)
+            with self._profiler.phase('jacobian'):
+                J = self._output_jacobian(window_input, names, params, vectorize, strategy, return_full_wirtinger_derivative,
+                                          idxs, output_slice, columns, holomorphic)
 
-        grad = torch.sum(grad, keepdim=False, dim=0)
-        hess = torch.sum(hess, keepdim=False, dim=0)
+            with torch.no_grad(), self._profiler.phase('gram'):
+                model_output = self._with_weights(names, params)(window_input)[..., output_slice]
 
-        grad.detach_()
-        hess.detach_()
-        J = J.detach()
-        J_H = J_H.detach()
-        error_vec = error_vec.detach()
-        del J
-        del J_H
-        del error_vec
+                error_vec = torch.permute(model_output - target[..., start:stop], (0, 2, 1))
+                if accumulate_dtype is not None:
+                    J = J.to(torch.promote_types(J.dtype, accumulate_dtype))
+                    error_vec = error_vec.to(torch.promote_types(error_vec.dtype, accumulate_dtype))
+                J_H = torch.conj(torch.permute(J, (0, 2, 1)))
+
+                delta_grad = torch.sum(torch.bmm(J_H, error_vec), keepdim=False, dim=0)
+                delta_hess = torch.sum(torch.bmm(J_H, J), keepdim=False, dim=0)
+                if hess is None:
+                    hess, grad = delta_hess, delta_grad
+                else:
+                    hess += delta_hess
+                    grad += delta_grad
+            del J, J_H, error_vec, delta_hess, delta_grad
 
         torch.cuda.empty_cache()
-        
-        if compute_fn_val:
-            return loss_val, hess, grad.view(-1)
-        return hess, grad.view(-1) 
+
+        return hess.detach(), grad.detach()
 
     @torch.enable_grad()
     def hessian(self, signal_batch: BatchType, weight_names: StrOrList = None, compute_fn_val: bool = False,
@@ -443,7 +752,7 @@ class Oracle(object):
         if compute_fn_val:
             loss_val = self.loss_function_val(signal_batch)
         
-        params, names = extract_weights(self._model, weight_names)
+        params, names = self._extract_weights(weight_names)
         
         def _reshape_param_tensor_tuple(row_id, tensor_tuple):
             row_size = params[row_id].numel()
@@ -462,8 +771,7 @@ class Oracle(object):
             def f_xx_xy_yy(*joint_weights):
                 weights = tuple(
                     re + 1.j * im for re, im in zip(joint_weights[:num_real_params], joint_weights[num_real_params:]))
-                load_weights(self._model, names, weights)
-                return self._loss_fn(self._model, signal_batch)
+                return self._loss_fn(self._with_weights(names, weights), signal_batch)
             
             H_res = torch.autograd.functional.hessian(f_xx_xy_yy, tuple(joint_params), create_graph=False, vectorize=vectorize,
                                                       outer_jacobian_strategy=outer_jacobian_strategy)
@@ -508,8 +816,7 @@ class Oracle(object):
                     H = ((H_res_xx + H_res_yy + 1.j * (H_res_yx - H_res_xy)) / 4.)[idxs[:, None], idxs]
         else:
             def f(*weights):
-                load_weights(self._model, names, weights)
-                return self._loss_fn(self._model, signal_batch)
+                return self._loss_fn(self._with_weights(names, weights), signal_batch)
         
             H_res = torch.autograd.functional.hessian(f, tuple(params), create_graph=False, vectorize=vectorize,
                                                       outer_jacobian_strategy=outer_jacobian_strategy)
@@ -520,7 +827,7 @@ class Oracle(object):
                 H = torch.cat(tuple(torch.cat(_reshape_param_tensor_tuple(row, h_row), dim=1)\
                               for row, h_row in enumerate(H_res)), dim=0)[idxs[:, None], idxs]
             
-        load_weights(self._model, names, params, is_nn_param=True)
+        self._restore_weights(names, params)
         self._model.zero_grad()
         
         if compute_fn_val:
@@ -560,7 +867,7 @@ class Oracle(object):
         if compute_fn_val:
             loss_val = self.loss_function_val(signal_batch)
         
-        params, names = extract_weights(self._model, weight_names)
+        params, names = self._extract_weights(weight_names)
 
         if _check_tensors_complex_any(params):# z = x + i * y
             real_params = tuple(t.real for t in params)
@@ -571,8 +878,7 @@ class Oracle(object):
             def f_x_y(*joint_weights):
                 weights = tuple(
                     re + 1.j * im for re, im in zip(joint_weights[:num_real_params], joint_weights[num_real_params:]))
-                load_weights(self._model, names, weights)
-                return self._loss_fn(self._model, signal_batch)
+                return self._loss_fn(self._with_weights(names, weights), signal_batch)
 
             J = torch.autograd.functional.jacobian(f_x_y, tuple(joint_params), strategy=strategy, create_graph=False, vectorize=vectorize)
 
@@ -599,8 +905,7 @@ class Oracle(object):
                     J = ((J_x + 1.j * J_y) / 2.)[:, idxs]
         else:
             def f(*weights):
-                load_weights(self._model, names, weights)
-                return self._loss_fn(self._model, signal_batch)
+                return self._loss_fn(self._with_weights(names, weights), signal_batch)
             
             J = torch.autograd.functional.jacobian(f, tuple(params), strategy=strategy, create_graph=False, vectorize=vectorize)
             if idxs is None:
@@ -608,7 +913,7 @@ class Oracle(object):
             else:
                 J = torch.cat(tuple(j.contiguous().view(1, -1) for j in J), dim=1)[:, idxs]
 
-        load_weights(self._model, names, params, is_nn_param=True)
+        self._restore_weights(names, params)
         self._model.zero_grad()
         
         if compute_fn_val:
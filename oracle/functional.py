@@ -0,0 +1,127 @@
+import torch
+from torch import nn, Tensor
+from torch.func import functional_call, grad, vmap
+
+from typing import Callable, Dict, List, Tuple
+
+from .base import Oracle, BatchType, StrOrList, TensorTuple
+
+TensorDict = Dict[str, Tensor]
+
+
+class _FunctionalModel:
+    """
+    Callable wrapper of the module, which evaluates it with substituted named tensors by torch.func.functional_call.
+    Other attributes are taken from the module, thus the wrapper could be passed to loss functions instead of the module.
+    """
+    def __init__(self, module: nn.Module, tensors: TensorDict):
+        self.module = module
+        self.tensors = tensors
+
+    def __call__(self, *args, **kwargs):
+        return functional_call(self.module, self.tensors, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+class FunctionalOracle(Oracle):
+    """
+    Oracle backend built on torch.func: parameters are treated as a pytree (dictionary of named tensors), which is passed
+    to the model by torch.func.functional_call. In contrast to Oracle, parameters are never removed from the model
+    and loaded back (see extract_weights and load_weights): model keeps the same nn.Parameter objects, thus references
+    to them (optimizers, utils.Evaluator cache, hooks) stay valid and no attributes are deleted and reassigned on each call.
+
+    Pure functional form of the model allows batched evaluation of loss function and its gradient for several parameter
+    vectors at once by torch.func.vmap, see batched_loss_function_val and batched_gradient.
+
+    Note that functional_call substitutes module tensors only for the duration of the call, thus derivatives could be
+    computed concurrently with model evaluations in other threads only by separate oracles with inplace_copy_model=True.
+    """
+    def _named_params(self, weight_names: StrOrList = None) -> TensorDict:
+        named_params = dict(self._model.named_parameters())
+        if weight_names is None:
+            return named_params
+        if isinstance(weight_names, str):
+            weight_names = [weight_names]
+        return {name: named_params[name] for name in weight_names}
+
+    def _extract_weights(self, weight_names: StrOrList = None) -> Tuple[TensorTuple, List[str]]:
+        """
+        Returns differentiable copies of the parameters and their names. The model is not modified.
+        """
+        named_params = self._named_params(weight_names)
+        return tuple(p.detach().requires_grad_() for p in named_params.values()), list(named_params.keys())
+
+    def _restore_weights(self, names: List[str], params: TensorTuple) -> None:
+        """
+        Nothing to restore: parameters are never removed from the model.
+        """
+        pass
+
+    def _with_weights(self, names: List[str], weights: TensorTuple) -> Callable:
+        """
+        Returns callable, which evaluates the model with weights as its named parameters by torch.func.functional_call.
+        """
+        return _FunctionalModel(self._model, dict(zip(names, weights)))
+
+    def params_pytree(self, flat_params: Tensor, weight_names: StrOrList = None) -> TensorDict:
+        """
+        Converts 1d vector of the parameters into the dictionary of named tensors of the parameters shapes.
+        Inverse of get_flat_params.
+
+        Args:
+            flat_params (Tensor): 1d Tensor of the model parameters.
+            weight_names (str or list of str, optional): Names of the parameters stored in flat_params. Defaults to "None",
+                which means all parameters.
+
+        Returns:
+            Dictionary of named parameters tensors.
+        """
+        pytree, offset = {}, 0
+        for name, p in self._named_params(weight_names).items():
+            pytree[name] = flat_params[offset:offset + p.numel()].reshape(p.shape)
+            offset += p.numel()
+        return pytree
+
+    def _pytree_loss(self, flat_params: Tensor, signal_batch: BatchType, weight_names: StrOrList = None) -> Tensor:
+        return self._loss_fn(_FunctionalModel(self._model, self.params_pytree(flat_params, weight_names)), signal_batch)
+
+    def batched_loss_function_val(self, signal_batch: BatchType, flat_params_batch: Tensor,
+                                  weight_names: StrOrList = None) -> Tensor:
+        """
+        Computes loss function values for several parameter vectors at once by torch.func.vmap. The model is not modified.
+
+        Args:
+            signal_batch (tuple of Tensor instances): The batch of signals used to compute model quality.
+            flat_params_batch (Tensor): 2d Tensor of shape [number of parameter vectors, number of parameters], each row
+                is 1d vector of parameters as returned by get_flat_params.
+            weight_names (str or list of str, optional): Names of the parameters stored in flat_params_batch rows,
+                other parameters are taken from the model. Defaults to "None", which means all parameters.
+
+        Returns:
+            Tensor: 1d Tensor of loss function values. This value is nondifferentiable.
+        """
+        with torch.no_grad():
+            return vmap(self._pytree_loss, in_dims=(0, None, None))(flat_params_batch, signal_batch, weight_names)
+
+    def batched_gradient(self, signal_batch: BatchType, flat_params_batch: Tensor, weight_names: StrOrList = None) -> Tensor:
+        """
+        Computes loss function gradients for several parameter vectors at once by torch.func.vmap of torch.func.grad.
+        For complex parameters d / dz* is returned, as by the gradient method. The model is not modified.
+
+        Args:
+            signal_batch (tuple of Tensor instances): The batch of signals used to compute model quality.
+            flat_params_batch (Tensor): 2d Tensor of shape [number of parameter vectors, number of parameters], each row
+                is 1d vector of parameters as returned by get_flat_params.
+            weight_names (str or list of str, optional): Names of the parameters stored in flat_params_batch rows,
+                other parameters are taken from the model. Defaults to "None", which means all parameters.
+
+        Returns:
+            Tensor: 2d Tensor of gradients, one row per parameter vector.
+        """
+        grads = vmap(grad(self._pytree_loss), in_dims=(0, None, None))(flat_params_batch, signal_batch, weight_names)
+        # For complex z autograd returns conjugate Wirtinger derivative scaled by 2: dL / dx + 1j * dL / dy = 2 * dL / dz*
+        if torch.is_complex(grads):
+            grads = grads / 2.
+        return grads.detach()
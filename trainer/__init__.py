@@ -1 +1,2 @@
-from .train_choose import train
\ No newline at end of file
+from .train_choose import train
+from .compile import compile_model, uncompile_model, CompiledForward
\ No newline at end of file
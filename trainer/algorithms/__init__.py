@@ -1,3 +1,8 @@
 from .mixed_newton_levenb_marq import train_mixed_newton_levenb_marq
 from .sgd_auto import train_sgd_auto
-from .ls import train_ls
\ No newline at end of file
+from .ls import train_ls
+from .hessian_solver import HessianSolver
+from .evaluator import Evaluator
+from .parallel_accumulator import ParallelGramAccumulator
+from .damping import GainRatioDamping
+from .stopping import StoppingCriteria, MaxEpochs, GradNorm, RelativeImprovement, TimeBudget, MaxEvaluations
\ No newline at end of file
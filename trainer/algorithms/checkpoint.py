@@ -0,0 +1,65 @@
+import random
+import numpy as np
+import torch
+
+import sys
+sys.path.append('../../')
+
+from utils import AsyncWriter
+
+
+def rng_state() -> dict:
+    """
+    Returns states of python, numpy, torch CPU and CUDA random generators.
+    """
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state: dict):
+    """
+    Restores states of random generators returned by rng_state.
+    """
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def save_checkpoint(writer: AsyncWriter, path: str, algorithm: str, epoch: int, **state):
+    """
+    Saves full training state in the background by writer, together with random generators states.
+    Tensors are snapshotted at the call, thus training could proceed immediately.
+
+    Args:
+        writer (utils.AsyncWriter): Writer of the training products.
+        path (str): Checkpoint file path.
+        algorithm (str): Training algorithm name, which is checked on resume, e.g. 'mnm_lev_marq'.
+        epoch (int): The number of finished epochs, training is resumed from the next one.
+        **state: Training algorithm state: model and optimizer state dictionaries, algorithm parameters,
+            learning curves etc.
+    """
+    writer.save_object({'algorithm': algorithm, 'epoch': epoch, 'rng': rng_state(), **state}, path)
+
+
+def load_checkpoint(path: str, algorithm: str) -> dict:
+    """
+    Loads checkpoint saved by save_checkpoint and restores random generators states.
+
+    Args:
+        path (str): Checkpoint file path.
+        algorithm (str): Training algorithm name, which must match the name of the checkpoint.
+
+    Returns:
+        Dictionary of the training state.
+    """
+    # Checkpoint contains python objects (random generators states, learning curves), thus it isn`t weights only
+    checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+    assert checkpoint['algorithm'] == algorithm, \
+        f"Checkpoint of \'{checkpoint['algorithm']}\' algorithm can`t be resumed by \'{algorithm}\'."
+    set_rng_state(checkpoint['rng'])
+    print(f"Training is resumed from {path}, epoch {checkpoint['epoch']}.")
+    return checkpoint
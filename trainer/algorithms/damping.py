@@ -0,0 +1,83 @@
+import torch
+from torch import Tensor
+
+
+class GainRatioDamping:
+    """
+    The class controls regularization (damping) parameter alpha of Levenberg–Marquardt step (H + alpha * maxH * I)^(-1) * grad
+    by the gain ratio rho = actual / predicted loss function reduction, as in trust-region methods.
+
+    Predicted reduction is given by the model linearization, which is already available from the mixed Hessian accumulation:
+    for the loss function L(x) = ||e||^2, step d, hessian H = J^H @ J and gradient g = J^H @ e
+        L(x + d) ~ ||e + J @ d||^2 = L(x) + 2 * Re(d^H @ g) + d^H @ H @ d,
+    thus predicted reduction is -(2 * Re(d^H @ g) + d^H @ H @ d). Actual reduction requires one loss function evaluation.
+
+    Step is accepted if rho > eta. Then alpha is decreased by factor max(1 / 3, 1 - (2 * rho - 1)^3), so that
+    steps with good linear prediction (rho ~ 1) decrease regularization three times, while poor ones keep it almost the same.
+    Otherwise alpha is multiplied by nu, which is doubled after each consecutive rejection (Nielsen`s update),
+    alpha is limited by max_alpha.
+
+    Near the minimum predicted reduction falls to the level of loss function rounding errors, where gain ratio is meaningless.
+    If predicted reduction is lower than rtol * loss, then step is accepted if it doesn`t increase loss function
+    by more than rtol * loss, and alpha is kept.
+    """
+    def __init__(self, alpha: float = 1., eta: float = 1e-3, rtol: float = 1e-10, max_alpha: float = 1e+16):
+        """
+        Constructor of the GainRatioDamping class.
+
+        Args:
+            alpha (float): Initial damping parameter. Defaults to 1.
+            eta (float): Minimal gain ratio of the accepted step. Defaults to 1e-3.
+            rtol (float): Relative to loss function value tolerance of the reduction. Defaults to 1e-10.
+            max_alpha (float): Maximal damping parameter. Defaults to 1e+16.
+        """
+        self.alpha = alpha
+        self.eta = eta
+        self.rtol = rtol
+        self.max_alpha = max_alpha
+        self.nu = 2.
+        self.rho = None
+
+    def state_dict(self) -> dict:
+        """
+        Returns damping parameter, its multiplier and the last gain ratio for resume.
+        """
+        return {'alpha': self.alpha, 'nu': self.nu, 'rho': self.rho}
+
+    def load_state_dict(self, state: dict):
+        self.alpha, self.nu, self.rho = state['alpha'], state['nu'], state['rho']
+
+    @staticmethod
+    def predicted_reduction(hess: Tensor, grad: Tensor, direction: Tensor) -> float:
+        """
+        Returns loss function reduction predicted by the model linearization for the step direction.
+        """
+        return -(2 * torch.vdot(direction, grad).real + torch.vdot(direction, hess @ direction).real).item()
+
+    def update(self, loss_val: float, trial_loss_val: float, predicted_reduction: float) -> bool:
+        """
+        Updates damping parameter by the gain ratio of the trial step.
+
+        Args:
+            loss_val (float): Loss function value at the current point.
+            trial_loss_val (float): Loss function value at the trial point.
+            predicted_reduction (float): Predicted reduction, see predicted_reduction method.
+
+        Returns:
+            bool: Whether the trial step is accepted.
+        """
+        tol = self.rtol * abs(loss_val)
+        if predicted_reduction <= tol:
+            self.rho = None
+            accepted = trial_loss_val <= loss_val + tol
+        else:
+            self.rho = (loss_val - trial_loss_val) / predicted_reduction
+            accepted = self.rho > self.eta
+            if accepted:
+                self.alpha *= max(1. / 3., 1. - (2. * self.rho - 1.) ** 3)
+        if accepted:
+            self.nu = 2.
+            return True
+        self.alpha = min(self.alpha * self.nu, self.max_alpha)
+        self.nu *= 2.
+        return False
@@ -0,0 +1,156 @@
+import torch
+from torch import nn, Tensor
+from typing import Tuple, Union, Callable, Iterable
+
+import sys
+sys.path.append('../../')
+
+from utils import Profiler
+
+OptionalProfiler = Union[Profiler, None]
+LossFnType = Union[Callable[[nn.Module, Tensor], Tensor], Callable[[nn.Module, Tuple[Tensor, ...]], Tensor]]
+
+class Evaluator:
+    """
+    The class computes loss function and quality criterion values of the model on datasets and memoizes them
+    per dataset and model parameters version. Training algorithms evaluate the model on train, validation and test datasets,
+    which are the same in full-batch mode. Thus evaluation on identical datasets with unchanged parameters is performed once.
+
+    Datasets are identical if they are the same object or if they are dataloaders of utils.ResampleDataset with the same
+    underlying tensors (memory address, shape, strides, dtype, device and version counter) and batch size.
+    Parameters version is determined by the model parameters and buffers objects and their version counters, which are
+    increased by any in-place modification (optimizer step, Oracle.set_flat_params etc.). Cached datasets and parameters
+    are kept referenced, so their ids can`t be reused by other objects while entry exists.
+
+    If quality_criterion provides fused evaluation method evaluate(model, dataset) (see utils.NMSECriterion), then loss function,
+    target power and quality criterion are obtained from a single forward pass per batch. Otherwise loss function is accumulated
+    over batches and quality_criterion is called separately.
+
+    Method loss returns only loss function value, e.g. for trial steps of the line search. For fused quality criterion
+    it is the same single forward pass per batch. Otherwise quality criterion is not computed until metrics are requested
+    for the same dataset and parameters.
+
+    Attribute evaluations counts evaluations on the whole dataset, which are not taken from the cache
+    (see trainer.algorithms.MaxEvaluations).
+    """
+    def __init__(self, model: nn.Module, loss_fn: LossFnType, quality_criterion: LossFnType, profiler: OptionalProfiler = None):
+        """
+        Constructor of the Evaluator class.
+
+        Args:
+            model (nn.Module): The model to evaluate.
+            loss_fn (Callable): The function used to compute model quality. Takes nn.Module and tuple of two Tensor
+                instances. Returns Tensor scalar.
+            quality_criterion (Callable): The function used to compute model quality on the whole dataset.
+                Takes nn.Module and dataset. Returns float. If it has evaluate method (e.g. utils.NMSECriterion), then loss_fn
+                must be its loss method, since loss function values are taken from evaluate.
+            profiler (utils.Profiler, optional): Profiler, which measures phase 'evaluation' and counts cache hits
+                ('evaluation_cache_hits'). Defaults to "None".
+        """
+        assert not hasattr(quality_criterion, 'evaluate') or loss_fn == quality_criterion.loss, \
+            "loss_fn must be quality_criterion.loss for the quality criterion with evaluate method."
+        self.model = model
+        self.loss_fn = loss_fn
+        self.quality_criterion = quality_criterion
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self.entries = {}
+        self.evaluations = 0
+
+    @staticmethod
+    def _dataset_key(dataset: Iterable) -> tuple:
+        data = getattr(getattr(dataset, 'dataset', None), 'data', None)
+        if isinstance(data, tuple) and all(isinstance(t, Tensor) for t in data):
+            return tuple((t.data_ptr(), tuple(t.shape), tuple(t.stride()), t.dtype, str(t.device), t._version) for t in data) + \
+                   (dataset.dataset.batch_size,)
+        return (id(dataset),)
+
+    def _params_state(self) -> Tuple[tuple, tuple]:
+        tensors = tuple(self.model.parameters()) + tuple(self.model.buffers())
+        return tensors, tuple(t._version for t in tensors)
+
+    def _is_valid(self, entry: tuple, tensors: tuple, versions: tuple) -> bool:
+        entry_tensors, entry_versions = entry[1], entry[2]
+        return len(entry_tensors) == len(tensors) and entry_versions == versions and \
+            all(a is b for a, b in zip(entry_tensors, tensors))
+
+    @torch.no_grad()
+    def metrics(self, dataset: Iterable) -> dict:
+        """
+        Returns dictionary of model quality metrics on the dataset: accumulated over all batches loss function value ('loss')
+        and quality criterion value ('nmse'). Fused quality criterion could provide additional metrics, e.g. 'target_power'.
+        Values are computed only if the dataset or the model parameters changed since the last evaluation of the identical dataset.
+
+        Args:
+            dataset (Iterable): Batched dataset.
+
+        Returns:
+            Dictionary of metrics.
+        """
+        key = self._dataset_key(dataset)
+        tensors, versions = self._params_state()
+        entry = self.entries.get(key)
+        if entry is not None and self._is_valid(entry, tensors, versions) and 'nmse' in entry[3]:
+            self.profiler.count('evaluation_cache_hits')
+            return entry[3]
+        with self.profiler.phase('evaluation'):
+            if hasattr(self.quality_criterion, 'evaluate'):
+                self.evaluations += 1
+                result = self.quality_criterion.evaluate(self.model, dataset)
+            else:
+                if entry is not None and self._is_valid(entry, tensors, versions):
+                    # Loss function value is already computed by loss method
+                    self.profiler.count('evaluation_cache_hits')
+                    loss_val = entry[3]['loss']
+                else:
+                    loss_val = self._accumulate_loss(dataset)
+                result = {'loss': loss_val, 'nmse': self.quality_criterion(self.model, dataset)}
+        self.entries[key] = (dataset, tensors, versions, result)
+        return result
+
+    def _accumulate_loss(self, dataset: Iterable) -> float:
+        self.evaluations += 1
+        loss_val = 0
+        for batch in dataset:
+            loss_val += self.loss_fn(self.model, batch).item()
+        return loss_val
+
+    @torch.no_grad()
+    def loss(self, dataset: Iterable) -> float:
+        """
+        Returns loss function value, accumulated over all batches of the dataset. Quality criterion is computed only if
+        it is fused with loss function (costs no additional forward passes).
+
+        Args:
+            dataset (Iterable): Batched dataset.
+
+        Returns:
+            float: loss function value.
+        """
+        if hasattr(self.quality_criterion, 'evaluate'):
+            return self.metrics(dataset)['loss']
+        key = self._dataset_key(dataset)
+        tensors, versions = self._params_state()
+        entry = self.entries.get(key)
+        if entry is not None and self._is_valid(entry, tensors, versions):
+            self.profiler.count('evaluation_cache_hits')
+            return entry[3]['loss']
+        with self.profiler.phase('evaluation'):
+            result = {'loss': self._accumulate_loss(dataset)}
+        self.entries[key] = (dataset, tensors, versions, result)
+        return result['loss']
+
+    def __call__(self, dataset: Iterable) -> Tuple[float, float]:
+        """
+        Returns loss function value, accumulated over all batches of the dataset, and quality criterion value.
+
+        Args:
+            dataset (Iterable): Batched dataset.
+
+        Returns:
+            Tuple of loss function value (float) and quality criterion value (float).
+        """
+        metrics = self.metrics(dataset)
+        return metrics['loss'], metrics['nmse']
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,79 @@
+import torch
+from torch import Tensor
+from typing import Union
+
+OptionalTensor = Union[Tensor, None]
+
+class HessianSolver:
+    """
+    The class solves linear systems (H + shift * I) @ direction = -grad with Hermitian positive semi-definite
+    mixed Hessian H, which are solved in Levenberg–Marquardt and LS steps of Mixed Newton Method.
+    Several shifts (regularization values) could be tried with the same H and grad, thus expensive factorization is
+    performed once in the constructor, when possible.
+
+    Supported methods:
+        'eigh' -- H is eigendecomposed once: H = V @ diag(lambda) @ V^H. Each direction is computed as
+            -V @ diag(1 / (lambda + shift)) @ V^H @ grad, i.e. each new shift costs only matrix-vector products.
+            Eigenvalues lower than rcond * max(|lambda + shift|) are treated as zeros, as in torch.linalg.pinv.
+        'cholesky' -- Each shift requires Cholesky factorization of (H + shift * I), which is several times cheaper than
+            eigendecomposition. If factorization fails (matrix is not positive definite numerically), then solution falls back
+            to torch.linalg.pinv.
+        'pinv' -- Each shift requires torch.linalg.pinv of (H + shift * I). Previous implementation, which is kept for reference.
+    """
+    def __init__(self, hess: Tensor, grad: Tensor, method: str = 'eigh', rcond: float = 1e-40):
+        """
+        Constructor of the HessianSolver class.
+
+        Args:
+            hess (Tensor): 2d Hermitian Tensor, mixed Hessian.
+            grad (Tensor): 1d Tensor, gradient.
+            method (str): Solution method: 'eigh', 'cholesky' or 'pinv'. Defaults to 'eigh'.
+            rcond (float): Relative cutoff for small eigen/singular values. Defaults to 1e-40.
+        """
+        assert method in ['eigh', 'cholesky', 'pinv'], \
+            f"Solver method must be one of: \'eigh\', \'cholesky\', \'pinv\', but \'{method}\' is given."
+        self.hess = hess
+        self.grad = grad
+        self.method = method
+        self.rcond = rcond
+        self.eigvals = None
+        self.eigvecs = None
+        self.proj_grad = None
+        if method == 'eigh':
+            self.eigvals, self.eigvecs = torch.linalg.eigh(hess)
+            self.proj_grad = torch.conj(self.eigvecs.T) @ grad
+
+    @torch.no_grad()
+    def cond(self) -> float:
+        """
+        Returns 2-norm condition number of the Hessian. For Hermitian matrix it equals ratio of maximal and minimal
+        eigenvalues absolute values, thus no SVD is required.
+        """
+        if self.eigvals is None:
+            self.eigvals = torch.linalg.eigvalsh(self.hess)
+        eigvals_abs = self.eigvals.abs()
+        return (eigvals_abs.max() / eigvals_abs.min()).item()
+
+    @torch.no_grad()
+    def direction(self, shift: float = 0.) -> Tensor:
+        """
+        Computes step direction: -(H + shift * I)^(-1) @ grad.
+
+        Args:
+            shift (float): Value added to the Hessian diagonal. Defaults to 0.
+
+        Returns:
+            Tensor: 1d Tensor of direction.
+        """
+        if self.method == 'eigh':
+            shifted = self.eigvals + shift
+            shifted_abs = shifted.abs()
+            inv = torch.where(shifted_abs > self.rcond * shifted_abs.max(), 1. / shifted, torch.zeros_like(shifted))
+            return -1. * self.eigvecs @ (inv * self.proj_grad)
+        regul = shift * torch.eye(self.hess.size()[0], device=self.hess.device, dtype=self.hess.dtype)
+        if self.method == 'cholesky':
+            L, info = torch.linalg.cholesky_ex(self.hess + regul)
+            if info.item() == 0:
+                return -1. * torch.cholesky_solve(self.grad[:, None], L).view(-1)
+        hess_inv = torch.linalg.pinv(self.hess + regul, rcond=self.rcond, hermitian=True)
+        return -1. * hess_inv @ self.grad
@@ -6,12 +6,18 @@ import numpy as np
 import sys
 sys.path.append('../../')
 
-from utils import Timer
-from oracle import Oracle
+from utils import Timer, Profiler, AsyncWriter
+from oracle import Oracle, FunctionalOracle, ACCUMULATE_DTYPES
+from .hessian_solver import HessianSolver
+from .evaluator import Evaluator
+from .stopping import StoppingCriteria
+from .checkpoint import save_checkpoint, load_checkpoint
+from .parallel_accumulator import ParallelGramAccumulator
 
 OptionalInt = Union[int, None]
 OptionalStr = Union[str, None]
 StrOrList = Union[str, List[str], Tuple[str], None]
+OptionalDict = Union[dict, None]
 DataLoaderType = torch.utils.data.dataloader.DataLoader
 LossFnType = Union[Callable[[nn.Module, Tensor], Tensor], Callable[[nn.Module, Tuple[Tensor, ...]], Tensor]]
 BatchTensorType = Callable[[Tensor], Tuple[Tensor, ...]]
@@ -19,7 +25,8 @@ BatchTensorType = Callable[[Tensor], Tuple[Tensor, ...]]
 def train_ls(model: nn.Module, train_dataset: DataLoaderType, validate_dataset: DataLoaderType, 
                                    test_dataset: DataLoaderType, loss_fn: LossFnType, quality_criterion: LossFnType, 
                                    batch_to_tensors: BatchTensorType, chunk_num: OptionalInt = None, 
-                                   save_path: OptionalStr = None, exp_name: OptionalStr = None, weight_names: StrOrList = None):
+                                   save_path: OptionalStr = None, exp_name: OptionalStr = None, weight_names: StrOrList = None,
+                                   config_train: OptionalDict = None, resume: OptionalStr = None):
     """
     Function implements LS algorithm as 1 step of Mixed Newton Method. Mixed Newton implies computation of 
     the mixed Hessian and gradient multiplication each algorithm step. Current function uses oracle.Oracle.direction_through_jacobian
@@ -57,94 +64,195 @@ def train_ls(model: nn.Module, train_dataset: DataLoaderType, validate_dataset:
         exp_name (str, optional): Name of simulation, which is reflected in function product names. Defaults to "None".
         weight_names (str or list of str, optional): By spceifying `weight_names` it is possible to compute gradient only
             for several named parameters. Defaults to "None".
+        config_train (dictionary, optional): Dictionary with configurations of training procedure. Following keys are used:
+            'jacobian_window_size' (int) -- the number of samples to accumulate hessian and gradient over at once
+                (see window_size in oracle.Oracle.direction_through_jacobian). Defaults to "None": whole batch at once.
+            'jacobian_window_context' (int) -- model receptive field half-width, see window_context in
+                oracle.Oracle.direction_through_jacobian. Defaults to "None".
+            'analytic_jacobian' (bool) -- whether to take jacobian from model.regression_matrix without automatic
+                differentiation. Defaults to "True" for models, which have regression_matrix method (linear in parameters).
+            'jacobian_autotune' (bool) -- whether to choose jacobian computation strategy by micro-benchmarks on the first
+                batch, see autotune in oracle.Oracle.direction_through_jacobian. Defaults to "False".
+            'holomorphic_jacobian' (bool) -- whether model output is holomorphic in complex parameters, thus jacobian is
+                computed with half the tangent evaluations, see holomorphic in oracle.Oracle.direction_through_jacobian.
+                Defaults to model.holomorphic attribute if it exists, otherwise "False".
+            'oracle_backend' (str) -- 'autograd' for oracle.Oracle, which removes parameters from the model while computing
+                derivatives, or 'functional' for oracle.FunctionalOracle based on torch.func.functional_call.
+                Defaults to 'autograd'.
+            'gram_workers' (int) -- the number of worker processes, which accumulate hessian and gradient over train_dataset
+                batches in parallel on CPU, see trainer.algorithms.ParallelGramAccumulator. Defaults to 0: serial accumulation.
+                Workers always accumulate over the whole train_dataset, thus chunk_num must be not less than len(train_dataset).
+            'gram_threads' (int) -- the number of torch threads per worker. Defaults to cpu_count // gram_workers.
+            'solver' (str) -- method of LS step calculation: 'eigh', 'cholesky' or 'pinv',
+                see trainer.algorithms.HessianSolver. Defaults to 'eigh'.
+            'mixed_precision' (bool) -- whether to compute hessian and gradient in double precision for the model in single
+                precision (built with dtype=torch.complex64 or torch.float32): model forward and jacobian chunks are computed
+                in model dtype, while hessian and gradient are accumulated and the step is solved in double precision,
+                see accumulate_dtype in oracle.Oracle.direction_through_jacobian. Defaults to "False".
+            'epochs' (int) -- number of LS steps. Defaults to 1.
+            'min_grad_norm', 'stop_window', 'stop_min_improvement', 'stop_monitor', 'time_budget', 'max_evaluations' --
+                criteria to stop before epochs are done, see trainer.algorithms.StoppingCriteria.from_config.
+                Defaults to "None": disabled.
+            'checkpoint_every' (int) -- period in epochs of saving training state (parameters, stopping criteria and random
+                generators states) to the file save_path + 'checkpoint' + exp_name + '.pt', which could be passed as resume
+                argument. Defaults to "None": checkpoints are not saved.
+            'async_writer' (bool) -- whether to write weights in the background thread, see utils.AsyncWriter.
+                Defaults to "True".
+            'profile' (bool) -- whether to write per-epoch phases timings ('jacobian', 'gram', 'solve', 'evaluation'),
+                forward passes count and peak memory to the file save_path + 'profile' + exp_name + '.jsonl',
+                see utils.Profiler. Defaults to "False".
+            Defaults to "None".
+        resume (str, optional): Path of the checkpoint to continue training from. Training is continued from the epoch next
+            to the checkpoint one. Defaults to "None".
 
     Returns:
         Learning curve (list), containing quality criterion calculated each epoch of learning.
     """
+    # Initialize Mixed-Newton oracle
+    if config_train is None:
+        config_train = {}
+
     # Initialize number of Mixed Newton steps. For LS epochs = 1 for LS. 
-    # For debugging epochs could be increased
-    epochs = 1
+    # For debugging epochs could be increased by config_train['epochs']
+    stopping = StoppingCriteria.from_config(config_train, epochs=1)
+    epochs = stopping.epochs
+    window_size = config_train.get('jacobian_window_size', None)
+    window_context = config_train.get('jacobian_window_context', None)
+    analytic_jacobian = config_train.get('analytic_jacobian', hasattr(model, 'regression_matrix'))
+    autotune = config_train.get('jacobian_autotune', False)
+    holomorphic = config_train.get('holomorphic_jacobian', getattr(model, 'holomorphic', False))
+    oracle_backend = config_train.get('oracle_backend', 'autograd')
+    assert oracle_backend in ['autograd', 'functional'], "oracle_backend must be 'autograd' or 'functional'."
+    gram_workers = config_train.get('gram_workers', 0)
+    solver_method = config_train.get('solver', 'eigh')
+    profiler = Profiler(model, save_path + f'profile{exp_name}.jsonl', enabled=config_train.get('profile', False),
+                        append=resume is not None)
+    checkpoint_every = config_train.get('checkpoint_every', None)
+    accumulate_dtype = ACCUMULATE_DTYPES[next(model.parameters()).dtype] if config_train.get('mixed_precision', False) else None
+    writer = AsyncWriter(asynchronous=config_train.get('async_writer', True))
 
-    # Initialize Mixed-Newton oracle
-    SICOracle = Oracle(model, loss_fn)
+    if oracle_backend == 'functional':
+        SICOracle = FunctionalOracle(model, loss_fn, profiler=profiler)
+    else:
+        SICOracle = Oracle(model, loss_fn, profiler=profiler)
+
+    accumulator = None
+    if gram_workers > 0:
+        assert chunk_num is not None and chunk_num >= len(train_dataset), \
+            "gram_workers accumulate hessian over the whole train_dataset, thus chunk_num must be not less than len(train_dataset)."
+        accumulator = ParallelGramAccumulator(model, loss_fn, batch_to_tensors, list(train_dataset), gram_workers,
+                                              weight_names=weight_names, num_threads=config_train.get('gram_threads', None),
+                                              oracle_backend=oracle_backend, window_size=window_size, window_context=window_context,
+                                              analytic_jacobian=analytic_jacobian, autotune=autotune, holomorphic=holomorphic,
+                                              accumulate_dtype=accumulate_dtype)
 
-    timer = Timer()
-    general_timer = Timer()
-    general_timer.__enter__()
+    try:
+        timer = Timer()
+        general_timer = Timer()
+        general_timer.__enter__()
 
-    def accum_loss(dataset):
-        loss_val = 0
-        for batch in dataset:
-            loss_val += SICOracle.loss_function_val(batch).item()
-        return loss_val
+        # Evaluations on identical train, validation and test datasets with the same parameters are computed once
+        evaluate = Evaluator(model, loss_fn, quality_criterion, profiler=profiler)
             
-    # Calculate initial values of loss and quality criterion on validation and test dataset
-    with torch.no_grad():
-        loss_val_test = accum_loss(test_dataset)
-        criterion_val_test = quality_criterion(model, test_dataset)
-        best_criterion_test = criterion_val_test
-        print("Begin: loss = {:.4e}, quality_criterion_test = {:.8f} dB.".format(loss_val_test, criterion_val_test))
-        loss_val_train = accum_loss(train_dataset)
-        criterion_val_train = quality_criterion(model, train_dataset)
-        print("Begin: loss = {:.4e}, quality_criterion_train = {:.8f} dB.".format(loss_val_train, criterion_val_train))
-        loss_val_validate = accum_loss(validate_dataset)
-        criterion_val_validate = quality_criterion(model, validate_dataset)
-        print("Begin: loss = {:.4e}, quality_criterion_validate = {:.8f} dB.".format(loss_val_validate, criterion_val_validate))
-
-    epoch = 0
-    min_grad_norm = 1e-8
-    timer.__enter__()
-    for epoch in range(1, epochs + 1):
-        # Accumulate hessian and gradient on the whole training dataset.
-        # Combination of all batches on train dataset should be equal validation dataset
-        for j, batch in enumerate(train_dataset):
-
-            delta_hess, delta_grad = SICOracle.direction_through_jacobian(batch, batch_to_tensors, weight_names=weight_names)
+        learning_curve_test = None
+        if resume is None:
+            # Calculate initial values of loss and quality criterion on validation and test dataset
+            with torch.no_grad():
+                loss_val_test, criterion_val_test = evaluate(test_dataset)
+                best_criterion_test = criterion_val_test
+                print("Begin: loss = {:.4e}, quality_criterion_test = {:.8f} dB.".format(loss_val_test, criterion_val_test))
+                loss_val_train, criterion_val_train = evaluate(train_dataset)
+                print("Begin: loss = {:.4e}, quality_criterion_train = {:.8f} dB.".format(loss_val_train, criterion_val_train))
+                loss_val_validate, criterion_val_validate = evaluate(validate_dataset)
+                print("Begin: loss = {:.4e}, quality_criterion_validate = {:.8f} dB.".format(loss_val_validate, criterion_val_validate))
+                # Initial evaluation is recorded as epoch 0
+                profiler.epoch_end(0, loss_train=loss_val_train, quality_criterion_train=criterion_val_train,
+                                   quality_criterion_test=criterion_val_test)
+            start_epoch = 0
+        else:
+            checkpoint = load_checkpoint(resume, 'ls')
+            model.load_state_dict(checkpoint['model'])
+            best_criterion_test = checkpoint['best_criterion_test']
+            stopping.load_state_dict(checkpoint['stopping'])
+            evaluate.evaluations = checkpoint['evaluations']
+            start_epoch = checkpoint['epoch']
+            profiler.rewind(start_epoch)
+
+        epoch = start_epoch
+        timer.__enter__()
+        for epoch in range(start_epoch + 1, epochs + 1):
+            # Accumulate hessian and gradient on the whole training dataset.
+            # Combination of all batches on train dataset should be equal validation dataset
+            if gram_workers > 0:
+                with profiler.phase('gram_parallel'):
+                    hess, grad = accumulator()
+            else:
+                for j, batch in enumerate(train_dataset):
+
+                    delta_hess, delta_grad = SICOracle.direction_through_jacobian(batch, batch_to_tensors, weight_names=weight_names,
+                                                                                  window_size=window_size, window_context=window_context,
+                                                                                  analytic_jacobian=analytic_jacobian, autotune=autotune,
+                                                                                  holomorphic=holomorphic, accumulate_dtype=accumulate_dtype)
 
+                    with torch.no_grad():
+                        if j % chunk_num == 0:
+                            hess = torch.zeros_like(delta_hess)
+                            grad = torch.zeros_like(delta_grad)
+                        hess += delta_hess
+                        grad += delta_grad
+                        del delta_hess, delta_grad
+                        torch.cuda.empty_cache()
+
+            with profiler.phase('solve'):
+                solver = HessianSolver(hess, grad, method=solver_method, rcond=1e-15)
+                hess_cond = solver.cond()
+
+                # Implement LS-step
+                direction = solver.direction()
+            x = SICOracle.get_flat_params(name_list=weight_names)
+            SICOracle.set_flat_params(x + direction, name_list=weight_names)
+
+            loss_val_train, criterion_val_train = evaluate(train_dataset)
+            grad_norm = torch.norm(grad).item()
+
+            hess.detach()
+            grad.detach()
+            del grad, hess, solver
+            torch.cuda.empty_cache()
+
+            # Track NMSE values on validation and test dataset and save gradient, model parameters norm and 
+            # algorithm regularization history
             with torch.no_grad():
-                if j % chunk_num == 0:
-                    hess = torch.zeros_like(delta_hess)
-                    grad = torch.zeros_like(delta_grad)
-                hess += delta_hess
-                grad += delta_grad
-                del delta_hess, delta_grad
-                torch.cuda.empty_cache()
-
-        hess_cond = torch.linalg.cond(hess).item()
-
-        # Implement LS-step
-        hess_inv = torch.linalg.pinv(hess, rcond=1e-15, hermitian=True)
-        direction = -1. * hess_inv @ grad
-        x = SICOracle.get_flat_params(name_list=weight_names)
-        SICOracle.set_flat_params(x + direction, name_list=weight_names)
-
-        loss_val_train = accum_loss(train_dataset)
-        criterion_val_train = quality_criterion(model, train_dataset)
-
-        hess_inv.detach()
-        hess.detach()
-        grad.detach()
-        del grad, hess_inv, hess
-        torch.cuda.empty_cache()
-
-        # Track NMSE values on validation and test dataset and save gradient, model parameters norm and 
-        # algorithm regularization history
-        with torch.no_grad():
-            loss_val_test = accum_loss(test_dataset)
-            criterion_val_test = quality_criterion(model, test_dataset)
-            loss_val_validate = accum_loss(validate_dataset)
-            criterion_val_validate = quality_criterion(model, validate_dataset)
-
-            best_criterion_test = criterion_val_test
-            learning_curve_test = None
-            torch.save(model.state_dict(), save_path+'weights_best_test'+exp_name)
-        timer.__exit__()
-        print(f"Epoch is {epoch}, " + \
-            f"loss_train = {loss_val_train:.8f}, " + \
-            f"quality_criterion_train = {criterion_val_train:.8f} dB, " + \
-            f"time elapsed: {timer.interval:.2e}, Hessian conditioning: {hess_cond:.4e}")
-
-    general_timer.__exit__()
-    print(f"Total time elapsed: {general_timer.interval} s")
+                loss_val_test, criterion_val_test = evaluate(test_dataset)
+                loss_val_validate, criterion_val_validate = evaluate(validate_dataset)
+
+                best_criterion_test = criterion_val_test
+                learning_curve_test = None
+                writer.save_state_dict(model.state_dict(), save_path+'weights_best_test'+exp_name)
+            timer.__exit__()
+            profiler.epoch_end(epoch, loss_train=loss_val_train, quality_criterion_train=criterion_val_train,
+                               quality_criterion_test=criterion_val_test, hess_cond=hess_cond)
+            print(f"Epoch is {epoch}, " + \
+                f"loss_train = {loss_val_train:.8f}, " + \
+                f"quality_criterion_train = {criterion_val_train:.8f} dB, " + \
+                f"time elapsed: {timer.interval:.2e}, Hessian conditioning: {hess_cond:.4e}")
+            stop = stopping(epoch, loss=loss_val_train, loss_validate=loss_val_validate, grad_norm=grad_norm,
+                            evaluations=evaluate.evaluations)
+            if checkpoint_every is not None and (epoch % checkpoint_every == 0 or stop):
+                save_checkpoint(writer, save_path + f'checkpoint{exp_name}.pt', 'ls', epoch, model=model.state_dict(),
+                                best_criterion_test=best_criterion_test, stopping=stopping.state_dict(),
+                                evaluations=evaluate.evaluations)
+            if stop and epoch < epochs:
+                print(f"Training is stopped: {stopping.reason}.")
+                break
 
+        general_timer.__exit__()
+        print(f"Total time elapsed: {general_timer.interval} s")
+        profiler.summary()
+    finally:
+        # Worker processes, their shared buffers, queued writes and profiler hook are released also if training raises
+        if accumulator is not None:
+            accumulator.close()
+        profiler.close()
+        writer.close()
     return learning_curve_test, best_criterion_test
\ No newline at end of file
@@ -1,17 +1,23 @@
 import torch
 from torch import nn, Tensor
 from typing import Tuple, Union, Callable, List
-import numpy as np
 
 import sys
 sys.path.append('../../')
 
-from utils import Timer
-from oracle import Oracle
+from utils import Timer, Profiler, AsyncWriter
+from oracle import Oracle, FunctionalOracle, ACCUMULATE_DTYPES
+from .hessian_solver import HessianSolver
+from .evaluator import Evaluator
+from .damping import GainRatioDamping
+from .stopping import StoppingCriteria
+from .checkpoint import save_checkpoint, load_checkpoint
+from .parallel_accumulator import ParallelGramAccumulator
 
 OptionalInt = Union[int, None]
 OptionalStr = Union[str, None]
 StrOrList = Union[str, List[str], Tuple[str], None]
+OptionalDict = Union[dict, None]
 DataLoaderType = torch.utils.data.dataloader.DataLoader
 LossFnType = Union[Callable[[nn.Module, Tensor], Tensor], Callable[[nn.Module, Tuple[Tensor, ...]], Tensor]]
 BatchTensorType = Callable[[Tensor], Tuple[Tensor, ...]]
@@ -20,7 +26,8 @@ def train_mixed_newton_levenb_marq(model: nn.Module, train_dataset: DataLoaderTy
                                    test_dataset: DataLoaderType, loss_fn: LossFnType, quality_criterion: LossFnType, 
                                    batch_to_tensors: BatchTensorType, chunk_num: OptionalInt = None, 
                                    save_path: OptionalStr = None, exp_name: OptionalStr = None, save_every: OptionalInt = None, 
-                                   save_signals: bool = False, weight_names: StrOrList = None):
+                                   save_signals: bool = False, weight_names: StrOrList = None, config_train: OptionalDict = None,
+                                   resume: OptionalStr = None):
     """
     Function implements Mixed Newton Method with Levenberg-Mrquardt adaptive regularization control. 
     Mixed Newton implies computation of the mixed Hessian and gradient multiplication each algorithm step. 
@@ -39,8 +46,12 @@ def train_mixed_newton_levenb_marq(model: nn.Module, train_dataset: DataLoaderTy
     it checks if quality criterion in current iteration degraded, then reqgularization parameter alpha increased: (H + alpha * I)^(-1) * grad,
     otherwise it decreased. Thus in case of high numerical mistakes in Hessian calculation due to the bag-conditioning, then algorithm
     tries make more gradient-like step by increasing regularization parameter.
+    By default step is accepted and alpha is updated by the gain ratio of actual and predicted by the model linearization
+    loss function reduction (see trainer.algorithms.GainRatioDamping), thus each trial step costs one loss function evaluation.
 
     The stop criteria is determined by gradient norm. If it is lower than min_grad_norm than algorithm stops.
+    Other stopping criteria (maximal number of epochs, relative improvement over window, time and evaluations budget)
+    are set by config_train, see trainer.algorithms.StoppingCriteria.from_config.
 
     Args:
         model (nn.Module): The model with differentiable parameters.
@@ -69,159 +80,297 @@ def train_mixed_newton_levenb_marq(model: nn.Module, train_dataset: DataLoaderTy
         save_signals (bool): The flag that shows, whether to save training signals or not. Defaults to False.
         weight_names (str or list of str, optional): By spceifying `weight_names` it is possible to compute gradient only
             for several named parameters. Defaults to "None".
+        config_train (dictionary, optional): Dictionary with configurations of training procedure. Following keys are used:
+            'jacobian_window_size' (int) -- the number of samples to accumulate hessian and gradient over at once
+                (see window_size in oracle.Oracle.direction_through_jacobian). Defaults to "None": whole batch at once.
+            'jacobian_window_context' (int) -- model receptive field half-width, see window_context in
+                oracle.Oracle.direction_through_jacobian. Defaults to "None".
+            'analytic_jacobian' (bool) -- whether to take jacobian from model.regression_matrix without automatic
+                differentiation. Defaults to "True" for models, which have regression_matrix method (linear in parameters).
+            'jacobian_autotune' (bool) -- whether to choose jacobian computation strategy by micro-benchmarks on the first
+                batch, see autotune in oracle.Oracle.direction_through_jacobian. Defaults to "False".
+            'holomorphic_jacobian' (bool) -- whether model output is holomorphic in complex parameters, thus jacobian is
+                computed with half the tangent evaluations, see holomorphic in oracle.Oracle.direction_through_jacobian.
+                Defaults to model.holomorphic attribute if it exists, otherwise "False".
+            'oracle_backend' (str) -- 'autograd' for oracle.Oracle, which removes parameters from the model while computing
+                derivatives, or 'functional' for oracle.FunctionalOracle based on torch.func.functional_call.
+                Defaults to 'autograd'.
+            'gram_workers' (int) -- the number of worker processes, which accumulate hessian and gradient over train_dataset
+                batches in parallel on CPU, see trainer.algorithms.ParallelGramAccumulator. Defaults to 0: serial accumulation.
+                Workers always accumulate over the whole train_dataset, thus chunk_num must be not less than len(train_dataset).
+            'gram_threads' (int) -- the number of torch threads per worker. Defaults to cpu_count // gram_workers.
+            'damping' (str) -- regularization control: 'gain_ratio' updates alpha by the ratio of actual and linearization-predicted
+                loss function reduction, see trainer.algorithms.GainRatioDamping; 'heuristic' accepts any step, which doesn`t
+                increase loss function, and multiplies alpha by 1 / 3 or 1.1, as in earlier experiments. Defaults to 'heuristic'.
+            'solver' (str) -- method of regularized step calculation: 'eigh', 'cholesky' or 'pinv',
+                see trainer.algorithms.HessianSolver. Defaults to 'eigh'.
+            'mixed_precision' (bool) -- whether to compute hessian and gradient in double precision for the model in single
+                precision (built with dtype=torch.complex64 or torch.float32): model forward and jacobian chunks are computed
+                in model dtype, while hessian and gradient are accumulated and the step is solved in double precision,
+                see accumulate_dtype in oracle.Oracle.direction_through_jacobian. Parameters are updated
+                in double precision master copy, which is rounded to the model dtype. Defaults to "False".
+            'epochs' (int) -- maximal number of epochs. Defaults to 3000.
+            'min_grad_norm' (float) -- minimal gradient norm. Defaults to 1e-8.
+            'stop_window', 'stop_min_improvement', 'stop_monitor', 'time_budget', 'max_evaluations' -- other stopping criteria,
+                see trainer.algorithms.StoppingCriteria.from_config. Defaults to "None": disabled.
+            'async_writer' (bool) -- whether to write learning curves and weights in the background thread,
+                see utils.AsyncWriter. Learning curves are appended to .npy files, not rewritten. Defaults to "True".
+            'writer_queue_size' (int) -- maximal number of pending write tasks. Defaults to 16.
+            'checkpoint_every' (int) -- period in epochs of saving full training state (parameters, alpha, mu, damping state,
+                learning curves, stopping criteria and random generators states) to the file save_path + 'checkpoint' + exp_name
+                + '.pt', which could be passed as resume argument. Checkpoint is also saved on the last epoch.
+                Defaults to "None": checkpoints are not saved.
+            'profile' (bool) -- whether to write per-epoch phases timings ('jacobian', 'gram', 'solve', 'line_search',
+                'evaluation'), forward passes and line search retries counts and peak memory to the file
+                save_path + 'profile' + exp_name + '.jsonl', see utils.Profiler. Defaults to "False".
+            Defaults to "None".
+        resume (str, optional): Path of the checkpoint to continue training from. Training is continued from the epoch next
+            to the checkpoint one with the same results, as uninterrupted training. Defaults to "None".
 
     Returns:
         Learning curve (list), containing quality criterion calculated each epoch of learning.
     """
+    if config_train is None:
+        config_train = {}
+
     # Algorithm stop criteria parameters
-    epochs = int(3e+3)
+    stopping = StoppingCriteria.from_config(config_train, epochs=int(3e+3), min_grad_norm=1e-8)
+    epochs = stopping.epochs
 
     if save_every is None:
-        save_every = epochs - 1
+        save_every = max(epochs - 1, 1)
 
     epoch, print_every = 0, 1
 
-    SICOracle = Oracle(model, loss_fn)
-
-    mu = 1.
-    alpha = 1.
-    eps = 1e-4
-    reg_param_curve = []
-    learning_curve_train = []
-    learning_curve_test = []
-    learning_curve_validate = []
-    learning_curve_train_qcrit = []
-    learning_curve_test_qcrit = []
-    learning_curve_validate_qcrit = []
-    grad_norm_curve = []
-    weights_norm_curve = []
-    grad_norm = None
-    timer = Timer()
-    general_timer = Timer()
-    general_timer.__enter__()
-
-    def accum_loss(dataset):
-        loss_val = 0
-        for batch in dataset:
-            loss_val += SICOracle.loss_function_val(batch).item()
-        return loss_val
+    window_size = config_train.get('jacobian_window_size', None)
+    window_context = config_train.get('jacobian_window_context', None)
+    analytic_jacobian = config_train.get('analytic_jacobian', hasattr(model, 'regression_matrix'))
+    autotune = config_train.get('jacobian_autotune', False)
+    holomorphic = config_train.get('holomorphic_jacobian', getattr(model, 'holomorphic', False))
+    oracle_backend = config_train.get('oracle_backend', 'autograd')
+    assert oracle_backend in ['autograd', 'functional'], "oracle_backend must be 'autograd' or 'functional'."
+    gram_workers = config_train.get('gram_workers', 0)
+    damping_method = config_train.get('damping', 'heuristic')
+    assert damping_method in ['gain_ratio', 'heuristic'], "damping must be 'gain_ratio' or 'heuristic'."
+    solver_method = config_train.get('solver', 'eigh')
+    checkpoint_every = config_train.get('checkpoint_every', None)
+    mixed_precision = config_train.get('mixed_precision', False)
+    accumulate_dtype = ACCUMULATE_DTYPES[next(model.parameters()).dtype] if mixed_precision else None
+    profiler = Profiler(model, save_path + f'profile{exp_name}.jsonl', enabled=config_train.get('profile', False),
+                        append=resume is not None)
+    writer = AsyncWriter(max_queue=config_train.get('writer_queue_size', 16), asynchronous=config_train.get('async_writer', True))
+
+    if oracle_backend == 'functional':
+        SICOracle = FunctionalOracle(model, loss_fn, profiler=profiler)
+    else:
+        SICOracle = Oracle(model, loss_fn, profiler=profiler)
+
+    accumulator = None
+    if gram_workers > 0:
+        assert chunk_num is not None and chunk_num >= len(train_dataset), \
+            "gram_workers accumulate hessian over the whole train_dataset, thus chunk_num must be not less than len(train_dataset)."
+        accumulator = ParallelGramAccumulator(model, loss_fn, batch_to_tensors, list(train_dataset), gram_workers,
+                                              weight_names=weight_names, num_threads=config_train.get('gram_threads', None),
+                                              oracle_backend=oracle_backend, window_size=window_size, window_context=window_context,
+                                              analytic_jacobian=analytic_jacobian, autotune=autotune, holomorphic=holomorphic,
+                                              accumulate_dtype=accumulate_dtype)
+
+    try:
+        mu = 1.
+        alpha = 1.
+        damping = GainRatioDamping(alpha)
+        eps = 1e-4
+        reg_param_curve = []
+        learning_curve_train = []
+        learning_curve_test = []
+        learning_curve_validate = []
+        learning_curve_train_qcrit = []
+        learning_curve_test_qcrit = []
+        learning_curve_validate_qcrit = []
+        grad_norm_curve = []
+        weights_norm_curve = []
+        curves = {'lc_train': learning_curve_train, 'lc_test': learning_curve_test, 'lc_validate': learning_curve_validate,
+                  'lc_qcrit_train': learning_curve_train_qcrit, 'lc_qcrit_test': learning_curve_test_qcrit,
+                  'lc_qcrit_validate': learning_curve_validate_qcrit, 'grad_norm': grad_norm_curve, 'param_norm': weights_norm_curve,
+                  'regular': reg_param_curve}
+        grad_norm = None
+        master = None
+        timer = Timer()
+        general_timer = Timer()
+        general_timer.__enter__()
+
+        # Evaluations on identical train, validation and test datasets with the same parameters are computed once
+        evaluate = Evaluator(model, loss_fn, quality_criterion, profiler=profiler)
             
-    # Calculate initial values of loss and quality criterion on validation and test dataset
-    with torch.no_grad():
-        loss_val_test = accum_loss(test_dataset)
-        criterion_val_test = quality_criterion(model, test_dataset)
-        best_criterion_test = criterion_val_test
-        learning_curve_test.append(loss_val_test)
-        learning_curve_test_qcrit.append(criterion_val_test)
-        print("Begin: loss = {:.4e}, quality_criterion_test = {:.8f} dB.".format(loss_val_test, criterion_val_test))
-        loss_val_train = accum_loss(train_dataset)
-        criterion_val_train = quality_criterion(model, train_dataset)
-        learning_curve_train.append(loss_val_train)   
-        learning_curve_train_qcrit.append(criterion_val_train)
-        print("Begin: loss = {:.4e}, quality_criterion_train = {:.8f} dB.".format(loss_val_train, criterion_val_train))
-        loss_val_validate = accum_loss(validate_dataset)
-        criterion_val_validate = quality_criterion(model, validate_dataset)
-        learning_curve_validate.append(loss_val_validate)
-        learning_curve_validate_qcrit.append(criterion_val_validate)
-        print("Begin: loss = {:.4e}, quality_criterion_validate = {:.8f} dB.".format(loss_val_validate, criterion_val_validate))
-
-    epoch = 0
-    min_grad_norm = 1e-8
-    for epoch in range(epochs):
-    # while grad_norm is None or grad_norm >= min_grad_norm:
-        timer.__enter__()
-        # Accumulate hessian and gradient on the whole training dataset.
-        # Combination of all batches on train dataset should be equal validation dataset
-        for j, batch in enumerate(train_dataset):
-
-            delta_hess, delta_grad = SICOracle.direction_through_jacobian(batch, batch_to_tensors, weight_names=weight_names)
+        if resume is None:
+            # Calculate initial values of loss and quality criterion on validation and test dataset
+            with torch.no_grad():
+                loss_val_test, criterion_val_test = evaluate(test_dataset)
+                best_criterion_test = criterion_val_test
+                learning_curve_test.append(loss_val_test)
+                learning_curve_test_qcrit.append(criterion_val_test)
+                print("Begin: loss = {:.4e}, quality_criterion_test = {:.8f} dB.".format(loss_val_test, criterion_val_test))
+                loss_val_train, criterion_val_train = evaluate(train_dataset)
+                learning_curve_train.append(loss_val_train)   
+                learning_curve_train_qcrit.append(criterion_val_train)
+                print("Begin: loss = {:.4e}, quality_criterion_train = {:.8f} dB.".format(loss_val_train, criterion_val_train))
+                loss_val_validate, criterion_val_validate = evaluate(validate_dataset)
+                learning_curve_validate.append(loss_val_validate)
+                learning_curve_validate_qcrit.append(criterion_val_validate)
+                print("Begin: loss = {:.4e}, quality_criterion_validate = {:.8f} dB.".format(loss_val_validate, criterion_val_validate))
+                # Initial evaluation is recorded as epoch 0
+                profiler.epoch_end(0, loss_train=loss_val_train, quality_criterion_train=criterion_val_train,
+                                   quality_criterion_test=criterion_val_test)
+            start_epoch = 0
+        else:
+            checkpoint = load_checkpoint(resume, 'mnm_lev_marq')
+            model.load_state_dict(checkpoint['model'])
+            for name, curve in curves.items():
+                curve.extend(checkpoint['curves'][name])
+            mu, alpha, grad_norm, master = checkpoint['mu'], checkpoint['alpha'], checkpoint['grad_norm'], checkpoint.get('master')
+            damping.load_state_dict(checkpoint['damping'])
+            loss_val_train, criterion_val_train = checkpoint['loss_val_train'], checkpoint['criterion_val_train']
+            best_criterion_test = checkpoint['best_criterion_test']
+            stopping.load_state_dict(checkpoint['stopping'])
+            evaluate.evaluations = checkpoint['evaluations']
+            start_epoch = checkpoint['epoch']
+            profiler.rewind(start_epoch)
+
+        epoch = start_epoch
+        for epoch in range(start_epoch, epochs):
+            timer.__enter__()
+            # Accumulate hessian and gradient on the whole training dataset.
+            # Combination of all batches on train dataset should be equal validation dataset
+            if gram_workers > 0:
+                with profiler.phase('gram_parallel'):
+                    hess, grad = accumulator()
+            else:
+                for j, batch in enumerate(train_dataset):
+
+                    delta_hess, delta_grad = SICOracle.direction_through_jacobian(batch, batch_to_tensors, weight_names=weight_names,
+                                                                                  window_size=window_size, window_context=window_context,
+                                                                                  analytic_jacobian=analytic_jacobian, autotune=autotune,
+                                                                                  holomorphic=holomorphic, accumulate_dtype=accumulate_dtype)
 
+                    with torch.no_grad():
+                        if j % chunk_num == 0:
+                            hess = torch.zeros_like(delta_hess)
+                            grad = torch.zeros_like(delta_grad)
+                        hess += delta_hess
+                        grad += delta_grad
+                        del delta_hess, delta_grad
+                        torch.cuda.empty_cache()
+
+            maxH = hess.abs().max().item()
+            # Hessian is factorized once per epoch, thus each regularization retry is cheap
+            with profiler.phase('solve'):
+                solver = HessianSolver(hess, grad, method=solver_method, rcond=1e-40)
+                hess_cond = solver.cond()
+
+            # Calculate and apply Levenberg-Marquardt algorithm step with mixed hessian
+            flag = True
+            with profiler.phase('line_search'):
+                while flag:
+                    with profiler.phase('solve'):
+                        direction = solver.direction(alpha*maxH)
+                    x = SICOracle.get_flat_params(name_list=weight_names) if master is None else master
+                    curr_params = x + mu * direction
+                    SICOracle.set_flat_params(curr_params, name_list=weight_names)
+                    # Trial steps require only loss function value, quality criterion is computed for the accepted step
+                    with torch.no_grad():
+                        tmp_loss_val = evaluate.loss(train_dataset)
+                    if damping_method == 'gain_ratio':
+                        # Step is taken from the parameters actually set, e.g. real part of direction for real parameters
+                        step = (SICOracle.get_flat_params(name_list=weight_names) - x).to(hess.dtype)
+                        accepted = damping.update(loss_val_train, tmp_loss_val, damping.predicted_reduction(hess, grad, step))
+                        reg_param = alpha
+                        alpha = damping.alpha
+                    else:
+                        accepted = tmp_loss_val <= loss_val_train + eps
+                        reg_param = alpha
+                        alpha = alpha / 3 if accepted else alpha * 1.1
+                    if accepted:
+                        flag = False
+                        if mixed_precision:
+                            # Master copy keeps the steps, which are lower than rounding error of the model dtype
+                            master = (curr_params if accumulate_dtype.is_complex else curr_params.real).to(accumulate_dtype)
+                    else:
+                        SICOracle.set_flat_params(x, name_list=weight_names)
+                        profiler.count('line_search_retries')
+                        if epoch % print_every == 0:
+                            print(f"Deverges, epoch is {epoch + 1}, loss_val = {tmp_loss_val:.4f}, stepsize = {mu:.6e}, " + \
+                                  f"reg_param = {reg_param:.4e}" + \
+                                  (f", gain ratio = {damping.rho:.4e}" if damping.rho is not None and damping_method == 'gain_ratio' else ""))
             with torch.no_grad():
-                if j % chunk_num == 0:
-                    hess = torch.zeros_like(delta_hess)
-                    grad = torch.zeros_like(delta_grad)
-                hess += delta_hess
-                grad += delta_grad
-                del delta_hess, delta_grad
-                torch.cuda.empty_cache()
-
-        maxH = hess.abs().max().item()
-        regul = torch.eye(hess.size()[0], device=hess.device)
-        hess_cond = torch.linalg.cond(hess).item()
-
-        # Calculate and apply Levenberg-Marquardt algorithm step with mixed hessian
-        flag = True
-        while flag:
-            hess_inv = torch.linalg.pinv(hess + alpha*maxH*regul, rcond=1e-40, hermitian=True)
-            direction = -1. * hess_inv @ grad      
-            x = SICOracle.get_flat_params(name_list=weight_names)
-            curr_params = x + mu * direction
-            SICOracle.set_flat_params(curr_params, name_list=weight_names)
+                loss_val_train, criterion_val_train = evaluate(train_dataset)
+
+            # Track algorithm parameters
+            reg_param_curve.append(alpha)
+            grad_norm = torch.norm(grad).item()
+            grad_norm_curve.append(grad_norm)
+            weights_norm_curve.append(torch.norm(curr_params).item())
+
+            hess.detach()
+            grad.detach()
+            del grad, hess, solver
+            torch.cuda.empty_cache()
+
+            # Track NMSE values on validation and test dataset and save gradient, model parameters norm and 
+            # algorithm regularization history
             with torch.no_grad():
-                tmp_loss_val = accum_loss(train_dataset)
-                tmp_criterion_val = quality_criterion(model, train_dataset)
-            if tmp_loss_val <= loss_val_train + eps:
-                flag = False
-                alpha /= 3
-            else:
-                SICOracle.set_flat_params(x, name_list=weight_names)
-                alpha *= 1.1
-                if epoch % print_every == 0:
-                    print(f"Deverges, epoch is {epoch + 1}, quality_criterion_train = {tmp_criterion_val:.4f} dB," + \
-                          f"loss_val = {tmp_loss_val:.4f}, stepsize = {mu:.6e}, reg_param = {alpha:.4e}")
-        loss_val_train = tmp_loss_val
-        criterion_val_train = tmp_criterion_val
-
-        # Track algorithm parameters
-        reg_param_curve.append(alpha)
-        grad_norm = torch.norm(grad).item()
-        grad_norm_curve.append(grad_norm)
-        weights_norm_curve.append(torch.norm(curr_params).item())
-
-        hess_inv.detach()
-        hess.detach()
-        grad.detach()
-        del grad, hess_inv, hess
-        torch.cuda.empty_cache()
-
-        # Track NMSE values on validation and test dataset and save gradient, model parameters norm and 
-        # algorithm regularization history
-        with torch.no_grad():
-            loss_val_test = accum_loss(test_dataset)
-            criterion_val_test = quality_criterion(model, test_dataset)
-            loss_val_validate = accum_loss(validate_dataset)
-            criterion_val_validate = quality_criterion(model, validate_dataset)
-
-            learning_curve_test.append(loss_val_test)
-            learning_curve_train.append(loss_val_train)
-            learning_curve_validate.append(loss_val_validate)
-            learning_curve_test_qcrit.append(criterion_val_test)
-            learning_curve_train_qcrit.append(criterion_val_train)
-            learning_curve_validate_qcrit.append(criterion_val_validate)
-
-            if criterion_val_test < best_criterion_test:
-                best_criterion_test = criterion_val_test
-                torch.save(model.state_dict(), save_path+'weights_best_test'+exp_name)
-            if epoch % save_every == 0:
-                np.save(save_path + f'lc_train{exp_name}.npy', np.array(learning_curve_train))
-                np.save(save_path + f'lc_test{exp_name}.npy', np.array(learning_curve_test))
-                np.save(save_path + f'lc_validate{exp_name}.npy', np.array(learning_curve_validate))
-                np.save(save_path + f'lc_qcrit_train{exp_name}.npy', np.array(learning_curve_train_qcrit))
-                np.save(save_path + f'lc_qcrit_test{exp_name}.npy', np.array(learning_curve_test_qcrit))
-                np.save(save_path + f'lc_qcrit_validate{exp_name}.npy', np.array(learning_curve_validate_qcrit))
-                np.save(save_path + f'grad_norm{exp_name}.npy', np.array(grad_norm_curve))
-                np.save(save_path + f'param_norm{exp_name}.npy', np.array(weights_norm_curve))
-                np.save(save_path + f'regular{exp_name}.npy', np.array(reg_param_curve))
-        timer.__exit__()
-        if epoch % print_every == 0:
-            print(f"Epoch is {epoch + 1}, " + \
-                f"loss_train = {loss_val_train:.8f}, " + \
-                f"quality_criterion_train = {criterion_val_train:.8f} dB, stepsize = {mu:.6e}, " + \
-                f"|grad| = {grad_norm:.4e}, time elapsed: {timer.interval:.2e}," + \
-                f"Hessian conditioning: {hess_cond:.4e}, alpha = {alpha:.4e}")
-        epoch += 1
-
-        general_timer.__exit__()
-        print(f"Total time elapsed: {general_timer.interval} s")
+                loss_val_test, criterion_val_test = evaluate(test_dataset)
+                loss_val_validate, criterion_val_validate = evaluate(validate_dataset)
+
+                learning_curve_test.append(loss_val_test)
+                learning_curve_train.append(loss_val_train)
+                learning_curve_validate.append(loss_val_validate)
+                learning_curve_test_qcrit.append(criterion_val_test)
+                learning_curve_train_qcrit.append(criterion_val_train)
+                learning_curve_validate_qcrit.append(criterion_val_validate)
+
+                stop = stopping(epoch + 1, loss=loss_val_train, loss_validate=loss_val_validate, grad_norm=grad_norm,
+                                evaluations=evaluate.evaluations)
+
+                if criterion_val_test < best_criterion_test:
+                    best_criterion_test = criterion_val_test
+                    writer.save_state_dict(model.state_dict(), save_path+'weights_best_test'+exp_name)
+                if epoch % save_every == 0 or stop:
+                    writer.append_curves({save_path + f'lc_train{exp_name}.npy': learning_curve_train,
+                                          save_path + f'lc_test{exp_name}.npy': learning_curve_test,
+                                          save_path + f'lc_validate{exp_name}.npy': learning_curve_validate,
+                                          save_path + f'lc_qcrit_train{exp_name}.npy': learning_curve_train_qcrit,
+                                          save_path + f'lc_qcrit_test{exp_name}.npy': learning_curve_test_qcrit,
+                                          save_path + f'lc_qcrit_validate{exp_name}.npy': learning_curve_validate_qcrit,
+                                          save_path + f'grad_norm{exp_name}.npy': grad_norm_curve,
+                                          save_path + f'param_norm{exp_name}.npy': weights_norm_curve,
+                                          save_path + f'regular{exp_name}.npy': reg_param_curve})
+                if checkpoint_every is not None and ((epoch + 1) % checkpoint_every == 0 or stop):
+                    save_checkpoint(writer, save_path + f'checkpoint{exp_name}.pt', 'mnm_lev_marq', epoch + 1, model=model.state_dict(),
+                                    curves=curves, mu=mu, alpha=alpha, grad_norm=grad_norm, damping=damping.state_dict(),
+                                    loss_val_train=loss_val_train, criterion_val_train=criterion_val_train,
+                                    best_criterion_test=best_criterion_test, stopping=stopping.state_dict(),
+                                    evaluations=evaluate.evaluations, master=master)
+            timer.__exit__()
+            profiler.epoch_end(epoch + 1, loss_train=loss_val_train, quality_criterion_train=criterion_val_train,
+                               quality_criterion_test=criterion_val_test, grad_norm=grad_norm, hess_cond=hess_cond, reg_param=alpha)
+            if epoch % print_every == 0:
+                print(f"Epoch is {epoch + 1}, " + \
+                    f"loss_train = {loss_val_train:.8f}, " + \
+                    f"quality_criterion_train = {criterion_val_train:.8f} dB, stepsize = {mu:.6e}, " + \
+                    f"|grad| = {grad_norm:.4e}, time elapsed: {timer.interval:.2e}," + \
+                    f"Hessian conditioning: {hess_cond:.4e}, alpha = {alpha:.4e}")
+            epoch += 1
 
+            general_timer.__exit__()
+            print(f"Total time elapsed: {general_timer.interval} s")
+            if stop:
+                print(f"Training is stopped: {stopping.reason}.")
+                break
+        profiler.summary()
+    finally:
+        # Worker processes, their shared buffers, queued writes and profiler hook are released also if training raises
+        if accumulator is not None:
+            accumulator.close()
+        profiler.close()
+        writer.close()
     return learning_curve_test, best_criterion_test
\ No newline at end of file
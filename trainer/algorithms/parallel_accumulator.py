@@ -0,0 +1,154 @@
+import os
+import queue
+import traceback
+import torch
+import torch.multiprocessing as mp
+from torch import nn, Tensor
+from typing import Tuple, Union, Callable, List
+
+import sys
+sys.path.append('../../')
+
+from oracle import Oracle, FunctionalOracle
+
+OptionalInt = Union[int, None]
+OptionalStr = Union[str, None]
+StrOrList = Union[str, List[str], Tuple[str], None]
+LossFnType = Union[Callable[[nn.Module, Tensor], Tensor], Callable[[nn.Module, Tuple[Tensor, ...]], Tensor]]
+BatchTensorType = Callable[[Tensor], Tuple[Tensor, ...]]
+
+# Complex dtype of the mixed Hessian for the parameters dtype: model output is complex, thus J^H @ J is complex
+COMPLEX_DTYPES = {torch.float32: torch.complex64, torch.float64: torch.complex128,
+                  torch.complex64: torch.complex64, torch.complex128: torch.complex128}
+
+
+def _worker(rank: int, model: nn.Module, loss_fn: LossFnType, batch_to_tensors: BatchTensorType, batches: list,
+            weight_names: StrOrList, oracle_backend: str, direction_kwargs: dict, num_threads: int, flat_params: Tensor,
+            hess_buf: Tensor, grad_buf: Tensor, commands, results):
+    """
+    Worker process loop: on each command loads parameters from shared flat_params into the model replica,
+    accumulates hessian and gradient over its batches and writes them into its slot of shared hess_buf and grad_buf.
+    """
+    torch.set_num_threads(num_threads)
+    oracle = FunctionalOracle(model, loss_fn) if oracle_backend == 'functional' else Oracle(model, loss_fn)
+    while commands.get() is not None:
+        try:
+            oracle.set_flat_params(flat_params, name_list=weight_names)
+            hess_buf[rank].zero_()
+            grad_buf[rank].zero_()
+            for batch in batches:
+                delta_hess, delta_grad = oracle.direction_through_jacobian(batch, batch_to_tensors, weight_names=weight_names,
+                                                                           **direction_kwargs)
+                hess_buf[rank] += delta_hess
+                grad_buf[rank] += delta_grad
+            results.put((rank, None))
+        except Exception:
+            results.put((rank, traceback.format_exc()))
+
+
+class ParallelGramAccumulator:
+    """
+    The class accumulates mixed Hessian J^H @ J and gradient J^H @ e of Mixed Newton and LS steps over the training batches
+    in parallel on CPU. Batches are distributed round-robin across the pool of worker processes, each worker holds
+    the model replica and its share of batches, which are transferred once on start. Each accumulation call only
+    writes current parameters into shared memory, workers compute partial sums of their batches by
+    oracle.Oracle.direction_through_jacobian and write them into their slots of shared memory buffers, which are reduced
+    by summation in the main process. Thus no tensors are pickled per epoch.
+
+    Each worker uses num_threads torch intra-op threads, defaults to cpu_count // num_workers, so that workers don`t
+    oversubscribe the cores. Batches are implied to be the same each epoch, as for train datasets of the Newton-based methods.
+    Partial sums are added in different order than in serial accumulation, thus result may differ by rounding errors.
+
+    The class is used as context manager, which terminates workers on exit, or close method should be called.
+    """
+    def __init__(self, model: nn.Module, loss_fn: LossFnType, batch_to_tensors: BatchTensorType, batches: list,
+                 num_workers: int, weight_names: StrOrList = None, num_threads: OptionalInt = None,
+                 start_method: OptionalStr = None, oracle_backend: str = 'autograd', **direction_kwargs):
+        """
+        Constructor of the ParallelGramAccumulator class. Starts worker processes.
+
+        Args:
+            model (nn.Module): The model with differentiable parameters. Each worker gets its replica.
+            loss_fn (Callable): The function used to compute model quality, see oracle.Oracle.
+            batch_to_tensors (Callable): Function which acquires signal batch as an input and returns tuple of tensors, where
+                the first tensor corresponds to model input, the second one - to the target signal.
+            batches (list): Training batches.
+            num_workers (int): The number of worker processes.
+            weight_names (str or list of str, optional): Names of the parameters to compute hessian and gradient for.
+                Defaults to "None", which means all parameters.
+            num_threads (int, optional): The number of torch intra-op threads per worker. Defaults to cpu_count // num_workers.
+            start_method (str, optional): Multiprocessing start method. 'fork' doesn`t require model, loss_fn and batch_to_tensors
+                to be picklable and doesn`t re-import the main module. Defaults to 'fork' if it`s available, otherwise 'spawn'.
+            oracle_backend (str): 'autograd' for oracle.Oracle or 'functional' for oracle.FunctionalOracle. Defaults to 'autograd'.
+            **direction_kwargs: Keyword arguments of oracle.Oracle.direction_through_jacobian, e.g. window_size.
+        """
+        assert num_workers >= 1, "num_workers must be positive."
+        if start_method is None:
+            start_method = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+        if num_threads is None:
+            num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        self.oracle = Oracle(model, loss_fn)
+        self.weight_names = weight_names
+
+        # Shared memory buffers: parameters are written by the main process, partial sums - by workers
+        self.flat_params = self.oracle.get_flat_params(name_list=weight_names).clone().share_memory_()
+        param_num = self.flat_params.numel()
+        dtype = COMPLEX_DTYPES[direction_kwargs.get('accumulate_dtype', None) or self.flat_params.dtype]
+        self.hess_buf = torch.zeros(num_workers, param_num, param_num, dtype=dtype).share_memory_()
+        self.grad_buf = torch.zeros(num_workers, param_num, dtype=dtype).share_memory_()
+
+        context = mp.get_context(start_method)
+        self.results = context.Queue()
+        self.commands = []
+        self.workers = []
+        for rank in range(num_workers):
+            commands = context.Queue()
+            worker = context.Process(target=_worker, daemon=True,
+                                     args=(rank, model, loss_fn, batch_to_tensors, batches[rank::num_workers], weight_names,
+                                           oracle_backend, direction_kwargs, num_threads, self.flat_params, self.hess_buf,
+                                           self.grad_buf, commands, self.results))
+            worker.start()
+            self.commands.append(commands)
+            self.workers.append(worker)
+
+    def __call__(self) -> Tuple[Tensor, Tensor]:
+        """
+        Accumulates hessian and gradient over all batches for the current model parameters.
+
+        Returns:
+            Tensor: hessian.
+            Tensor: gradient.
+        """
+        self.flat_params.copy_(self.oracle.get_flat_params(name_list=self.weight_names))
+        for commands in self.commands:
+            commands.put(True)
+        errors = []
+        pending = len(self.workers)
+        while pending > 0:
+            try:
+                rank, error = self.results.get(timeout=1.)
+            except queue.Empty:
+                # Worker killed by signal (e.g. out of memory) never sends result
+                dead = [rank for rank, worker in enumerate(self.workers) if not worker.is_alive()]
+                assert len(dead) == 0, f"Workers {dead} terminated unexpectedly."
+                continue
+            pending -= 1
+            if error is not None:
+                errors.append(f"Worker {rank} failed:\n{error}")
+        if len(errors) > 0:
+            raise RuntimeError("\n".join(errors))
+        return self.hess_buf.sum(dim=0), self.grad_buf.sum(dim=0)
+
+    def close(self):
+        for commands, worker in zip(self.commands, self.workers):
+            if worker.is_alive():
+                commands.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers, self.commands = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
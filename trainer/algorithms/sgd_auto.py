@@ -1,12 +1,14 @@
 import torch
 from torch import nn, Tensor
 from typing import Tuple, Union, Callable, List
-import numpy as np
 
 import sys
 sys.path.append('../../')
 
-from utils import Timer
+from utils import Timer, Profiler, AsyncWriter
+from .evaluator import Evaluator
+from .stopping import StoppingCriteria
+from .checkpoint import save_checkpoint, load_checkpoint
 
 OptionalInt = Union[int, None]
 OptionalStr = Union[str, None]
@@ -19,7 +21,7 @@ BatchTensorType = Callable[[Tensor], Tuple[Tensor, ...]]
 def train_sgd_auto(model: nn.Module, train_dataset: DataLoaderType, validate_dataset: DataLoaderType,
               test_dataset: DataLoaderType, loss_fn: LossFnType, quality_criterion: LossFnType, 
               batch_to_tensors: BatchTensorType, config_train: dict, save_path: OptionalStr = None, exp_name: OptionalStr = None, 
-              save_every: OptionalInt = None, weight_names: StrOrList = None):
+              save_every: OptionalInt = None, weight_names: StrOrList = None, resume: OptionalStr = None):
     """
     Function optimizes model parameters using common stochastic gradient descent, loss.backward() method.
 
@@ -40,142 +42,203 @@ def train_sgd_auto(model: nn.Module, train_dataset: DataLoaderType, validate_dat
         batch_to_tensors (Callable): Function which acquires signal batch as an input and returns tuple of tensors, where
             the first tensor corresponds to model input, the second one - to the target signal.
         config_train (dictionary): Dictionary with configurations of training procedure. Includes learning rate, training type,
-            optimizers parameters etc. Implied to be loaded from .yaml config file.
+            optimizers parameters etc. Implied to be loaded from .yaml config file. Following keys are used:
+            'profile' (bool) -- whether to write per-epoch phases timings ('optimizer_step', which includes 'gradient',
+                and 'evaluation'), forward passes count and peak memory to the file save_path + 'profile' + exp_name + '.jsonl',
+                see utils.Profiler. Defaults to "False".
+            'async_writer' (bool) -- whether to write learning curves and weights in the background thread,
+                see utils.AsyncWriter. Learning curves are appended to .npy files, not rewritten. Defaults to "True".
+            'writer_queue_size' (int) -- maximal number of pending write tasks. Defaults to 16.
+            'checkpoint_every' (int) -- period in epochs of saving full training state (parameters, optimizer and scheduler
+                states, learning curves, stopping criteria and random generators states) to the file
+                save_path + 'checkpoint' + exp_name + '.pt', which could be passed as resume argument. Checkpoint is also saved
+                on the last epoch. Defaults to "None": checkpoints are not saved.
+            'epochs' (int) -- maximal number of epochs, which also sets learning rate schedule length. Defaults to 20000.
+            'min_grad_norm', 'stop_window', 'stop_min_improvement', 'stop_monitor', 'time_budget', 'max_evaluations' --
+                other stopping criteria, see trainer.algorithms.StoppingCriteria.from_config. Loss function and gradient
+                norm are only checked on epochs, when they are evaluated (each save_every epochs). Each epoch pass over
+                train dataset is counted as loss function evaluation. Defaults to "None": disabled.
         save_path (str, optional): Folder path to save function product. Defaults to "None".
         exp_name (str, optional): Name of simulation, which is reflected in function product names. Defaults to "None".
         save_every (int, optional): The number which reflects following: the results would be saved every save_every epochs.
             If save_every equals None, then results will be saved at the end of learning. Defaults to "None".
         weight_names (str or list of str, optional): By spceifying `weight_names` it is possible to compute gradient only
             for several named parameters. Defaults to "None".
+        resume (str, optional): Path of the checkpoint to continue training from. Training is continued from the epoch next
+            to the checkpoint one with the same results, as uninterrupted training. Defaults to "None".
 
     Returns:
         Learning curve (list), containing quality criterion calculated each epoch of learning.
     """
-    epochs = int(2e+4)
-
-    if save_every is None:
-        save_every = epochs - 1
-
-    # Assign requires_grad of parameters, which are not within the weight_names to False
-    for name, p in model.named_parameters():
-        if name not in weight_names:
-            p.requires_grad = False
-
-    lrs = []
-    learning_curve_train = []
-    learning_curve_test = []
-    learning_curve_validate = []
-    learning_curve_train_qcrit = []
-    learning_curve_test_qcrit = []
-    learning_curve_validate_qcrit = []
-    grad_norm_curve = []
-    weights_norm_curve = []
-    weight_decay = 0 # 1e-5
-    # optimizer = torch.optim.SGD(model.parameters(), lr=5.e-0, momentum=0.99, weight_decay=weight_decay, nesterov=False)
-    optimizer = torch.optim.Adam(model.parameters(), lr=1.e-0, betas=(0.9, 0.9), weight_decay=weight_decay)
-    # optimizer = torch.optim.LBFGS(model.parameters(), lr=1e-0, history_size=1000, max_iter=10, line_search_fn="strong_wolfe", tolerance_change=1e-40, tolerance_grad=1e-40)
-    # scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', factor=0.5, \
-    #                                                        patience=epochs, threshold=1e-2, threshold_mode='abs')
+    if config_train is None:
+        config_train = {}
+    stopping = StoppingCriteria.from_config(config_train, epochs=int(2e+4))
+    epochs = stopping.epochs
+    profiler = Profiler(model, save_path + f'profile{exp_name}.jsonl', enabled=config_train.get('profile', False),
+                        append=resume is not None)
+    checkpoint_every = config_train.get('checkpoint_every', None)
+    writer = AsyncWriter(max_queue=config_train.get('writer_queue_size', 16), asynchronous=config_train.get('async_writer', True))
+
+    try:
+        if save_every is None:
+            save_every = max(epochs - 1, 1)
+
+        # Assign requires_grad of parameters, which are not within the weight_names to False
+        for name, p in model.named_parameters():
+            if name not in weight_names:
+                p.requires_grad = False
+
+        lrs = []
+        learning_curve_train = []
+        learning_curve_test = []
+        learning_curve_validate = []
+        learning_curve_train_qcrit = []
+        learning_curve_test_qcrit = []
+        learning_curve_validate_qcrit = []
+        grad_norm_curve = []
+        weights_norm_curve = []
+        curves = {'lc_train': learning_curve_train, 'lc_test': learning_curve_test, 'lc_validate': learning_curve_validate,
+                  'lc_qcrit_train': learning_curve_train_qcrit, 'lc_qcrit_test': learning_curve_test_qcrit,
+                  'lc_qcrit_validate': learning_curve_validate_qcrit, 'grad_norm': grad_norm_curve, 'param_norm': weights_norm_curve,
+                  'lrs': lrs}
+        weight_decay = 0 # 1e-5
+        # optimizer = torch.optim.SGD(model.parameters(), lr=5.e-0, momentum=0.99, weight_decay=weight_decay, nesterov=False)
+        optimizer = torch.optim.Adam(model.parameters(), lr=1.e-0, betas=(0.9, 0.9), weight_decay=weight_decay)
+        # optimizer = torch.optim.LBFGS(model.parameters(), lr=1e-0, history_size=1000, max_iter=10, line_search_fn="strong_wolfe", tolerance_change=1e-40, tolerance_grad=1e-40)
+        # scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', factor=0.5, \
+        #                                                        patience=epochs, threshold=1e-2, threshold_mode='abs')
     
-    lambda_lin = lambda epoch: 1#1 - (1 - 1e-1)*epoch/epochs
-    # scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lr_lambda=lambda_lin)
-    scheduler = torch.optim.lr_scheduler.LinearLR(optimizer, start_factor=1e-2, end_factor=1e-5, total_iters=epochs)
-
-    print_every = 1
-    timer = Timer()
-    general_timer = Timer()
-    general_timer.__enter__()
-
-    def accum_loss(dataset):
-        loss_val = 0
-        for batch in dataset:
-            loss_val += loss_fn(model, batch).item()
-        return loss_val
-
-    # Calculate initial values of loss and quality criterion on validation and test dataset
-    with torch.no_grad():
-        loss_val_test = accum_loss(test_dataset)
-        criterion_val_test = quality_criterion(model, test_dataset)
-        best_criterion_test = criterion_val_test
-        learning_curve_test.append(loss_val_test)
-        learning_curve_test_qcrit.append(criterion_val_test)
-        print("Begin: loss = {:.4e}, quality_criterion_test = {:.8f} dB.".format(loss_val_test, criterion_val_test))
-        loss_val_train = accum_loss(train_dataset)
-        criterion_val_train = quality_criterion(model, train_dataset)
-        learning_curve_train.append(loss_val_train)   
-        learning_curve_train_qcrit.append(criterion_val_train)
-        print("Begin: loss = {:.4e}, quality_criterion_train = {:.8f} dB.".format(loss_val_train, criterion_val_train))
-        loss_val_validate = accum_loss(validate_dataset)
-        criterion_val_validate = quality_criterion(model, validate_dataset)
-        learning_curve_validate.append(loss_val_validate)
-        learning_curve_validate_qcrit.append(criterion_val_validate)
-        print("Begin: loss = {:.4e}, quality_criterion_validate = {:.8f} dB.".format(loss_val_validate, criterion_val_validate))
-    
-    for epoch in range(epochs):
-        timer.__enter__()
-        for j, batch in enumerate(train_dataset):
-            def closure():
-                optimizer.zero_grad()
-                loss_val = loss_fn(model, batch)
-                loss_val.backward(create_graph=False)
-                return loss_val
-            optimizer.step(closure)
-            scheduler.step()
-            # scheduler.step(criterion_val)
-        
-        # Track NMSE values on validation and test dataset and save gradient, model parameters norm history
-        with torch.no_grad():
-            if epoch % save_every == 0:
-
-                # Track algorithm parameters
-                curr_params = torch.cat([p.view(-1) for p in model.parameters() if p.requires_grad == True], dim=0)
-                grad = torch.cat([p.grad.view(-1) for p in model.parameters() if p.requires_grad == True], dim=0)
-                grad_distr = [torch.norm(p.grad).item() for p in model.parameters() if p.requires_grad == True]
-                mu = scheduler.get_last_lr()[0]
-                grad_norm = torch.norm(grad).item()
-                grad_norm_curve.append(grad_norm)
-                weights_norm_curve.append(torch.norm(curr_params).item())
-                lrs.append(mu)
-
-                loss_val_train = accum_loss(train_dataset)
-                criterion_val_train = quality_criterion(model, train_dataset)
-                loss_val_test = accum_loss(test_dataset)
-                criterion_val_test = quality_criterion(model, test_dataset)
-                loss_val_validate = accum_loss(validate_dataset)
-                criterion_val_validate = quality_criterion(model, validate_dataset)
-
+        lambda_lin = lambda epoch: 1#1 - (1 - 1e-1)*epoch/epochs
+        # scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lr_lambda=lambda_lin)
+        scheduler = torch.optim.lr_scheduler.LinearLR(optimizer, start_factor=1e-2, end_factor=1e-5, total_iters=epochs)
+
+        print_every = 1
+        timer = Timer()
+        general_timer = Timer()
+        general_timer.__enter__()
+
+        # Evaluations on identical train, validation and test datasets with the same parameters are computed once
+        evaluate = Evaluator(model, loss_fn, quality_criterion, profiler=profiler)
+
+        if resume is None:
+            # Calculate initial values of loss and quality criterion on validation and test dataset
+            with torch.no_grad():
+                loss_val_test, criterion_val_test = evaluate(test_dataset)
+                best_criterion_test = criterion_val_test
                 learning_curve_test.append(loss_val_test)
-                learning_curve_train.append(loss_val_train)
-                learning_curve_validate.append(loss_val_validate)
                 learning_curve_test_qcrit.append(criterion_val_test)
+                print("Begin: loss = {:.4e}, quality_criterion_test = {:.8f} dB.".format(loss_val_test, criterion_val_test))
+                loss_val_train, criterion_val_train = evaluate(train_dataset)
+                learning_curve_train.append(loss_val_train)   
                 learning_curve_train_qcrit.append(criterion_val_train)
+                print("Begin: loss = {:.4e}, quality_criterion_train = {:.8f} dB.".format(loss_val_train, criterion_val_train))
+                loss_val_validate, criterion_val_validate = evaluate(validate_dataset)
+                learning_curve_validate.append(loss_val_validate)
                 learning_curve_validate_qcrit.append(criterion_val_validate)
-
-                if criterion_val_test < best_criterion_test:
-                    best_criterion_test = criterion_val_test
-                    torch.save(model.state_dict(), save_path+'weights_best_test'+exp_name)
-
-                    np.save(save_path + f'lc_train{exp_name}.npy', np.array(learning_curve_train))
-                    np.save(save_path + f'lc_test{exp_name}.npy', np.array(learning_curve_test))
-                    np.save(save_path + f'lc_validate{exp_name}.npy', np.array(learning_curve_validate))
-                    np.save(save_path + f'lc_qcrit_train{exp_name}.npy', np.array(learning_curve_train_qcrit))
-                    np.save(save_path + f'lc_qcrit_test{exp_name}.npy', np.array(learning_curve_test_qcrit))
-                    np.save(save_path + f'lc_qcrit_validate{exp_name}.npy', np.array(learning_curve_validate_qcrit))
-                    np.save(save_path + f'grad_norm{exp_name}.npy', np.array(grad_norm_curve))
-                    np.save(save_path + f'grad_distr{exp_name}.npy', np.array(grad_distr))
-                    np.save(save_path + f'param_norm{exp_name}.npy', np.array(weights_norm_curve))
-                    np.save(save_path + f'lrs{exp_name}.npy', np.array(lrs))
-        timer.__exit__()
-        if epoch % print_every == 0:
-            print(f"Epoch is {epoch + 1}, " + \
-                f"loss_train = {loss_val_train:.8f}, " + \
-                f"quality_criterion_train = {criterion_val_train:.8f} dB, stepsize = {mu:.6e}, " + \
-                f"|grad| = {grad_norm:.4e}, time elapsed: {timer.interval:.2e}")
-
+                print("Begin: loss = {:.4e}, quality_criterion_validate = {:.8f} dB.".format(loss_val_validate, criterion_val_validate))
+                # Initial evaluation is recorded as epoch 0
+                profiler.epoch_end(0, loss_train=loss_val_train, quality_criterion_train=criterion_val_train,
+                                   quality_criterion_test=criterion_val_test)
+            start_epoch = 0
+        else:
+            checkpoint = load_checkpoint(resume, 'sgd_auto')
+            model.load_state_dict(checkpoint['model'])
+            optimizer.load_state_dict(checkpoint['optimizer'])
+            scheduler.load_state_dict(checkpoint['scheduler'])
+            for name, curve in curves.items():
+                curve.extend(checkpoint['curves'][name])
+            mu, grad_norm = checkpoint['mu'], checkpoint['grad_norm']
+            loss_val_train, criterion_val_train = checkpoint['loss_val_train'], checkpoint['criterion_val_train']
+            loss_val_validate, criterion_val_test = checkpoint.get('loss_val_validate'), checkpoint.get('criterion_val_test')
+            best_criterion_test = checkpoint['best_criterion_test']
+            stopping.load_state_dict(checkpoint['stopping'])
+            evaluate.evaluations = checkpoint['evaluations']
+            start_epoch = checkpoint['epoch']
+            profiler.rewind(start_epoch)
+    
+        for epoch in range(start_epoch, epochs):
+            timer.__enter__()
+            for j, batch in enumerate(train_dataset):
+                def closure():
+                    with profiler.phase('gradient'):
+                        optimizer.zero_grad()
+                        loss_val = loss_fn(model, batch)
+                        loss_val.backward(create_graph=False)
+                    return loss_val
+                with profiler.phase('optimizer_step'):
+                    optimizer.step(closure)
+                scheduler.step()
+                # scheduler.step(criterion_val)
+        
+            # Track NMSE values on validation and test dataset and save gradient, model parameters norm history
+            evaluated = epoch % save_every == 0
+            with torch.no_grad():
+                if evaluated:
+
+                    # Track algorithm parameters
+                    curr_params = torch.cat([p.view(-1) for p in model.parameters() if p.requires_grad == True], dim=0)
+                    grad = torch.cat([p.grad.view(-1) for p in model.parameters() if p.requires_grad == True], dim=0)
+                    grad_distr = [torch.norm(p.grad).item() for p in model.parameters() if p.requires_grad == True]
+                    mu = scheduler.get_last_lr()[0]
+                    grad_norm = torch.norm(grad).item()
+                    grad_norm_curve.append(grad_norm)
+                    weights_norm_curve.append(torch.norm(curr_params).item())
+                    lrs.append(mu)
+
+                    loss_val_train, criterion_val_train = evaluate(train_dataset)
+                    loss_val_test, criterion_val_test = evaluate(test_dataset)
+                    loss_val_validate, criterion_val_validate = evaluate(validate_dataset)
+
+                    learning_curve_test.append(loss_val_test)
+                    learning_curve_train.append(loss_val_train)
+                    learning_curve_validate.append(loss_val_validate)
+                    learning_curve_test_qcrit.append(criterion_val_test)
+                    learning_curve_train_qcrit.append(criterion_val_train)
+                    learning_curve_validate_qcrit.append(criterion_val_validate)
+
+                    if criterion_val_test < best_criterion_test:
+                        best_criterion_test = criterion_val_test
+                        writer.save_state_dict(model.state_dict(), save_path+'weights_best_test'+exp_name)
+
+                        writer.append_curves({save_path + f'lc_train{exp_name}.npy': learning_curve_train,
+                                              save_path + f'lc_test{exp_name}.npy': learning_curve_test,
+                                              save_path + f'lc_validate{exp_name}.npy': learning_curve_validate,
+                                              save_path + f'lc_qcrit_train{exp_name}.npy': learning_curve_train_qcrit,
+                                              save_path + f'lc_qcrit_test{exp_name}.npy': learning_curve_test_qcrit,
+                                              save_path + f'lc_qcrit_validate{exp_name}.npy': learning_curve_validate_qcrit,
+                                              save_path + f'grad_norm{exp_name}.npy': grad_norm_curve,
+                                              save_path + f'param_norm{exp_name}.npy': weights_norm_curve,
+                                              save_path + f'lrs{exp_name}.npy': lrs})
+                        writer.save_array(save_path + f'grad_distr{exp_name}.npy', grad_distr)
+            timer.__exit__()
+            profiler.epoch_end(epoch + 1, loss_train=loss_val_train, quality_criterion_train=criterion_val_train,
+                               quality_criterion_test=criterion_val_test, lr=scheduler.get_last_lr()[0])
+            if epoch % print_every == 0:
+                print(f"Epoch is {epoch + 1}, " + \
+                    f"loss_train = {loss_val_train:.8f}, " + \
+                    f"quality_criterion_train = {criterion_val_train:.8f} dB, stepsize = {mu:.6e}, " + \
+                    f"|grad| = {grad_norm:.4e}, time elapsed: {timer.interval:.2e}")
+
+            general_timer.__exit__()
+            print(f"Total time elapsed: {general_timer.interval} s")
+            stop = stopping(epoch + 1, loss=loss_val_train if evaluated else None, loss_validate=loss_val_validate if evaluated else None,
+                            grad_norm=grad_norm if evaluated else None, evaluations=evaluate.evaluations + epoch + 1)
+            if checkpoint_every is not None and ((epoch + 1) % checkpoint_every == 0 or stop):
+                save_checkpoint(writer, save_path + f'checkpoint{exp_name}.pt', 'sgd_auto', epoch + 1, model=model.state_dict(),
+                                optimizer=optimizer.state_dict(), scheduler=scheduler.state_dict(), curves=curves, mu=mu,
+                                grad_norm=grad_norm, loss_val_train=loss_val_train, criterion_val_train=criterion_val_train,
+                                loss_val_validate=loss_val_validate, criterion_val_test=criterion_val_test,
+                                best_criterion_test=best_criterion_test, stopping=stopping.state_dict(),
+                                evaluations=evaluate.evaluations)
+            if stop:
+                print(f"Training is stopped: {stopping.reason}.")
+                break
+            
         general_timer.__exit__()
         print(f"Total time elapsed: {general_timer.interval} s")
-            
-    general_timer.__exit__()
-    print(f"Total time elapsed: {general_timer.interval} s")
-
+        profiler.summary()
+    finally:
+        # Queued writes and profiler hook are released also if training raises
+        profiler.close()
+        writer.close()
     return learning_curve_test, best_criterion_test
\ No newline at end of file
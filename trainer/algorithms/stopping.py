@@ -0,0 +1,192 @@
+import time
+from typing import Union, Callable, List
+
+OptionalInt = Union[int, None]
+OptionalFloat = Union[float, None]
+OptionalStr = Union[str, None]
+CriterionType = Callable[..., OptionalStr]
+
+
+class MaxEpochs:
+    """
+    Stops training after the given number of epochs.
+    """
+    def __init__(self, epochs: int):
+        self.epochs = epochs
+
+    def __call__(self, epoch: int, **state) -> OptionalStr:
+        if epoch >= self.epochs:
+            return f"maximal number of epochs {self.epochs} is reached"
+
+
+class GradNorm:
+    """
+    Stops training when gradient norm is lower than min_grad_norm.
+    """
+    def __init__(self, min_grad_norm: float):
+        self.min_grad_norm = min_grad_norm
+
+    def __call__(self, grad_norm: OptionalFloat = None, **state) -> OptionalStr:
+        if grad_norm is not None and grad_norm < self.min_grad_norm:
+            return f"gradient norm {grad_norm:.4e} is lower than {self.min_grad_norm:.4e}"
+
+
+class RelativeImprovement:
+    """
+    Stops training when the monitored value (e.g. train loss function) is not improved by more than min_improvement
+    relatively over the last window checks: (best before window - best within window) / |best before window| < min_improvement.
+    Loss function relative improvement r corresponds to 10 * log10(1 - r) dB of NMSE improvement.
+    Checks, which don`t provide the monitored value (e.g. epochs without evaluation), are not counted.
+    """
+    def __init__(self, window: int, min_improvement: float, monitor: str = 'loss'):
+        assert window >= 1, "window must be positive."
+        self.window = window
+        self.min_improvement = min_improvement
+        self.monitor = monitor
+        self.history = []
+
+    def __call__(self, **state) -> OptionalStr:
+        value = state.get(self.monitor, None)
+        if value is None:
+            return
+        self.history.append(value)
+        if len(self.history) <= self.window:
+            return
+        best_before = min(self.history[:-self.window])
+        best_within = min(self.history[-self.window:])
+        improvement = (best_before - best_within) / max(abs(best_before), 1e-300)
+        if improvement < self.min_improvement:
+            return f"relative improvement of {self.monitor} {improvement:.4e} over {self.window} checks " + \
+                   f"is lower than {self.min_improvement:.4e}"
+
+
+class TimeBudget:
+    """
+    Stops training when wall-clock time since StoppingCriteria.start exceeds budget in seconds.
+    Criterion is checked at the end of epoch, thus the last epoch may exceed the budget.
+    """
+    def __init__(self, budget: float):
+        self.budget = budget
+
+    def __call__(self, elapsed: float, **state) -> OptionalStr:
+        if elapsed >= self.budget:
+            return f"time budget {self.budget:.1f} s is exhausted ({elapsed:.1f} s elapsed)"
+
+
+class MaxEvaluations:
+    """
+    Stops training when the number of loss function evaluations on the whole dataset reaches max_evaluations,
+    see trainer.algorithms.Evaluator.evaluations.
+    """
+    def __init__(self, max_evaluations: int):
+        self.max_evaluations = max_evaluations
+
+    def __call__(self, evaluations: OptionalInt = None, **state) -> OptionalStr:
+        if evaluations is not None and evaluations >= self.max_evaluations:
+            return f"maximal number of evaluations {self.max_evaluations} is reached"
+
+
+class StoppingCriteria:
+    """
+    The class combines stopping criteria of the training algorithms. Each criterion is a callable, which takes training state
+    as keyword arguments and returns the reason to stop (str) or "None". State contains:
+        'epoch' (int) -- number of finished epochs;
+        'elapsed' (float) -- wall-clock time since start call in seconds;
+        'loss' (float) -- train loss function value, "None" if it isn`t evaluated on the epoch;
+        'loss_validate' (float) -- validation loss function value, "None" if it isn`t evaluated on the epoch;
+        'grad_norm' (float) -- gradient norm, "None" if it isn`t computed on the epoch;
+        'evaluations' (int) -- number of loss function evaluations on the whole dataset.
+    Training stops when any criterion returns the reason, which is kept in reason attribute.
+    Custom criteria could be added by add method, criteria defined by the training config are built by from_config.
+    """
+    def __init__(self, criteria: List[CriterionType]):
+        """
+        Constructor of the StoppingCriteria class.
+
+        Args:
+            criteria (list of Callable): Stopping criteria.
+        """
+        self.criteria = list(criteria)
+        self.reason = None
+        self.start()
+
+    @classmethod
+    def from_config(cls, config_train: dict, epochs: int, min_grad_norm: OptionalFloat = None) -> 'StoppingCriteria':
+        """
+        Builds stopping criteria by training config keys:
+            'epochs' (int) -- maximal number of epochs, see MaxEpochs. Defaults to epochs argument.
+            'min_grad_norm' (float) -- minimal gradient norm, see GradNorm. Defaults to min_grad_norm argument.
+            'stop_window' (int) and 'stop_min_improvement' (float) -- window and minimal relative improvement,
+                see RelativeImprovement. Both are required to enable the criterion. Defaults to "None".
+            'stop_monitor' (str) -- value monitored by RelativeImprovement: 'loss' or 'loss_validate'. Defaults to 'loss'.
+            'time_budget' (float) -- wall-clock time budget in seconds, see TimeBudget. Defaults to "None".
+            'max_evaluations' (int) -- maximal number of loss function evaluations, see MaxEvaluations. Defaults to "None".
+        Criteria with "None" values are disabled.
+
+        Args:
+            config_train (dictionary): Dictionary with configurations of training procedure.
+            epochs (int): Default maximal number of epochs of the training algorithm.
+            min_grad_norm (float, optional): Default minimal gradient norm of the training algorithm. Defaults to "None".
+
+        Returns:
+            StoppingCriteria instance.
+        """
+        criteria = [MaxEpochs(int(config_train.get('epochs', epochs)))]
+        min_grad_norm = config_train.get('min_grad_norm', min_grad_norm)
+        if min_grad_norm is not None:
+            criteria.append(GradNorm(float(min_grad_norm)))
+        window = config_train.get('stop_window', None)
+        min_improvement = config_train.get('stop_min_improvement', None)
+        if window is not None and min_improvement is not None:
+            criteria.append(RelativeImprovement(int(window), float(min_improvement), config_train.get('stop_monitor', 'loss')))
+        if config_train.get('time_budget', None) is not None:
+            criteria.append(TimeBudget(float(config_train['time_budget'])))
+        if config_train.get('max_evaluations', None) is not None:
+            criteria.append(MaxEvaluations(int(config_train['max_evaluations'])))
+        return cls(criteria)
+
+    @property
+    def epochs(self) -> OptionalInt:
+        """
+        Maximal number of epochs, which is used to size schedules and saving period.
+        """
+        return min([c.epochs for c in self.criteria if isinstance(c, MaxEpochs)], default=None)
+
+    def add(self, criterion: CriterionType):
+        self.criteria.append(criterion)
+
+    def state_dict(self) -> list:
+        """
+        Returns histories of the criteria, which depend on the previous checks (e.g. RelativeImprovement), for resume.
+        """
+        return [list(getattr(criterion, 'history', [])) for criterion in self.criteria]
+
+    def load_state_dict(self, state: list):
+        for criterion, history in zip(self.criteria, state):
+            if hasattr(criterion, 'history'):
+                criterion.history = list(history)
+
+    def start(self):
+        """
+        Starts wall-clock time measurement of TimeBudget.
+        """
+        self.start_time = time.perf_counter()
+
+    def __call__(self, epoch: int, **state) -> bool:
+        """
+        Checks stopping criteria at the end of epoch.
+
+        Args:
+            epoch (int): Number of finished epochs.
+            **state: Training state values, see class description.
+
+        Returns:
+            bool: Whether to stop training.
+        """
+        state['elapsed'] = time.perf_counter() - self.start_time
+        for criterion in self.criteria:
+            reason = criterion(epoch=epoch, **state)
+            if reason is not None:
+                self.reason = reason
+                return True
+        return False
@@ -0,0 +1,89 @@
+import torch
+from torch import nn, Tensor
+from typing import Union
+
+OptionalStr = Union[str, None]
+
+class CompiledForward:
+    """
+    Replacement of the model forward, which is compiled by torch.compile once per input shape (dynamic=False),
+    thus each graph is specialized to the chunk shape.
+
+    Input is made contiguous, since batches of utils.ResampleDataset are strided views of the signal, and strides
+    are also specialized. Batches have the same shape except for the last one, which could have fewer chunks.
+    It is padded by zero chunks up to the largest batch size seen for the same chunk shape, and the output is sliced back,
+    so that no recompilation is triggered. Padding is correct if chunks are processed independently, thus it is disabled
+    for models with batch normalization in training mode.
+
+    Eager forward is called if compiled graph can`t be reused: inside torch.func transforms (jacobian strategies "jacfwd"
+    and "jacrev", oracle.FunctionalOracle) and while parameters are extracted from the model or substituted
+    (oracle.Oracle jacobian and hessian), which are computed by automatic differentiation of the eager model.
+    Thus compiled forward is used by the loss function and quality criterion evaluations (see trainer.algorithms.Evaluator)
+    and SGD training steps, and loss closures of the oracle work through it without separate compilation.
+
+    Model bases caches (model.layers.BasisCache) are bypassed by the compiled forward.
+    """
+    def __init__(self, model: nn.Module, backend: str = 'inductor', mode: OptionalStr = None, pad_batch: bool = True):
+        """
+        Constructor of the CompiledForward class.
+
+        Args:
+            model (nn.Module): The model to compile forward of.
+            backend (str): torch.compile backend. Defaults to 'inductor'.
+            mode (str, optional): torch.compile mode. Defaults to "None".
+            pad_batch (bool): Whether to pad the shorter batches. Defaults to "True".
+        """
+        self.eager = model.forward
+        self.compiled = torch.compile(self.eager, backend=backend, mode=mode, dynamic=False)
+        self.param_num = len(list(model.parameters()))
+        self.model = model
+        self.pad_batch = pad_batch
+        self.norms = [module for module in model.modules() if 'BatchNorm' in type(module).__name__]
+        self.batch_size = {}
+
+    def _compilable(self) -> bool:
+        if torch._C._functorch.maybe_current_level() is not None:
+            return False
+        params = list(self.model.parameters())
+        return len(params) == self.param_num and all(isinstance(p, nn.Parameter) for p in params)
+
+    def __call__(self, x: Tensor) -> Tensor:
+        if not self._compilable():
+            return self.eager(x)
+        x = x.contiguous()
+        if not self.pad_batch or any(module.training for module in self.norms):
+            return self.compiled(x)
+        key = tuple(x.shape[1:])
+        batch_size = max(self.batch_size.get(key, 0), x.shape[0])
+        self.batch_size[key] = batch_size
+        if x.shape[0] == batch_size:
+            return self.compiled(x)
+        padding = torch.zeros(batch_size - x.shape[0], *key, dtype=x.dtype, device=x.device)
+        return self.compiled(torch.cat([x, padding], dim=0))[:x.shape[0]]
+
+def compile_model(model: nn.Module, config_train: dict) -> nn.Module:
+    """
+    Replaces the model forward in place by CompiledForward, so that training algorithms, oracles and evaluators use it
+    without changes. Model attributes, parameters and state dictionary are not changed. Training config keys:
+        'compile_backend' (str) -- torch.compile backend. Defaults to 'inductor'.
+        'compile_mode' (str) -- torch.compile mode, e.g. 'max-autotune'. Defaults to "None".
+        'compile_pad_batch' (bool) -- whether to pad the last shorter batch, see CompiledForward. Defaults to "True".
+
+    Args:
+        model (nn.Module): The model to compile forward of.
+        config_train (dictionary): Dictionary with configurations of training procedure.
+
+    Returns:
+        The same model.
+    """
+    model.forward = CompiledForward(model, config_train.get('compile_backend', 'inductor'), config_train.get('compile_mode', None),
+                                    config_train.get('compile_pad_batch', True))
+    return model
+
+def uncompile_model(model: nn.Module) -> nn.Module:
+    """
+    Restores eager forward of the model compiled by compile_model.
+    """
+    if isinstance(model.__dict__.get('forward', None), CompiledForward):
+        del model.forward
+    return model
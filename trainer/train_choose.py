@@ -2,6 +2,7 @@ import torch
 from torch import nn, Tensor
 from typing import List, Tuple, Union, Callable, Iterable
 from .algorithms import train_sgd_auto, train_mixed_newton_levenb_marq,train_ls
+from .compile import compile_model, uncompile_model
 
 
 OptionalInt = Union[int, None]
@@ -17,7 +18,8 @@ def train(model: nn.Module, train_dataset: DataLoaderType, loss_fn: LossFnType,
           config_train: dict, batch_to_tensors: OptionalBatchTensor = None, validate_dataset: OptionalDataLoader = None, 
           test_dataset: OptionalDataLoader = None, train_type: OptionalStr = None,
           save_path: OptionalStr = None, exp_name: OptionalStr = None, save_every: OptionalInt = None, 
-          chunk_num: OptionalInt = None, weight_names: StrOrList = None, device: OptionalStr = None) -> None:
+          chunk_num: OptionalInt = None, weight_names: StrOrList = None, device: OptionalStr = None,
+          resume: OptionalStr = None) -> None:
     """
     This function activates model training functions depending on the required training type.
 
@@ -32,6 +34,8 @@ def train(model: nn.Module, train_dataset: DataLoaderType, loss_fn: LossFnType,
             process, but it`s only used to estimate model quality in more reasonable units comparing to the loss_fn.
         config_train (dictionary): Dictionary with configurations of training procedure. Includes learning rate, training type,
             optimizers parameters etc. Implied to be loaded from .yaml config file.
+            If config_train['compile'] is "True", then the model forward is compiled by torch.compile during training,
+            see trainer.compile_model. Defaults to eager mode.
         batch_to_tensors (Callable, optional): Function which acquires signal batch as an input and returns tuple of tensors, where
             the first tensor corresponds to model input, the second one - to the target signal. This function is used to
             obtain differentiable model output tensor to calculate jacobian.
@@ -55,6 +59,9 @@ def train(model: nn.Module, train_dataset: DataLoaderType, loss_fn: LossFnType,
         weight_names (str or list of str, optional): By spceifying `weight_names` it is possible to compute gradient only
             for several named parameters. Defaults to "None".
         device (str, optional): device to implement calculations: "cpu" or "cuda:0". Defaults is None.
+        resume (str, optional): Path of the checkpoint, saved by the training function of the same train_type
+            (save_path + 'checkpoint' + exp_name + '.pt'), to continue interrupted training from. Model, datasets and
+            config_train are implied to be the same as in interrupted run. Defaults is None.
 
     Returns:
         Learning curve (list), containing quality criterion calculated each epoch of learning.
@@ -71,24 +78,38 @@ def train(model: nn.Module, train_dataset: DataLoaderType, loss_fn: LossFnType,
     if train_type is None:
         train_type = 'sgd_auto'
 
-    best_criterion = None
+    if resume is None:
+        torch.save(model.state_dict(), save_path+'weights_init'+exp_name)
 
+    if config_train is not None and config_train.get('compile', False):
+        compile_model(model, config_train)
+
+    try:
+        learning_curve, best_criterion = _train(model, train_dataset, loss_fn, quality_criterion, config_train, batch_to_tensors,
+                                                validate_dataset, test_dataset, train_type, save_path, exp_name, save_every,
+                                                chunk_num, weight_names, resume)
+    finally:
+        uncompile_model(model)
+    return learning_curve, best_criterion
+
+def _train(model, train_dataset, loss_fn, quality_criterion, config_train, batch_to_tensors, validate_dataset, test_dataset,
+           train_type, save_path, exp_name, save_every, chunk_num, weight_names, resume):
+    learning_curve, best_criterion = None, None
     save_signals = True
-    
-    torch.save(model.state_dict(), save_path+'weights_init'+exp_name)
 
     if train_type == 'sgd_auto':
         learning_curve, best_criterion = train_sgd_auto(model, train_dataset, validate_dataset, test_dataset, loss_fn, 
                                                         quality_criterion, batch_to_tensors, config_train, save_path, exp_name,
-                                                        save_every, weight_names)
+                                                        save_every, weight_names, resume=resume)
     elif train_type == 'mnm_lev_marq':
         learning_curve, best_criterion = train_mixed_newton_levenb_marq(model, train_dataset, validate_dataset, test_dataset, loss_fn, 
                                                                         quality_criterion, batch_to_tensors, chunk_num, 
-                                                                        save_path, exp_name, save_every, save_signals, weight_names)
+                                                                        save_path, exp_name, save_every, save_signals, weight_names,
+                                                                        config_train, resume=resume)
     elif train_type == 'ls':
         learning_curve, best_criterion = train_ls(model, train_dataset, validate_dataset, test_dataset, loss_fn, 
                                                                         quality_criterion, batch_to_tensors, chunk_num, 
-                                                                        save_path, exp_name, weight_names)
+                                                                        save_path, exp_name, weight_names, config_train, resume=resume)
 
     else:
         print(f"Attention! Training type \'{train_type}\' doesn`t match any of the possible types: \'sgd\', \'mnm\'.")
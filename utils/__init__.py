@@ -1,3 +1,5 @@
-from .metrics import NMSE, nmse
+from .metrics import NMSE, nmse, NMSECriterion
 from .timer import Timer
-from .data_manage import dataset_prepare, dynamic_dataset_prepare, ResampleDataset
\ No newline at end of file
+from .data_manage import dataset_prepare, dynamic_dataset_prepare, ResampleDataset
+from .profiler import Profiler
+from .writer import AsyncWriter, append_npy
\ No newline at end of file
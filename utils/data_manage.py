@@ -4,6 +4,10 @@ import torch.nn.functional as F
 import scipy.signal as signal
 from scipy.io import loadmat
 import sys
+import os
+import json
+import shutil
+import hashlib
 import numpy as np
 from scipy.io import loadmat
 
@@ -14,6 +18,9 @@ DatasetType = Union[Tuple[Iterable, ...], Tuple[Tuple[Iterable, ...], ...]]
 ListOfStr = List[str]
 ListOfFloat = List[float]
 
+# Version of the prepared dataset cache format. Must be increased, when preparation of cached signals changes.
+DATASET_CACHE_VERSION = 1
+
 class ResampleDataset(torch.utils.data.Dataset):
     """
     The dataset class that extracts batches in a tuple type, where the first
@@ -41,10 +48,138 @@ class ResampleDataset(torch.utils.data.Dataset):
     def __len__(self) -> int:
         return self.batch_num
 
+def _split_loader(input: torch.Tensor, target: torch.Tensor, input_start: int, input_size: int, target_start: int, target_size: int,
+                  block_size: int, block_size_target: int, pad_zeros: int, batch_size: int, loaders: dict,
+                  input_channels: int = 2, target_channels: int = 1) -> Iterable:
+    """
+    Returns dataloader of the signals part, divided into blocks. Blocks are overlapping strided views of one base buffer:
+    the signals part itself, when pad_zeros == 0 and the part is contiguous, or its single zero-padded (flattened) copy otherwise.
+    Thus blocks are never copied.
+    Dataloaders are stored in loaders dictionary by the part position and block sizes, so the same dataloader object is returned
+    for the identical train, validation and test parts, and their data is stored once.
+
+    Args:
+        input (torch.Tensor): Input signal of shape (1, ..., sample_size). All dimensions except the first one and
+            the channel one are flattened into samples dimension.
+        target (torch.Tensor): Target signal of shape (1, ..., sample_size).
+        input_start (int): Index of the first input sample of the part.
+        input_size (int): Number of input samples in the part.
+        target_start (int): Index of the first target sample of the part.
+        target_size (int): Number of target samples in the part.
+        block_size (int): Number of input samples in each block, excluding padding.
+        block_size_target (int): Number of target samples in each block.
+        pad_zeros (int): The number of zeros to add to the beginning and to the end of the input part.
+        batch_size (int): The number of blocks in each batch.
+        loaders (dict): Dictionary of already prepared dataloaders.
+        input_channels (int): Number of input channels. Defaults is 2.
+        target_channels (int): Number of target channels. Defaults is 1.
+
+    Returns:
+        Dataloader, which yields tuples of input and target batches.
+    """
+    key = (input_start, input_size, target_start, target_size, block_size, block_size_target)
+    if key in loaders:
+        return loaders[key]
+    input_set = input[..., input_start: input_start + input_size]
+    if pad_zeros > 0:
+        input_set = F.pad(input_set, (pad_zeros, pad_zeros))
+    target_set = target[..., target_start: target_start + target_size]
+    input_set = input_set.reshape(1, input_channels, -1)
+    target_set = target_set.reshape(1, target_channels, -1)
+    input_set = input_set.unfold(2, block_size + 2*pad_zeros, block_size)[0, ...].permute(1, 0, 2)
+    target_set = target_set.unfold(2, block_size_target, block_size_target)[0, ...].permute(1, 0, 2)
+    split_set = ResampleDataset(tuple((input_set, target_set)), batch_size=batch_size)
+    loaders[key] = torch.utils.data.DataLoader(split_set, batch_size=None)
+    return loaders[key]
+
+def _file_hash(path: str) -> str:
+    """
+    Returns sha256 hash of the file content.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def _load_dynamic_signals(data_path: ListOfStr, pa_powers: ListOfFloat, dtype: torch.dtype = torch.complex128,
+                          delay_d: OptionalInt = None) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Loads mat-files with dynamic data and returns CPU tensors: input with shape (1, 2, 1, sample_size), which includes
+    PA input signal and PA output power channel, and target with shape (1, 1, sample_size).
+    """
+    input, target = [], []
+    for path in data_path:
+        mat = loadmat(path)
+        input_tensor = torch.tensor(mat['TX'][0, :], dtype=dtype).view(1, 1, -1)
+        target_tensor = torch.tensor(mat['PAout'][0, :] - mat['TX'][0, :], dtype=dtype).view(1, 1, -1)
+        input.append(input_tensor)
+        target.append(target_tensor)
+
+    pa_list = [pa_pow * torch.ones(1, 1, input[0].numel()) for pa_pow in pa_powers]
+    pa_powers = torch.cat(pa_list, dim=1).to(dtype)
+
+
+    input = torch.cat(input, dim=1)
+    target = torch.cat(target, dim=1)
+
+    input = torch.cat([input[:, None, ...], pa_powers[:, None, ...]], dim=1)
+
+    if delay_d is not None and delay_d != 0:
+        target = torch.roll(target, -delay_d, dims=-1)
+
+    input = input / 1
+    target = target / 1
+    return input, target
+
+def _cached_dynamic_signals(cache_dir: str, data_path: ListOfStr, pa_powers: ListOfFloat, dtype: torch.dtype = torch.complex128,
+                            delay_d: OptionalInt = None, slot_num: OptionalInt = None) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Returns the same tensors as _load_dynamic_signals, but stores them in cache_dir as .npy files on the first call
+    and memory-maps them on next calls, so mat-files are not parsed. Cache entry is identified by hashes of mat-files content,
+    preparation arguments and DATASET_CACHE_VERSION. Each entry is a folder with files:
+        input.npy -- PA input signal and PA output power channel, shape (1, 2, 1, sample_size),
+        target.npy -- target signal, shape (1, 1, sample_size),
+        meta.json -- format version, preparation arguments, source files hashes and slot boundaries.
+    """
+    meta = {
+        'version': DATASET_CACHE_VERSION,
+        'data_hash': [_file_hash(path) for path in data_path],
+        'pa_powers': [float(pa_pow) for pa_pow in pa_powers],
+        'dtype': str(dtype),
+        'delay_d': delay_d,
+        'slot_num': slot_num,
+    }
+    key = hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest()
+    entry_path = os.path.join(cache_dir, key)
+
+    if not os.path.isdir(entry_path):
+        input, target = _load_dynamic_signals(data_path, pa_powers, dtype, delay_d)
+        if slot_num is not None:
+            meta['slot_bounds'] = [int(input.shape[-1]/slot_num) * j_slot for j_slot in range(slot_num + 1)]
+        meta['data_path'] = list(data_path)
+        # Entry is written into temporary folder and renamed, thus interrupted writing doesn`t corrupt cache
+        tmp_path = entry_path + f'.tmp{os.getpid()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, 'input.npy'), input.numpy())
+        np.save(os.path.join(tmp_path, 'target.npy'), target.numpy())
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=4)
+        try:
+            os.replace(tmp_path, entry_path)
+        except OSError:
+            # Entry has been written by concurrent process
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    # Copy-on-write memory map: data is read from disk lazily and the file is never modified
+    input = torch.from_numpy(np.load(os.path.join(entry_path, 'input.npy'), mmap_mode='c'))
+    target = torch.from_numpy(np.load(os.path.join(entry_path, 'target.npy'), mmap_mode='c'))
+    return input, target
+
 def dynamic_dataset_prepare(data_path: ListOfStr, pa_powers: ListOfFloat, dtype: torch.dtype = torch.complex128, device: str = 'cuda', batch_size: OptionalInt = None, 
                     block_size: OptionalInt = None, slot_num: OptionalInt = None, pad_zeros: OptionalInt = None, 
                     delay_d: OptionalInt = None, train_slots_ind: range = range(1), validat_slots_ind: range = range(1),
-                    test_slots_ind: range = range(1)) -> DatasetType:
+                    test_slots_ind: range = range(1), cache_dir: OptionalStr = None) -> DatasetType:
     """
     The method extracts input and target data for the mat file, normalizes and resamples if necessary.
     Then it divides input and target tensors into the batches and loads them into the dataloader.
@@ -66,6 +201,9 @@ def dynamic_dataset_prepare(data_path: ListOfStr, pa_powers: ListOfFloat, dtype:
         validat_slots_ind (range): Used only for hold-out cross-validation. Indices of the slots which are chosen for validation dataset. 
             A range with step 1. Defaults is range(1).
         test_slots_ind (range): Indices of the slots which are chosen for training dataset. A range with step 1. Defaults is range(1).
+        cache_dir (str, optional): Folder to store prepared signals in. If specified, signals prepared on the first call are saved
+            there and memory-mapped on next calls with the same mat-files and arguments, thus mat-files are not loaded.
+            Defaults is "None", which means no cache.
             
     Returns:
         Tuple of iterables.
@@ -80,28 +218,12 @@ def dynamic_dataset_prepare(data_path: ListOfStr, pa_powers: ListOfFloat, dtype:
     assert len(data_path) == len(pa_powers), "Number of dynamic cases in data_path must equal number of corresponding PA output powers."
     dynam_case_num = len(data_path)
 
-    input, target = [], []
-    for path in data_path:
-        mat = loadmat(path)
-        input_tensor = torch.tensor(mat['TX'][0, :], dtype=dtype).view(1, 1, -1).to(device)
-        target_tensor = torch.tensor(mat['PAout'][0, :] - mat['TX'][0, :], dtype=dtype).view(1, 1, -1).to(device)
-        input.append(input_tensor)
-        target.append(target_tensor)
-
-    pa_list = [pa_pow * torch.ones(1, 1, input[0].numel()) for pa_pow in pa_powers]
-    pa_powers = torch.cat(pa_list, dim=1).to(device).to(dtype)
-
-
-    input = torch.cat(input, dim=1)
-    target = torch.cat(target, dim=1)
-
-    input = torch.cat([input[:, None, ...], pa_powers[:, None, ...]], dim=1)
-
-    if delay_d is not None and delay_d != 0:
-        target = torch.roll(target, -delay_d, dims=-1)
-
-    input = input / 1
-    target = target / 1
+    if cache_dir is None:
+        input, target = _load_dynamic_signals(data_path, pa_powers, dtype, delay_d)
+    else:
+        input, target = _cached_dynamic_signals(cache_dir, data_path, pa_powers, dtype, delay_d, slot_num)
+    input = input.to(device)
+    target = target.to(device)
 
     assert (np.array(train_slots_ind) < slot_num).all() and (np.array(train_slots_ind) >= 0).all(), \
         "All train slots indices (argument train_slots_ind) must be positive and lower, than number of slots (argument slot_num)."
@@ -139,39 +261,17 @@ def dynamic_dataset_prepare(data_path: ListOfStr, pa_powers: ListOfFloat, dtype:
     block_size_validat_target = block_size_validat
     
     dataset = list()
-    
-    train_input_set = input[..., train_slots_ind[0] * slot_input_size: train_slots_ind[0] * slot_input_size + input_train_size]
-    train_input_set = F.pad(train_input_set, (pad_zeros, pad_zeros))
-    train_target_set = target[..., train_slots_ind[0] * slot_target_size: train_slots_ind[0] * slot_target_size + target_train_size]
-    train_input_set = train_input_set.reshape(1, 2, -1)
-    train_target_set = train_target_set.reshape(1, 1, -1)
-    train_input_set = train_input_set.unfold(2, block_size + 2*pad_zeros, int(block_size))[0, ...].permute(1, 0, 2)
-    train_target_set = train_target_set.unfold(2, block_size_target, int(block_size_target))[0, ...].permute(1, 0, 2)
-    train_set = tuple((train_input_set, train_target_set))
-    train_set = ResampleDataset(train_set, batch_size=batch_size)
-    train_set = torch.utils.data.DataLoader(train_set, batch_size=None)
-    
-    validat_input_set = input[..., validat_slots_ind[0] * slot_input_size: validat_slots_ind[0] * slot_input_size + input_validat_size]
-    validat_input_set = F.pad(validat_input_set, (pad_zeros, pad_zeros))
-    validat_target_set = target[..., validat_slots_ind[0] * slot_target_size: validat_slots_ind[0] * slot_target_size + target_validat_size]
-    validat_input_set = validat_input_set.reshape(1, 2, -1)
-    validat_target_set = validat_target_set.reshape(1, 1, -1)
-    validat_input_set = validat_input_set.unfold(2, block_size_validat + 2*pad_zeros, block_size_validat)[0, ...].permute(1, 0, 2)
-    validat_target_set = validat_target_set.unfold(2, block_size_validat_target, block_size_validat_target)[0, ...].permute(1, 0, 2)
-    validat_set = tuple((validat_input_set, validat_target_set))
-    validat_set = ResampleDataset(validat_set, batch_size=batch_size)
-    validat_set = torch.utils.data.DataLoader(validat_set, batch_size=None)
-
-    test_input_set = input[..., test_slots_ind[0] * slot_input_size: test_slots_ind[0] * slot_input_size + input_test_size]
-    test_input_set = F.pad(test_input_set, (pad_zeros, pad_zeros))
-    test_target_set = target[..., test_slots_ind[0] * slot_target_size: test_slots_ind[0] * slot_target_size + target_test_size]
-    test_input_set = test_input_set.reshape(1, 2, -1)
-    test_target_set = test_target_set.reshape(1, 1, -1)
-    test_input_set = test_input_set.unfold(2, block_size_test + 2*pad_zeros, block_size_test)[0, ...].permute(1, 0, 2)
-    test_target_set = test_target_set.unfold(2, block_size_test_target, block_size_test_target)[0, ...].permute(1, 0, 2)
-    test_set = tuple((test_input_set, test_target_set))
-    test_set = ResampleDataset(test_set, batch_size=batch_size)
-    test_set = torch.utils.data.DataLoader(test_set, batch_size=None)
+    loaders = dict()
+
+    train_set = _split_loader(input, target, train_slots_ind[0] * slot_input_size, input_train_size,
+                              train_slots_ind[0] * slot_target_size, target_train_size,
+                              int(block_size), int(block_size_target), pad_zeros, batch_size, loaders)
+    validat_set = _split_loader(input, target, validat_slots_ind[0] * slot_input_size, input_validat_size,
+                                validat_slots_ind[0] * slot_target_size, target_validat_size,
+                                block_size_validat, block_size_validat_target, pad_zeros, batch_size, loaders)
+    test_set = _split_loader(input, target, test_slots_ind[0] * slot_input_size, input_test_size,
+                             test_slots_ind[0] * slot_target_size, target_test_size,
+                             block_size_test, block_size_test_target, pad_zeros, batch_size, loaders)
     
     dataset.append(tuple((train_set, validat_set, test_set)))
     return dataset[0]
@@ -274,35 +374,21 @@ def dataset_prepare(mat: dict, dtype: torch.dtype = torch.complex128, device: st
     block_size_validat_target = block_size_validat
     
     dataset = list()
-    
-    train_input_set = input[..., train_slots_ind[0] * slot_input_size: train_slots_ind[0] * slot_input_size + input_train_size]
-    train_input_set = F.pad(train_input_set, (pad_zeros, pad_zeros))
-    train_target_set = torch.cat((target, nf), dim=1)[..., train_slots_ind[0] * slot_target_size: train_slots_ind[0] * slot_target_size + target_train_size]
+    loaders = dict()
+    target = torch.cat((target, nf), dim=1)
 
-    train_input_set = train_input_set.unfold(2, block_size + 2*pad_zeros, int(block_size))[0, ...].permute(1, 0, 2)
-    train_target_set = train_target_set.unfold(2, block_size_target, int(block_size_target))[0, ...].permute(1, 0, 2)
-    train_set = tuple((train_input_set, train_target_set))
-    train_set = ResampleDataset(train_set, batch_size=batch_size)
-
-    train_set = torch.utils.data.DataLoader(train_set, batch_size=None)
-    
-    validat_input_set = input[..., validat_slots_ind[0] * slot_input_size: validat_slots_ind[0] * slot_input_size + input_validat_size]
-    validat_input_set = F.pad(validat_input_set, (pad_zeros, pad_zeros))
-    validat_target_set = torch.cat((target, nf), dim=1)[..., validat_slots_ind[0] * slot_target_size: validat_slots_ind[0] * slot_target_size + target_validat_size]
-    validat_input_set = validat_input_set.unfold(2, block_size_validat + 2*pad_zeros, block_size_validat)[0, ...].permute(1, 0, 2)
-    validat_target_set = validat_target_set.unfold(2, block_size_validat_target, block_size_validat_target)[0, ...].permute(1, 0, 2)
-    validat_set = tuple((validat_input_set, validat_target_set))
-    validat_set = ResampleDataset(validat_set, batch_size=batch_size)
-    validat_set = torch.utils.data.DataLoader(validat_set, batch_size=None)
-
-    test_input_set = input[..., test_slots_ind[0] * slot_input_size: test_slots_ind[0] * slot_input_size + input_test_size]
-    test_input_set = F.pad(test_input_set, (pad_zeros, pad_zeros))
-    test_target_set = torch.cat((target, nf), dim=1)[..., test_slots_ind[0] * slot_target_size: test_slots_ind[0] * slot_target_size + target_test_size]
-    test_input_set = test_input_set.unfold(2, block_size_test + 2*pad_zeros, block_size_test)[0, ...].permute(1, 0, 2)
-    test_target_set = test_target_set.unfold(2, block_size_test_target, block_size_test_target)[0, ...].permute(1, 0, 2)
-    test_set = tuple((test_input_set, test_target_set))
-    test_set = ResampleDataset(test_set, batch_size=batch_size)
-    test_set = torch.utils.data.DataLoader(test_set, batch_size=None)
+    train_set = _split_loader(input, target, train_slots_ind[0] * slot_input_size, input_train_size,
+                              train_slots_ind[0] * slot_target_size, target_train_size,
+                              int(block_size), int(block_size_target), pad_zeros, batch_size, loaders,
+                              target_channels=target.shape[1])
+    validat_set = _split_loader(input, target, validat_slots_ind[0] * slot_input_size, input_validat_size,
+                                validat_slots_ind[0] * slot_target_size, target_validat_size,
+                                block_size_validat, block_size_validat_target, pad_zeros, batch_size, loaders,
+                                target_channels=target.shape[1])
+    test_set = _split_loader(input, target, test_slots_ind[0] * slot_input_size, input_test_size,
+                             test_slots_ind[0] * slot_target_size, target_test_size,
+                             block_size_test, block_size_test_target, pad_zeros, batch_size, loaders,
+                             target_channels=target.shape[1])
     
     dataset.append(tuple((train_set, validat_set, test_set)))
     return dataset[0]
\ No newline at end of file
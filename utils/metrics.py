@@ -10,4 +10,64 @@ def NMSE(x, y, desired):
 # Numpy implementation
 def nmse(x, e):
     y = 10.0*np.log10(np.real((np.sum(e*np.conj(e))/np.sum(x*np.conj(x)))))
-    return y
\ No newline at end of file
+    return y
+
+
+class NMSECriterion:
+    """
+    Quality criterion NMSE = 10 * log10(sum(|d - y|^2) / sum(|d|^2)) over all batches of the dataset, where y is
+    the model output and d is the target signal. pad_zeros samples at the beginning and at the end of each batch
+    are excluded from both sums.
+    Loss function, target power and NMSE are computed by evaluate method from a single model forward pass per batch,
+    thus loss function of the training must be the loss method of the same object.
+
+    If case_num is specified, then NMSE is additionally computed for each of case_num equal consecutive parts
+    of the dataset signal. This corresponds to the dynamic dataset (see utils.dynamic_dataset_prepare), where signals
+    for different PA output powers are concatenated together.
+    """
+    def __init__(self, batch_to_tensors, pad_zeros=0, case_num=None):
+        self.batch_to_tensors = batch_to_tensors
+        self.pad_zeros = pad_zeros
+        self.case_num = case_num
+
+    def _crop(self, x):
+        return x[..., self.pad_zeros if self.pad_zeros > 0 else None: -self.pad_zeros if self.pad_zeros > 0 else None]
+
+    def loss(self, model, signal_batch):
+        x, d = self.batch_to_tensors(signal_batch)
+        return self._crop(d - model(x)).abs().square().sum()
+
+    @torch.no_grad()
+    def evaluate(self, model, dataset):
+        """
+        Returns dictionary with loss function value accumulated over all batches ('loss'), target signal power ('target_power'),
+        NMSE in dB ('nmse') and, if case_num is specified, list of NMSE values for each case ('nmse_cases').
+        """
+        loss_val, loss_sum, targ_pow = 0, 0, 0
+        err_samples, targ_samples = [], []
+        for batch in dataset:
+            x, d = self.batch_to_tensors(batch)
+            err_pow = self._crop(d - model(x)).abs().square()
+            d_pow = self._crop(d).abs().square()
+            batch_loss = err_pow.sum()
+            loss_val += batch_loss.item()
+            loss_sum += batch_loss
+            targ_pow += d_pow.sum()
+            if self.case_num is not None:
+                err_samples.append(err_pow.sum(dim=-2).reshape(-1))
+                targ_samples.append(d_pow.sum(dim=-2).reshape(-1))
+        metrics = {'loss': loss_val,
+                   'target_power': targ_pow.item(),
+                   'nmse': 10.0 * torch.log10(loss_sum / targ_pow).item()}
+        if self.case_num is not None:
+            err_samples = torch.cat(err_samples)
+            targ_samples = torch.cat(targ_samples)
+            assert err_samples.numel() % self.case_num == 0, \
+                f"Number of dataset samples {err_samples.numel()} must be divisible by the number of cases {self.case_num}."
+            err_cases = err_samples.view(self.case_num, -1).sum(dim=-1)
+            targ_cases = targ_samples.view(self.case_num, -1).sum(dim=-1)
+            metrics['nmse_cases'] = (10.0 * torch.log10(err_cases / targ_cases)).tolist()
+        return metrics
+
+    def __call__(self, model, dataset):
+        return self.evaluate(model, dataset)['nmse']
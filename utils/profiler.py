@@ -0,0 +1,215 @@
+import os
+import time
+import json
+import contextlib
+from collections import defaultdict
+from typing import Union
+import torch
+from torch import nn
+
+try:
+    import resource
+except ImportError:
+    # resource module is not available on Windows
+    resource = None
+
+OptionalStr = Union[str, None]
+OptionalModule = Union[nn.Module, None]
+OptionalInt = Union[int, None]
+
+def _reset_peak_rss() -> bool:
+    # Writing 5 to clear_refs resets peak resident set size (VmHWM) of the process on Linux
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss() -> OptionalInt:
+    # VmHWM is given in kilobytes
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class Profiler:
+    """
+    The class collects per-epoch instrumentation of the training algorithms:
+        - time of named phases (e.g. 'jacobian', 'gram', 'solve', 'line_search', 'evaluation') and number of their calls,
+            measured by monotonic high-resolution clock time.perf_counter. Phases could be nested, then time of the inner phase
+            is also included into the outer one;
+        - named counters, e.g. number of model forward passes, which are counted by forward hook of the watched model;
+        - peak memory: maximal allocated CUDA memory during the epoch for CUDA devices,
+            or peak resident set size during the epoch for CPU. Peak resident set size is reset at the epoch start on Linux,
+            on other systems the peak of the whole process lifetime is reported (not available on Windows).
+    Each epoch record is appended to the log file as a single JSON line, thus the log could be read during the training.
+
+    If the profiler is disabled, all methods are no-op, so training algorithms use it unconditionally.
+    """
+    def __init__(self, model: OptionalModule = None, log_path: OptionalStr = None, enabled: bool = True,
+                 device: OptionalStr = None, synchronize: bool = True, append: bool = False):
+        """
+        Constructor of the Profiler class.
+
+        Args:
+            model (nn.Module, optional): The model, which forward passes are counted. Defaults to "None".
+            log_path (str, optional): Path of the JSON lines log file, which is rewritten for each run. If "None", then records
+                are only kept in memory. Defaults to "None".
+            enabled (bool): Whether to collect instrumentation. Defaults to "True".
+            device (str, optional): Device of the computations. Defaults to the model parameters device or 'cpu'.
+            synchronize (bool): Whether to synchronize CUDA device at phase bounds, so that asynchronous kernels are accounted
+                in the phase they are launched by. Defaults to "True".
+            append (bool): Whether to continue the existing log instead of rewriting it, e.g. for the resumed training.
+                Then epoch records of the log are loaded, so that summary covers the whole run, see also rewind.
+                Defaults to "False".
+        """
+        self.enabled = enabled
+        self.log_path = log_path
+        self.records = []
+        self._hook = None
+        if not enabled:
+            return
+        if log_path is not None and append and os.path.exists(log_path):
+            with open(log_path) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            self.records = [record for record in records if record.get('event') == 'epoch']
+        elif log_path is not None:
+            open(log_path, 'w').close()
+        if device is None:
+            params = list(model.parameters()) if model is not None else []
+            device = params[0].device if len(params) > 0 else 'cpu'
+        self.device = torch.device(device)
+        self.synchronize = synchronize and self.device.type == 'cuda'
+        if model is not None:
+            self._hook = model.register_forward_hook(self._count_forward)
+        self._reset()
+
+    def _reset(self):
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        if self.device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(self.device)
+        else:
+            self._peak_reset = _reset_peak_rss()
+        self.epoch_start = time.perf_counter()
+
+    def _sync(self):
+        if self.synchronize:
+            torch.cuda.synchronize(self.device)
+
+    def _count_forward(self, module, input, output):
+        self.counters['forward'] += 1
+
+    def _peak_memory(self):
+        if self.device.type == 'cuda':
+            return torch.cuda.max_memory_allocated(self.device)
+        if self._peak_reset:
+            peak = _peak_rss()
+            if peak is not None:
+                return peak
+        if resource is None:
+            return None
+        # ru_maxrss is given in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def phase(self, name: str):
+        """
+        Returns context manager, which measures time of the code block as a phase with given name.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._phase(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name: str):
+        self._sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            self.times[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def count(self, name: str, value: int = 1):
+        """
+        Increases counter with given name by value.
+        """
+        if self.enabled:
+            self.counters[name] += value
+
+    def epoch_end(self, epoch: int, **values):
+        """
+        Finishes the epoch record, writes it to the log and resets per-epoch statistics.
+
+        Args:
+            epoch (int): Epoch number.
+            **values: Additional JSON-serializable values to store in the record, e.g. loss function value.
+        """
+        if not self.enabled:
+            return
+        self._sync()
+        record = {'event': 'epoch',
+                  'epoch': epoch,
+                  'time': time.perf_counter() - self.epoch_start,
+                  'phases': {name: {'time': self.times[name], 'calls': self.calls[name]} for name in self.times},
+                  'counters': dict(self.counters),
+                  'peak_memory': self._peak_memory()}
+        record.update(values)
+        self._write(record)
+        self._reset()
+
+    def summary(self) -> dict:
+        """
+        Returns totals of all epoch records: time, phases times and calls, counters and maximal peak memory.
+        Summary is also written to the log.
+        """
+        if not self.enabled:
+            return {}
+        summary = {'event': 'summary', 'epochs': len(self.records), 'time': 0., 'phases': {}, 'counters': defaultdict(int),
+                   'peak_memory': 0}
+        for record in self.records:
+            summary['time'] += record['time']
+            summary['peak_memory'] = max(summary['peak_memory'], record['peak_memory'] or 0)
+            for name, phase in record['phases'].items():
+                total = summary['phases'].setdefault(name, {'time': 0., 'calls': 0})
+                total['time'] += phase['time']
+                total['calls'] += phase['calls']
+            for name, value in record['counters'].items():
+                summary['counters'][name] += value
+        summary['counters'] = dict(summary['counters'])
+        self._write(summary, keep=False)
+        return summary
+
+    def rewind(self, epoch: int):
+        """
+        Removes records of the epochs after the given one from memory and the log, e.g. epochs of the interrupted run,
+        which followed the last checkpoint and are repeated by the resumed training.
+        """
+        if not self.enabled:
+            return
+        self.records = [record for record in self.records if record['epoch'] <= epoch]
+        if self.log_path is not None:
+            with open(self.log_path, 'w') as f:
+                f.writelines(json.dumps(record) + '\n' for record in self.records)
+
+    def _write(self, record: dict, keep: bool = True):
+        if keep:
+            self.records.append(record)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        """
+        Removes forward hook from the model.
+        """
+        if self._hook is not None:
+            self._hook.remove()
+            self._hook = None
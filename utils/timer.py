@@ -3,9 +3,9 @@ import time
 
 class Timer:    
     def __enter__(self):
-        self.start = time.time()
+        self.start = time.perf_counter()
         return self
 
     def __exit__(self, *args):
-        self.end = time.time()
+        self.end = time.perf_counter()
         self.interval = self.end - self.start
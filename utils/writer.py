@@ -0,0 +1,189 @@
+import os
+import copy
+import queue
+import threading
+from typing import Dict, Sequence
+import numpy as np
+import torch
+
+# Length of the appendable .npy file header, which is rewritten in place. Shape field is padded by spaces up to it
+HEADER_SIZE = 128
+
+
+def _npy_header(dtype: np.dtype, shape: tuple) -> bytes:
+    header = "{" + f"'descr': {np.lib.format.dtype_to_descr(dtype)!r}, 'fortran_order': False, 'shape': {shape!r}, " + "}"
+    # Magic string (6 bytes), version (2 bytes) and header length (2 bytes) precede the header, which ends by newline
+    header = header.ljust(HEADER_SIZE - 10 - 1) + "\n"
+    assert len(header) == HEADER_SIZE - 10, f"Shape {shape} doesn`t fit into the appendable .npy header."
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+def _map_tensors(obj, fn):
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    if isinstance(obj, dict):
+        return type(obj)((key, _map_tensors(value, fn)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, '_fields'):
+        return type(obj)(_map_tensors(value, fn) for value in obj)
+    return copy.deepcopy(obj)
+
+
+def append_npy(path: str, rows: np.ndarray, create: bool = False):
+    """
+    Appends rows to the .npy file along the first axis: data are written to the end of the file and only the fixed-size
+    header with the new shape is rewritten, thus the file is not rewritten as a whole. The file stays readable by np.load.
+
+    Args:
+        path (str): Path of the .npy file.
+        rows (np.ndarray): Array of rows to append, shape [number of rows, ...].
+        create (bool): Whether to create new file (existing one is truncated). Defaults to "False", then the file
+            is created if it doesn`t exist, otherwise it must be written by append_npy with the same rows dtype and shape.
+    """
+    rows = np.ascontiguousarray(rows)
+    if create or not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(_npy_header(rows.dtype, (0,) + rows.shape[1:]))
+    with open(path, 'r+b') as f:
+        f.seek(0)
+        np.lib.format.read_magic(f)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        assert f.tell() == HEADER_SIZE, f"File {path} is not appendable .npy file."
+        assert dtype == rows.dtype and shape[1:] == rows.shape[1:], \
+            f"Rows of dtype {rows.dtype} and shape {rows.shape[1:]} can`t be appended to the file {path}."
+        f.seek(0, os.SEEK_END)
+        f.write(rows.tobytes())
+        f.flush()
+        # Header is updated after data are written, thus the file is consistent if writing is interrupted
+        f.seek(0)
+        f.write(_npy_header(rows.dtype, (shape[0] + rows.shape[0],) + rows.shape[1:]))
+
+
+class AsyncWriter:
+    """
+    The class writes training products (learning curves, model weights and other arrays) in the background thread,
+    so that file I/O doesn`t stall the training loop. Write tasks are put into the bounded queue: if the writer falls behind
+    by max_queue tasks, the training thread waits (back pressure) instead of accumulating unbounded memory.
+
+    Learning curves are appended incrementally: append_curves writes only the points added since the previous call
+    to the appendable .npy files (see append_npy), instead of rewriting the whole history. Model weights are snapshotted
+    by the training thread (tensors are cloned on their device, which is cheap and asynchronous for CUDA),
+    then copied to CPU and saved by the writer thread. Weights are saved to the temporary file and then renamed,
+    so that the file always contains complete weights.
+
+    Exceptions of the writer thread are re-raised in the training thread by the next call or by flush and close.
+    If asynchronous is "False", then all tasks are performed immediately in the calling thread.
+    The class is used as context manager, which waits for all tasks on exit, or close method should be called.
+    """
+    def __init__(self, max_queue: int = 16, asynchronous: bool = True):
+        """
+        Constructor of the AsyncWriter class. Starts the writer thread.
+
+        Args:
+            max_queue (int): Maximal number of pending write tasks. Defaults to 16.
+            asynchronous (bool): Whether to write in the background thread. Defaults to "True".
+        """
+        self.asynchronous = asynchronous
+        self.written = {}
+        self._error = None
+        self._thread = None
+        if asynchronous:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._thread = threading.Thread(target=self._run, name='AsyncWriter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                if self._error is None:
+                    task[0](*task[1:])
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background writing failed.") from error
+
+    def _submit(self, fn, *args):
+        self._raise()
+        if self.asynchronous:
+            self._queue.put((fn,) + args)
+        else:
+            fn(*args)
+
+    @staticmethod
+    def _save_object(obj, path: str):
+        # Snapshot tensors stay on their devices until they are copied to CPU here, in the writer thread
+        torch.save(_map_tensors(obj, lambda t: t.cpu()), path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def save_object(self, obj, path: str):
+        """
+        Snapshots the object (nested dictionaries, lists and tuples of tensors and other picklable values, e.g. training
+        state) and saves it by torch.save in the background. Tensors are cloned, other values are deep copied.
+        """
+        self._submit(self._save_object, _map_tensors(obj, lambda t: t.detach().clone()), path)
+
+    def save_state_dict(self, state_dict: dict, path: str):
+        """
+        Snapshots the state dictionary (e.g. model.state_dict()) and saves it by torch.save in the background.
+        """
+        self.save_object(dict(state_dict), path)
+
+    def save_array(self, path: str, array):
+        """
+        Saves copy of the array by np.save in the background. The file is rewritten.
+        """
+        self._submit(np.save, path, np.array(array))
+
+    def append_curves(self, curves: Dict[str, Sequence]):
+        """
+        Appends new points of the learning curves to the appendable .npy files. For each path only the points added since
+        the previous call for this path are written. The first call for the path in the writer lifetime creates the file,
+        unless written attribute is set for it (e.g. to continue the curves of the resumed training).
+
+        Args:
+            curves (dictionary): Dictionary of the file paths and the lists of curve points (numbers or arrays).
+        """
+        for path, curve in curves.items():
+            start = self.written.get(path, None)
+            if start is None or start > len(curve):
+                start, create = 0, True
+            else:
+                create = False
+            if start == len(curve) and not create:
+                continue
+            rows = np.array(curve[start:])
+            if len(curve) == 0:
+                rows = rows.astype(np.float64)
+            self.written[path] = len(curve)
+            self._submit(append_npy, path, rows, create)
+
+    def flush(self):
+        """
+        Waits until all pending tasks are written.
+        """
+        if self.asynchronous:
+            self._queue.join()
+        self._raise()
+
+    def close(self):
+        """
+        Writes pending tasks and stops the writer thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()